@@ -0,0 +1,51 @@
+from datetime import datetime
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from app.core.config import config
+from app.models.History import HistoryRequest
+
+router = APIRouter()
+
+
+def stream_history(guids: list, start: datetime, end: datetime, interval: str, aggregates: list, source: str,
+                   output: str, limit: int, after: str) -> StreamingResponse:
+    # Rows are read from MySQL page by page while the response is sent; StreamingResponse iterates the generator
+    # in the threadpool, so the blocking reads stay off the event loop.
+    from app.db.dependency import db_session
+    from app.services import history
+    if not guids or len(guids) > config.HISTORY_MAX_GUIDS:
+        raise HTTPException(status_code=400, detail=f"Between 1 and {config.HISTORY_MAX_GUIDS} GUIDs per query.")
+    if output not in ("ndjson", "arrow"):
+        raise HTTPException(status_code=400, detail=f"Unknown format: {output}")
+    if output == "arrow" and history.pyarrow is None:
+        raise HTTPException(status_code=406, detail="Arrow output needs pyarrow installed.")
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be at least 1.")
+    try:
+        query = history.HistoryQuery(db_session, guids, start, end,
+                                     interval=history.parse_interval(interval) if interval else None,
+                                     aggregates=aggregates or history.AGGREGATES, source=source, limit=limit,
+                                     after=after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if output == "arrow":
+        return StreamingResponse(history.arrow_stream(query), media_type=history.ARROW_MEDIA_TYPE)
+    return StreamingResponse(history.ndjson_stream(query), media_type=history.NDJSON_MEDIA_TYPE)
+
+
+@router.get("/history/{guid}")
+async def get_history(guid: str, start: datetime, end: datetime = None, interval: str = None,
+                      aggregates: str = None, source: str = "events", format: str = "ndjson",
+                      limit: int = Query(None, ge=1), after: str = None):
+    """Events of one GUID in [start, end), raw or bucketed by interval, streamed as NDJSON or Arrow IPC."""
+    return stream_history([guid], start, end, interval, aggregates.split(",") if aggregates else None, source,
+                          format, limit, after)
+
+
+@router.post("/history")
+async def query_history(request: HistoryRequest):
+    """Same as GET /history/{guid} for a batch of GUIDs, returned one GUID after the other."""
+    return stream_history(request.guids, request.start, request.end, request.interval, request.aggregates,
+                          request.source, request.format, request.limit, request.after)
@@ -0,0 +1,98 @@
+import asyncio
+import json
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+
+from app.core.config import config
+
+router = APIRouter()
+
+HEARTBEAT = b'{"type":"heartbeat"}'
+
+
+def fanout_hub():
+    from app.main import fanout
+    if fanout is None:
+        raise HTTPException(status_code=503, detail="Live events are not served: fan-out is disabled, or the stream "
+                                                    "runs in the shard processes in sharded mode.")
+    return fanout
+
+
+def connect(guids: str, policy: str):
+    from app.services.fanout import ClientLimitReached
+    hub = fanout_hub()
+    try:
+        return hub, hub.connect(guids.split(",") if guids else None, policy)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ClientLimitReached as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@router.get("/live/events")
+async def live_events(guids: str = None, policy: str = None, snapshot: bool = True):
+    """Server-sent events: a snapshot of the latest values, then every update of guids (comma separated, all if
+    omitted) as the stream receives it."""
+    hub, client = connect(guids, policy)
+
+    async def events():
+        try:
+            if snapshot:
+                yield b"event: snapshot\ndata: " + hub.snapshot(client.guids) + b"\n\n"
+            while not client.closed:
+                messages = await client.next_messages(config.FANOUT_HEARTBEAT_INTERVAL)
+                if messages:
+                    yield b"".join(b"event: update\ndata: " + message + b"\n\n" for message in messages)
+                elif not client.closed:
+                    yield b": heartbeat\n\n"
+            if client.reason:
+                yield b"event: close\ndata: " + json.dumps({"reason": client.reason}).encode() + b"\n\n"
+        finally:
+            hub.disconnect(client)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.websocket("/live/ws")
+async def live_socket(websocket: WebSocket, guids: str = None, policy: str = None, snapshot: bool = True):
+    """The same as /live/events over a WebSocket. A filtered client may send {"subscribe": [...]} or
+    {"unsubscribe": [...]} to change its GUIDs; added ones are answered with their snapshot."""
+    try:
+        hub, client = connect(guids, policy)
+    except HTTPException as e:
+        await websocket.close(code=1013 if e.status_code == 503 else 1008, reason=e.detail)
+        return
+    await websocket.accept()
+    receiver = asyncio.create_task(receive_filters(websocket, hub, client))
+    try:
+        if snapshot:
+            await websocket.send_text(hub.snapshot(client.guids).decode())
+        while not client.closed:
+            messages = await client.next_messages(config.FANOUT_HEARTBEAT_INTERVAL)
+            for message in messages or ([] if client.closed else [HEARTBEAT]):
+                await websocket.send_text(message.decode())
+        if client.reason:
+            await websocket.close(code=1013, reason=client.reason)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        hub.disconnect(client)
+
+
+async def receive_filters(websocket: WebSocket, hub, client):
+    try:
+        async for text in websocket.iter_text():
+            try:
+                request = json.loads(text)
+                added = hub.update(client, request.get("subscribe") or (), request.get("unsubscribe") or ())
+            except (ValueError, AttributeError, TypeError):
+                continue
+            if added:
+                hub.enqueue(client, hub.snapshot(added))
+    except WebSocketDisconnect:
+        pass
+    # The client went away; end the sender, which is waiting for messages.
+    client.close()
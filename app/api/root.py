@@ -1,4 +1,5 @@
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
 
 router = APIRouter()
 
@@ -10,4 +11,7 @@ async def root():
 
 @router.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    """Readiness of every dependency; 503 until startup is done and while a required one is unavailable."""
+    from app.main import container
+    health = await container.health()
+    return JSONResponse(health, status_code=200 if health["status"] in ("healthy", "degraded") else 503)
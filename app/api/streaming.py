@@ -1,20 +1,50 @@
 from fastapi import APIRouter, HTTPException
-from app.services.streaming_manager import StreamingManager
+from fastapi.responses import PlainTextResponse
+
+from app.util.metrics import registry, render
 
 router = APIRouter()
 
 
-# Here, we assume that a shared instance of StreamingManager is created in main.py.
+# The shared StreamRunner is created in main.py.
 @router.get("/start")
 async def start_streaming():
+    from app.main import stream_runner
     try:
-        # The streaming service is started on app startup.
-        return {"message": "Streaming service is running in the background."}
+        if await stream_runner.start_async():
+            return {"message": "Streaming service started in the background."}
+        return {"message": "Streaming service is already running.", "status": stream_runner.status()}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error starting streaming: {e}")
 
 
 @router.get("/stop")
 async def stop_streaming():
-    # Implement stop logic if needed.
-    return {"message": "Stop streaming endpoint not implemented."}
+    from app.main import stream_runner
+    if await stream_runner.stop_async():
+        return {"message": "Streaming service stopped."}
+    return {"message": "Streaming service is not running."}
+
+
+@router.get("/stats")
+async def streaming_stats():
+    from app.main import stack, coordinator
+    if coordinator is not None:
+        return coordinator.stats()
+    if stack is None:
+        raise HTTPException(status_code=503, detail="The stream is not built yet; the service is still starting.")
+    return stack.stats()
+
+
+@router.get("/shards")
+async def shard_status():
+    from app.main import coordinator
+    if coordinator is None:
+        raise HTTPException(status_code=404, detail="Sharding is disabled (SHARD_COUNT <= 1).")
+    return {"coordinator": coordinator.status(), "shards": coordinator.shard_status()}
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of the metrics registry."""
+    return PlainTextResponse(render(registry.collect()), media_type="text/plain; version=0.0.4")
@@ -1,22 +1,42 @@
-from fastapi import APIRouter, HTTPException
-from app.services.streaming_manager import StreamingManager
+from fastapi import APIRouter, HTTPException, Query
+
+from app.models.Subscriptions import BulkSubscribeRequest
 
 router = APIRouter()
 
 
+# Declared before /subscribe/{guid} so "bulk" is not taken for a GUID.
+@router.post("/subscribe/bulk", status_code=202)
+def subscribe_bulk(request: BulkSubscribeRequest):
+    # Declared sync: the shard coordinator, and the manager without a registry, store the GUIDs in MySQL right away.
+    from app.main import streaming_manager
+    if not streaming_manager.start_bulk_subscription(request.guids):
+        raise HTTPException(status_code=409, detail="A bulk subscription is already running.")
+    return {"message": f"Subscribing to {len(request.guids)} GUIDs in the background."}
+
+
+@router.get("/subscribe/bulk")
+async def bulk_subscription_status():
+    from app.main import streaming_manager
+    subscriber = streaming_manager.bulk_subscriber
+    if subscriber is None or subscriber.report is None:
+        raise HTTPException(status_code=404, detail="No bulk subscription has run yet.")
+    return subscriber.report.snapshot()
+
+
 # Assume that the shared StreamingManager instance is injected in main.py.
 @router.post("/subscribe/{guid}")
-async def subscribe(guid: str):
-    # The shared instance should be used; here, for demonstration, we import the class.
-    # In production, you might use dependency injection.
+def subscribe(guid: str):
+    # Declared sync: without a registry subscribing blocks on Metasys and MySQL, so FastAPI runs it in its threadpool.
     from app.main import streaming_manager  # Import the shared instance
     if streaming_manager.subscribe(guid):
         return {"message": f"Subscribed to GUID: {guid}"}
-    raise HTTPException(status_code=400, detail=f"Already subscribed to GUID: {guid}")
+    raise HTTPException(status_code=400, detail=f"Already subscribed to GUID, or Metasys refused it: {guid}")
 
 
 @router.post("/unsubscribe/{guid}")
-async def unsubscribe(guid: str):
+def unsubscribe(guid: str):
+    # Declared sync: the shard coordinator, and the manager without a registry, update MySQL right away.
     from app.main import streaming_manager
     if streaming_manager.unsubscribe(guid):
         return {"message": f"Unsubscribed from GUID: {guid}"}
@@ -24,6 +44,15 @@ async def unsubscribe(guid: str):
 
 
 @router.get("/")
-async def list_subscriptions():
+def list_subscriptions():
+    # Declared sync: without a registry the list is read from MySQL.
     from app.main import streaming_manager
     return {"subscriptions": list(streaming_manager.active_subscriptions.keys())}
+
+
+@router.get("/subscriptions")
+def find_subscriptions(prefix: str = "", reference: str = "", limit: int = Query(100, ge=1, le=10000)):
+    """Subscriptions whose GUID starts with prefix and whose itemReference starts with reference."""
+    # Declared sync: without a registry the GUIDs are read from MySQL.
+    from app.main import streaming_manager
+    return {"subscriptions": streaming_manager.find_subscriptions(prefix, reference, limit)}
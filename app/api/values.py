@@ -0,0 +1,33 @@
+from fastapi import APIRouter, HTTPException
+
+from app.models.LatestValues import LatestValuesRequest
+
+router = APIRouter()
+
+
+def latest_value_store():
+    # Served from the in-process LatestValueStore created in main.py; MySQL is never queried.
+    from app.main import latest_values
+    if latest_values is None:
+        raise HTTPException(status_code=503, detail="Latest values are kept by the shard processes; "
+                                                    "read them from Redis in sharded mode.")
+    return latest_values
+
+
+@router.get("/values")
+async def latest_values_stats():
+    return latest_value_store().stats()
+
+
+@router.post("/values")
+async def get_latest_values(request: LatestValuesRequest):
+    found = latest_value_store().get_many(request.guids)
+    return {"values": found, "missing": [guid for guid in request.guids if guid not in found]}
+
+
+@router.get("/values/{guid}")
+async def get_latest_value(guid: str):
+    value = latest_value_store().get(guid)
+    if value is None:
+        raise HTTPException(status_code=404, detail=f"No value received for GUID: {guid}")
+    return value
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import time
+
+from app.core.config import config
+
+logger = logging.getLogger(__name__)
+
+
+class Dependency:
+    """One backend the app needs, with how to bring it up and how to tell whether it still is."""
+
+    def __init__(self, name: str, init, check=None, timeout: float = config.STARTUP_TIMEOUT, required: bool = True,
+                 after=()):
+        """
+        :param init: Callable or coroutine function that connects, run once at startup. Blocking callables run in
+                     a worker thread.
+        :param check: Callable or coroutine function returning True while the dependency is usable, run by /health.
+        :param timeout: Seconds init may take before the dependency is reported as timed out.
+        :param required: Whether the app counts as ready without it.
+        :param after: Names of dependencies whose init has to finish, successfully or not, before this one starts.
+        """
+        self.name = name
+        self.init = init
+        self.check = check
+        self.timeout = timeout
+        self.required = required
+        self.after = tuple(after)
+        self.state = "pending"
+        self.error = None
+        self.seconds = None
+        self.checked_at = None
+
+    def status(self) -> dict:
+        return {"state": self.state, "required": self.required, "error": self.error, "startup_seconds": self.seconds,
+                "checked_at": self.checked_at}
+
+
+class Container:
+    """Brings up the app's dependencies during the lifespan startup and reports their readiness.
+
+    Every dependency's init starts as soon as the ones it comes after are done, so independent connections are made
+    concurrently instead of one after another, and each gets its own timeout. A dependency that failed or timed out
+    does not stop the others; /health probes it again and reports it ready once its check passes.
+    """
+
+    def __init__(self, check_timeout: float = config.HEALTH_CHECK_TIMEOUT):
+        """
+        :param check_timeout: Seconds a health check may take before the dependency is reported unavailable.
+        """
+        self.check_timeout = check_timeout
+        self.dependencies = {}
+        self.started_at = None
+
+    def register(self, name: str, init, check=None, timeout: float = config.STARTUP_TIMEOUT, required: bool = True,
+                 after=()) -> Dependency:
+        dependency = Dependency(name, init, check, timeout, required, after)
+        self.dependencies[name] = dependency
+        return dependency
+
+    async def start(self):
+        """Run every init, concurrently where the after constraints allow, and return once all are done."""
+        began = time.monotonic()
+        done = {name: asyncio.Event() for name in self.dependencies}
+        await asyncio.gather(*(self._start(dependency, done) for dependency in self.dependencies.values()))
+        self.started_at = time.time()
+        logger.info(f"Started {len(self.dependencies)} dependencies in {time.monotonic() - began:.2f}s: "
+                    + ", ".join(f"{d.name} {d.state}" for d in self.dependencies.values()))
+
+    async def health(self) -> dict:
+        """Probe every started dependency and summarise: healthy, degraded (an optional one is down), unhealthy."""
+        await asyncio.gather(*(self._probe(dependency) for dependency in self.dependencies.values()
+                               if dependency.check is not None and dependency.state not in ("pending", "starting")))
+        required = [d for d in self.dependencies.values() if d.required]
+        if self.started_at is None:
+            status = "starting"
+        elif any(d.state != "ready" for d in required):
+            status = "unhealthy"
+        elif any(d.state != "ready" for d in self.dependencies.values()):
+            status = "degraded"
+        else:
+            status = "healthy"
+        return {"status": status, "started_at": self.started_at,
+                "dependencies": {name: d.status() for name, d in self.dependencies.items()}}
+
+    def is_ready(self) -> bool:
+        return self.started_at is not None and all(d.state == "ready" for d in self.dependencies.values()
+                                                   if d.required)
+
+    async def _start(self, dependency: Dependency, done: dict):
+        for name in dependency.after:
+            if name in done:
+                await done[name].wait()
+        began = time.monotonic()
+        dependency.state = "starting"
+        try:
+            await asyncio.wait_for(self._call(dependency.init), dependency.timeout)
+            dependency.state = "ready"
+            dependency.error = None
+        except asyncio.TimeoutError:
+            # A blocking init keeps running in its thread; the next passing health check marks it ready.
+            dependency.state = "timeout"
+            dependency.error = f"not ready after {dependency.timeout}s"
+            logger.error(f"{dependency.name} {dependency.error}")
+        except Exception as e:
+            dependency.state = "failed"
+            dependency.error = str(e)
+            logger.error(f"{dependency.name} failed to start: {e}")
+        finally:
+            dependency.seconds = round(time.monotonic() - began, 3)
+            done[dependency.name].set()
+
+    async def _probe(self, dependency: Dependency):
+        try:
+            ok = await asyncio.wait_for(self._call(dependency.check), self.check_timeout)
+            dependency.state = "ready" if ok else "unavailable"
+            dependency.error = None if ok else "check failed"
+        except asyncio.TimeoutError:
+            dependency.state = "unavailable"
+            dependency.error = f"check took longer than {self.check_timeout}s"
+        except Exception as e:
+            dependency.state = "unavailable"
+            dependency.error = str(e)
+        dependency.checked_at = time.time()
+
+    @staticmethod
+    async def _call(fn):
+        if asyncio.iscoroutinefunction(fn):
+            return await fn()
+        return await asyncio.to_thread(fn)
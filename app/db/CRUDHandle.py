@@ -1,6 +1,16 @@
+import threading
+import weakref
+
+from sqlalchemy import and_, bindparam, delete, func, insert, or_, text, update
+from sqlalchemy.dialects import mysql, sqlite
 from sqlalchemy.orm import Session
 
-from app.db.models import Event, Subscriptions
+from app.db.models import Event, EventCode, EventId, Subscriptions
+from app.db.partitions import MAXVALUE_PARTITION, partition_clause
+
+# ({name: code}, {code: name}) of event_codes per engine. Rows there are only ever added, so entries never go stale.
+_event_codes = weakref.WeakKeyDictionary()
+_event_codes_lock = threading.Lock()
 
 
 class EventCrudHandler:
@@ -15,6 +25,214 @@ class EventCrudHandler:
         except Exception as e:
             raise e
 
+    def store_events_bulk(self, rows: list[dict], dedupe_ids: bool = False) -> int:
+        """Insert many event rows in one executemany, skipping rows whose eventId already exists.
+
+        With dedupe_ids, stored eventIds are looked up in event_ids and the new ones inserted there in the same
+        transaction, for a partitioned events table that cannot keep eventId unique on its own. A concurrent writer
+        of the same eventId makes that insert fail, so the batch is rolled back and found stored when retried.
+
+        Rows carry reliability and priority names, which are stored as their event_codes codes.
+
+        Returns the number of rows actually inserted.
+        """
+        if not rows:
+            return 0
+        statement = insert(Event.__table__).prefix_with("IGNORE", dialect="mysql") \
+            .prefix_with("OR IGNORE", dialect="sqlite")
+        try:
+            codes = self.get_event_codes([row[column] for row in rows for column in ("reliability", "priority")])
+            rows = [{**row, "reliability": codes.get(row["reliability"]), "priority": codes.get(row["priority"])}
+                    for row in rows]
+            if dedupe_ids:
+                ids = list(dict.fromkeys(row["eventId"] for row in rows))
+                stored = {event_id for event_id, in
+                          self.db.query(EventId.eventId).filter(EventId.eventId.in_(ids)).all()}
+                new_rows = {}
+                for row in rows:
+                    if row["eventId"] not in stored:
+                        new_rows.setdefault(row["eventId"], row)
+                if not new_rows:
+                    return 0
+                self.db.execute(insert(EventId.__table__), [{"eventId": event_id, "timestamp": row["timestamp"]}
+                                                            for event_id, row in new_rows.items()])
+                rows = list(new_rows.values())
+            result = self.db.execute(statement, rows)
+            self.db.commit()
+        except Exception as e:
+            raise e
+        return result.rowcount if result.rowcount >= 0 else len(rows)
+
+    def get_gap_bounds(self, guids: list, since) -> dict:
+        """Map each GUID to (newest event timestamp before since, oldest event timestamp at or after since).
+
+        Either side is None when there is no such event. GUIDs without any event are left out.
+        """
+        try:
+            before = self.db.query(Event.guid, func.max(Event.timestamp)) \
+                .filter(Event.guid.in_(guids), Event.timestamp < since).group_by(Event.guid).all()
+            after = self.db.query(Event.guid, func.min(Event.timestamp)) \
+                .filter(Event.guid.in_(guids), Event.timestamp >= since).group_by(Event.guid).all()
+        except Exception as e:
+            raise e
+        bounds = {guid: (last, None) for guid, last in before}
+        for guid, first in after:
+            bounds[guid] = (bounds.get(guid, (None, None))[0], first)
+        return bounds
+
+    def get_last_event_time(self, before):
+        """Timestamp of the most recently inserted event older than before, or None."""
+        try:
+            return self.db.query(Event.timestamp).filter(Event.timestamp < before) \
+                .order_by(Event.id.desc()).limit(1).scalar()
+        except Exception as e:
+            raise e
+
+    def get_events_page(self, guid: str, start, end, after_timestamp=None, after_id=None, limit: int = 1000) -> list:
+        """Up to limit (id, timestamp, presentValue, reliability, priority) rows of guid in [start, end), in
+        (timestamp, id) order and after (after_timestamp, after_id) when given, read off ix_events_guid_timestamp.
+        """
+        try:
+            query = self.db.query(Event.id, Event.timestamp, Event.presentValue, Event.reliability, Event.priority) \
+                .filter(Event.guid == guid, Event.timestamp >= start, Event.timestamp < end)
+            if after_timestamp is not None:
+                query = query.filter(or_(Event.timestamp > after_timestamp,
+                                         and_(Event.timestamp == after_timestamp, Event.id > after_id)))
+            rows = query.order_by(Event.timestamp, Event.id).limit(limit).all()
+            names = self.get_event_names([code for row in rows for code in (row[3], row[4])])
+        except Exception as e:
+            raise e
+        return [(row_id, timestamp, value, names.get(reliability), names.get(priority))
+                for row_id, timestamp, value, reliability, priority in rows]
+
+    def get_event_codes(self, names) -> dict:
+        """Map reliability and priority names to their codes, adding the names event_codes does not hold yet."""
+        codes, names_by_code = self._event_code_cache()
+        missing = [name for name in dict.fromkeys(names) if name is not None and name not in codes]
+        if missing:
+            statement = insert(EventCode.__table__).prefix_with("IGNORE", dialect="mysql") \
+                .prefix_with("OR IGNORE", dialect="sqlite")
+            try:
+                self.db.execute(statement, [{"name": name} for name in missing])
+                # Committed on its own, so a code is never kept for a name whose insert a failed batch rolled back.
+                self.db.commit()
+                stored = self.db.query(EventCode.id, EventCode.name).filter(EventCode.name.in_(missing)).all()
+            except Exception as e:
+                raise e
+            with _event_codes_lock:
+                for code, name in stored:
+                    codes[name] = code
+                    names_by_code[code] = name
+        return codes
+
+    def get_event_names(self, codes) -> dict:
+        """Map reliability and priority codes back to their names."""
+        codes_by_name, names = self._event_code_cache()
+        missing = [code for code in dict.fromkeys(codes) if code is not None and code not in names]
+        if missing:
+            try:
+                stored = self.db.query(EventCode.id, EventCode.name).filter(EventCode.id.in_(missing)).all()
+            except Exception as e:
+                raise e
+            with _event_codes_lock:
+                for code, name in stored:
+                    codes_by_name[name] = code
+                    names[code] = name
+        return names
+
+    def _event_code_cache(self) -> tuple:
+        engine = self.db.get_bind()
+        with _event_codes_lock:
+            cache = _event_codes.get(engine)
+            if cache is None:
+                cache = _event_codes[engine] = ({}, {})
+        return cache
+
+    def get_rollups_page(self, model, guid: str, start, end, after_bucket=None, limit: int = 1000) -> list:
+        """Up to limit (bucket, count, min, max, sum, last, last timestamp) rows of guid from a rollup table."""
+        try:
+            query = self.db.query(model.bucket, model.count, model.min_value, model.max_value, model.sum_value,
+                                  model.last_value, model.last_timestamp) \
+                .filter(model.guid == guid, model.bucket >= start, model.bucket < end)
+            if after_bucket is not None:
+                query = query.filter(model.bucket > after_bucket)
+            return query.order_by(model.bucket).limit(limit).all()
+        except Exception as e:
+            raise e
+
+    def upsert_rollups(self, model, rows: list[dict]) -> int:
+        """Merge partial aggregates into a rollup table, combining them with the row of the same guid and bucket.
+
+        The merge adds to the stored counts and sums, so it is not idempotent: it does not commit, and the caller
+        commits the writes of all resolutions together.
+        """
+        if not rows:
+            return 0
+        table = model.__table__
+        if self.db.get_bind().dialect.name == "sqlite":
+            statement = sqlite.insert(table)
+            new, choose, larger, smaller = statement.excluded, func.iif, func.max, func.min
+        else:
+            statement = mysql.insert(table)
+            new, choose, larger, smaller = statement.inserted, func.if_, func.greatest, func.least
+        # MySQL applies these left to right and later ones see the updated columns, so avg and last come first.
+        updates = [
+            ("avg_value", (table.c.sum_value + new.sum_value) / (table.c.count + new.count)),
+            ("last_value", choose(new.last_timestamp >= table.c.last_timestamp, new.last_value, table.c.last_value)),
+            ("last_timestamp", larger(table.c.last_timestamp, new.last_timestamp)),
+            ("min_value", smaller(table.c.min_value, new.min_value)),
+            ("max_value", larger(table.c.max_value, new.max_value)),
+            ("sum_value", table.c.sum_value + new.sum_value),
+            ("count", table.c.count + new.count),
+        ]
+        if isinstance(statement, sqlite.Insert):
+            statement = statement.on_conflict_do_update(index_elements=["guid", "bucket"], set_=dict(updates))
+        else:
+            statement = statement.on_duplicate_key_update(updates)
+        try:
+            self.db.execute(statement, rows)
+        except Exception as e:
+            raise e
+        return len(rows)
+
+    def delete_before(self, model, column: str, cutoff) -> int:
+        """Delete the rows of model whose column is older than cutoff and return how many were removed."""
+        try:
+            result = self.db.execute(delete(model).where(getattr(model, column) < cutoff))
+            self.db.commit()
+        except Exception as e:
+            raise e
+        return result.rowcount
+
+    def get_event_partitions(self) -> dict:
+        """Map each range partition of the events table to its upper bound, or None for MAXVALUE.
+
+        Empty when the table is not partitioned or the database is not MySQL.
+        """
+        if self.db.get_bind().dialect.name != "mysql":
+            return {}
+        rows = self.db.execute(text(
+            "SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'events' AND PARTITION_NAME IS NOT NULL "
+            "ORDER BY PARTITION_ORDINAL_POSITION")).all()
+        return {name: None if bound == "MAXVALUE" else int(bound) for name, bound in rows}
+
+    def add_event_partitions(self, days: list):
+        """Split the MAXVALUE partition into one partition per day in days."""
+        try:
+            self.db.execute(text(f"ALTER TABLE events REORGANIZE PARTITION {MAXVALUE_PARTITION} "
+                                 f"INTO ({partition_clause(days)})"))
+            self.db.commit()
+        except Exception as e:
+            raise e
+
+    def drop_event_partitions(self, names: list):
+        try:
+            self.db.execute(text(f"ALTER TABLE events DROP PARTITION {', '.join(names)}"))
+            self.db.commit()
+        except Exception as e:
+            raise e
+
     def get_subscriptions(self):
         try:
             subscriptions = self.db.query(Subscriptions.guid).filter_by(active=True).all()
@@ -22,6 +240,51 @@ class EventCrudHandler:
         except Exception as e:
             raise e
 
+    def get_subscription_references(self) -> dict:
+        """Map every active GUID to its itemReference, None where it is not known yet."""
+        try:
+            return dict(self.db.query(Subscriptions.guid, Subscriptions.item_reference).filter_by(active=True).all())
+        except Exception as e:
+            raise e
+
+    def add_subscriptions(self, guids: list):
+        """Make guids active, reactivating rows left by an earlier unsubscribe and inserting the rest."""
+        guids = list(dict.fromkeys(guids))
+        if not guids:
+            return
+        try:
+            existing = dict(self.db.query(Subscriptions.guid, Subscriptions.active)
+                            .filter(Subscriptions.guid.in_(guids)).all())
+            inactive = [guid for guid, active in existing.items() if not active]
+            if inactive:
+                self.db.execute(update(Subscriptions).where(Subscriptions.guid.in_(inactive)).values(active=True))
+            self.db.add_all([Subscriptions(guid=guid, active=True) for guid in guids if guid not in existing])
+            self.db.commit()
+        except Exception as e:
+            raise e
+
+    def deactivate_subscriptions(self, guids: list):
+        if not guids:
+            return
+        try:
+            self.db.execute(update(Subscriptions).where(Subscriptions.guid.in_(guids)).values(active=False))
+            self.db.commit()
+        except Exception as e:
+            raise e
+
+    def set_item_references(self, references: dict):
+        """Store the itemReference of each GUID in references in one executemany."""
+        if not references:
+            return
+        statement = update(Subscriptions.__table__).where(Subscriptions.__table__.c.guid == bindparam("b_guid")) \
+            .values(item_reference=bindparam("b_reference"))
+        try:
+            self.db.execute(statement, [{"b_guid": guid, "b_reference": reference}
+                                        for guid, reference in references.items()])
+            self.db.commit()
+        except Exception as e:
+            raise e
+
     def add_subscription(self, subscription: Subscriptions):
         try:
             self.db.add(subscription)
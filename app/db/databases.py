@@ -1,10 +1,13 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 from app.core.config import config
 
 
 class Database:
-    """Singleton Database Connection"""
+    """Singleton Database Connection
+
+    Created on first use rather than on import, so loading the app needs neither the driver nor the server.
+    """
     _instance = None  # Static variable to hold the single instance
 
     def __new__(cls):
@@ -21,6 +24,8 @@ class Database:
 
         return cls._instance
 
-
-# Create a global database instance
-db_instance = Database()
+    def ping(self) -> bool:
+        """Open a connection and run a trivial query, raising if the server cannot be reached."""
+        with self.engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        return True
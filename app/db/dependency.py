@@ -1,6 +1,6 @@
 from contextlib import contextmanager
 
-from app.db.databases import db_instance
+from app.db.databases import Database
 
 
 class DBSession:
@@ -8,7 +8,7 @@ class DBSession:
     @contextmanager
     def session_context(self):
         """Provides a database session context manager."""
-        db = db_instance.SessionLocal()
+        db = Database().SessionLocal()
         try:
             yield db
             db.commit()
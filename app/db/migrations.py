@@ -0,0 +1,19 @@
+import logging
+import os
+
+from alembic import command
+from alembic.config import Config as AlembicConfig
+
+logger = logging.getLogger(__name__)
+
+ALEMBIC_INI = os.path.join(os.path.dirname(__file__), "..", "..", "alembic.ini")
+
+
+def upgrade_to_head():
+    """Apply all pending migrations, same as `alembic upgrade head` from the project root."""
+    alembic_config = AlembicConfig(os.path.abspath(ALEMBIC_INI))
+    alembic_config.set_main_option("script_location", os.path.join(os.path.dirname(ALEMBIC_INI), "migrations"))
+    # Keep the application's logging setup instead of the one in alembic.ini.
+    alembic_config.attributes["configure_logger"] = False
+    command.upgrade(alembic_config, "head")
+    logger.info("Database schema is up to date")
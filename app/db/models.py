@@ -1,5 +1,5 @@
-from sqlalchemy import Column, String, TIMESTAMP, BOOLEAN
-from sqlalchemy.dialects.mysql import INTEGER, FLOAT
+from sqlalchemy import Column, Index, String, TIMESTAMP, BOOLEAN, UniqueConstraint
+from sqlalchemy.dialects.mysql import INTEGER, FLOAT, DOUBLE, SMALLINT
 
 from app.db.base import Base
 
@@ -11,16 +11,69 @@ class Event(Base):
     eventId = Column(String(255), unique=True)
     guid = Column(String(255))
     presentValue = Column(FLOAT)
-    event_metadata = Column(String(255))
+    # Codes from event_codes, which EventCrudHandler translates to and from the names.
+    reliability = Column(SMALLINT(unsigned=True))
+    priority = Column(SMALLINT(unsigned=True))
     stream_id = Column(String(255))
     timestamp = Column(TIMESTAMP)
 
+    __table_args__ = (Index("ix_events_guid_timestamp", "guid", "timestamp"),)
+
     def __repr__(self):
         return f"<Event(event_id={self.event_id})>"
 
 
+class EventCode(Base):
+    """Reliability and priority names, such as reliabilityEnumSet.reliable, stored once and referenced by code."""
+    __tablename__ = "event_codes"
+
+    # SQLite only numbers an INTEGER primary key by itself.
+    id = Column(SMALLINT(unsigned=True).with_variant(INTEGER, "sqlite"), primary_key=True, autoincrement=True)
+    name = Column(String(255), nullable=False, unique=True)
+
+
+class EventId(Base):
+    """eventId of every stored event, kept apart from events when that table is partitioned.
+
+    A partitioned events table can only enforce eventId unique together with the receive timestamp, which a
+    replayed event does not share with its first delivery, so duplicates are caught here instead.
+    """
+    __tablename__ = "event_ids"
+
+    eventId = Column(String(255), primary_key=True)
+    timestamp = Column(TIMESTAMP, index=True)
+
+
 class Subscriptions(Base):
     __tablename__ = "subscriptions"
     id = Column(INTEGER, primary_key=True, index=True, autoincrement=True)
     guid = Column(String(255))
     active = Column(BOOLEAN)
+    item_reference = Column(String(255))
+
+    __table_args__ = (UniqueConstraint("guid", name="uq_subscriptions_guid"),)
+
+
+class RollupMixin:
+    """Per-GUID aggregate of presentValue over one window starting at bucket."""
+    guid = Column(String(255), primary_key=True)
+    bucket = Column(TIMESTAMP, primary_key=True)
+    count = Column(INTEGER)
+    min_value = Column(DOUBLE)
+    max_value = Column(DOUBLE)
+    sum_value = Column(DOUBLE)
+    avg_value = Column(DOUBLE)
+    last_value = Column(DOUBLE)
+    last_timestamp = Column(TIMESTAMP)
+
+
+class EventRollup1m(RollupMixin, Base):
+    __tablename__ = "events_rollup_1m"
+
+
+class EventRollup15m(RollupMixin, Base):
+    __tablename__ = "events_rollup_15m"
+
+
+class EventRollup1h(RollupMixin, Base):
+    __tablename__ = "events_rollup_1h"
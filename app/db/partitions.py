@@ -0,0 +1,15 @@
+from datetime import date, timedelta
+
+# Partition that catches rows past the newest day partition.
+MAXVALUE_PARTITION = "pmax"
+
+
+def partition_name(day: date) -> str:
+    return f"p{day:%Y%m%d}"
+
+
+def partition_clause(days: list) -> str:
+    """Partition definitions with one partition per day in days, each holding rows before the following midnight."""
+    definitions = [f"PARTITION {partition_name(day)} VALUES LESS THAN "
+                   f"(UNIX_TIMESTAMP('{day + timedelta(days=1)} 00:00:00'))" for day in days]
+    return ", ".join(definitions + [f"PARTITION {MAXVALUE_PARTITION} VALUES LESS THAN MAXVALUE"])
@@ -2,38 +2,109 @@ import logging
 
 from fastapi import FastAPI
 
-from app.api import root, streaming, subscriptions
-from app.db.base import Base
-from app.db.databases import db_instance
-from app.db.dependency import db_session
-from app.services.streaming_manager import StreamingManager
-from app.services.token_manager import TokenManager
-from app.util.mqtt_utils import mqtt_utils
-from app.util.redis_utils import redis_util
+from app.api import history, live, root, streaming, subscriptions, values
+from app.core.config import config
+from app.core.lifecycle import Container
+from app.util.metrics import registry
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-Base.metadata.create_all(bind=db_instance.engine)
-
-# Initialize TokenManager and StreamingManager.
-token_manager = TokenManager()
-streaming_manager = StreamingManager(token_manager=token_manager, db_session=db_session, redis_util=redis_util,
-                                     mqtt_utils=mqtt_utils)
+# Importing this module connects to nothing: the stream is built and the backends are reached in startup_event.
+# The routers import the shared objects below when a request comes in, by which time startup has set them.
+container = Container()
+stack = None
+coordinator = None
+streaming_manager = stream_runner = None
+sinks, pipeline, latest_values, deadband, rollup, http_clients = [], None, None, None, None, []
+fanout = None
 app = FastAPI()
 
 # Include API routers.
 app.include_router(root.router)
 app.include_router(streaming.router, tags=["streaming"])
 app.include_router(subscriptions.router, tags=["subscriptions"])
+app.include_router(values.router, tags=["values"])
+app.include_router(history.router, tags=["history"])
+app.include_router(live.router, tags=["live"])
+
+
+def build_services():
+    """Build the stream stack, or the shard coordinator, and publish its parts as this module's globals."""
+    global stack, coordinator, streaming_manager, stream_runner, sinks, pipeline, latest_values, deadband, rollup
+    global http_clients, fanout
+    from app.db.dependency import db_session
+    from app.services.retention import RetentionJob
+    retention = RetentionJob(db_session=db_session)
+    if config.SHARD_COUNT > 1:
+        from app.services.sharding import ShardCoordinator
+        # Each shard process runs its own stream and sinks; this process only coordinates them and serves the API.
+        coordinator = ShardCoordinator(db_session=db_session, components=[retention])
+        registry.register_collector(coordinator.metric_families)
+        stream_runner = streaming_manager = coordinator
+    else:
+        from app.services.stream_factory import build_stream
+        stack = build_stream(components=[retention])
+        registry.register_collector(stack.metric_families)
+        streaming_manager = stack.streaming_manager
+        stream_runner = stack.stream_runner
+        sinks, pipeline, latest_values = stack.sinks, stack.pipeline, stack.latest_values
+        deadband, rollup, http_clients = stack.deadband, stack.rollup, stack.http_clients
+        fanout = stack.fanout
+
+
+def init_database():
+    from app.db.databases import Database
+    Database().ping()
+    if config.DB_AUTO_MIGRATE:
+        from app.db.migrations import upgrade_to_head
+        upgrade_to_head()
+
+
+def ping_database() -> bool:
+    from app.db.databases import Database
+    return Database().ping()
+
+
+def register_dependencies():
+    """Database, Redis and MQTT connect concurrently; the stream starts once they are done, ready or not."""
+    container.register("database", init_database, check=ping_database, timeout=config.DB_STARTUP_TIMEOUT)
+    stream_after = ["database"]
+    if coordinator is None:
+        # In sharded mode the shard processes make these connections themselves.
+        from app.util.redis_utils import redis_util
+        container.register("redis", redis_util.ping, check=redis_util.ping, timeout=config.REDIS_STARTUP_TIMEOUT,
+                           required=False)
+        stream_after.append("redis")
+        if config.MQTT_ENABLED:
+            from app.util.mqtt_utils import mqtt_utils
+            container.register("mqtt", mqtt_utils.connect, check=mqtt_utils.is_connected,
+                               timeout=config.MQTT_STARTUP_TIMEOUT, required=False)
+            stream_after.append("mqtt")
+    # Not required: the stream can be stopped on purpose through /stop.
+    container.register("stream", stream_runner.start_async, check=stream_runner.is_running, required=False,
+                       after=stream_after)
 
 
 @app.on_event("startup")
-def startup_event():
-    logger.info("Starting streaming service in background thread...")
-    streaming_manager.login()
-    streaming_manager.establish_stream()
-    events = streaming_manager.sse_client.events()
-    streaming_manager.process_hello(events)
-    streaming_manager.subscribe_to_all_active_guids()
-    streaming_manager.process_events(events)
+async def startup_event():
+    build_services()
+    register_dependencies()
+    if coordinator is not None:
+        logger.info(f"Starting {config.SHARD_COUNT} stream shards in the background...")
+    else:
+        logger.info(f"Starting streaming service in the background ({config.STREAM_ENGINE} engine)...")
+    await container.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if stream_runner is None:
+        return
+    if fanout is not None:
+        # Live responses would otherwise keep the server waiting for them to finish.
+        fanout.close()
+    logger.info("Stopping streaming service and flushing buffered events...")
+    await stream_runner.stop_async()
+    for client in http_clients:
+        await client.aclose()
@@ -0,0 +1,82 @@
+import logging
+import math
+import sys
+from array import array
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class EventBatch:
+    """Column-oriented view of every item in one object.values.update event."""
+    guids: list = field(default_factory=list)
+    values: array = field(default_factory=lambda: array("d"))
+    reliability: list = field(default_factory=list)
+    priority: list = field(default_factory=list)
+    item_references: list = field(default_factory=list)
+    skipped: int = 0
+    # Position of each item in the event it came from, set when some items were filtered out.
+    positions: array = None
+
+    def __len__(self):
+        return len(self.guids)
+
+    def append(self, guid: str, value: float, reliability: str, priority: str, item_reference: str):
+        self.guids.append(guid)
+        self.values.append(value)
+        self.reliability.append(reliability)
+        self.priority.append(priority)
+        self.item_references.append(item_reference)
+
+    @classmethod
+    def from_items(cls, items: list) -> "EventBatch":
+        """Build a batch from the decoded JSON array of an update event in a single pass.
+
+        Items without a numeric presentValue are counted in skipped rather than stored.
+        """
+        batch = cls()
+        append = batch.append
+        for entry in items:
+            item = entry["item"]
+            value = item.get("presentValue")
+            if not is_numeric(value):
+                batch.skipped += 1
+                continue
+            condition = (entry.get("condition") or {}).get("presentValue") or {}
+            reliability = condition.get("reliability")
+            priority = condition.get("priority")
+            append(item["id"], value,
+                   sys.intern(reliability) if reliability else None,
+                   sys.intern(priority) if priority else None,
+                   item.get("itemReference"))
+        if batch.skipped:
+            logger.debug(f"Skipped {batch.skipped} items without a numeric presentValue")
+        return batch
+
+    @classmethod
+    def from_structs(cls, updates: list) -> "EventBatch":
+        """Same as from_items, for updates already decoded into the codec's typed structs."""
+        batch = cls()
+        append = batch.append
+        for update in updates:
+            item = update.item
+            value = item.presentValue
+            if not is_numeric(value):
+                batch.skipped += 1
+                continue
+            condition = update.condition.presentValue if update.condition is not None else None
+            if condition is None:
+                append(item.id, value, None, None, item.itemReference)
+            else:
+                append(item.id, value,
+                       sys.intern(condition.reliability) if condition.reliability else None,
+                       sys.intern(condition.priority) if condition.priority else None,
+                       item.itemReference)
+        if batch.skipped:
+            logger.debug(f"Skipped {batch.skipped} items without a numeric presentValue")
+        return batch
+
+
+def is_numeric(value) -> bool:
+    return not isinstance(value, bool) and isinstance(value, (int, float)) and math.isfinite(value)
@@ -1,4 +1,7 @@
 from dataclasses import dataclass
+from datetime import datetime
+
+from app.models.EventBatch import EventBatch
 
 
 @dataclass
@@ -23,3 +26,20 @@ class Condition:
 class EventUpdateObject:
     item: Item
     condition: Condition
+
+
+@dataclass
+class StreamRecord:
+    event_id: str
+    event_type: str
+    stream_id: str
+    received_at: datetime
+    batch: EventBatch = None
+    # Arrival order, from MySQLEventSink.track.
+    sequence: int = None
+
+    def item_event_id(self, index: int) -> str:
+        """eventId of the index-th item; the first item keeps the SSE event id so single-item events are unchanged."""
+        if self.batch is not None and self.batch.positions is not None:
+            index = self.batch.positions[index]
+        return self.event_id if index == 0 else f"{self.event_id}-{index}"
@@ -0,0 +1,15 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+
+class HistoryRequest(BaseModel):
+    guids: list[str]
+    start: datetime
+    end: datetime | None = None
+    interval: str | None = None
+    aggregates: list[str] | None = None
+    source: str = "events"
+    format: str = "ndjson"
+    limit: int | None = None
+    after: str | None = None
@@ -0,0 +1,5 @@
+from pydantic import BaseModel
+
+
+class LatestValuesRequest(BaseModel):
+    guids: list[str]
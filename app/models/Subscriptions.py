@@ -1,7 +1,13 @@
 from dataclasses import dataclass
 
+from pydantic import BaseModel
+
 
 @dataclass
 class Subscription:
     guid: float
     active: bool
+
+
+class BulkSubscribeRequest(BaseModel):
+    guids: list[str]
@@ -0,0 +1,192 @@
+import asyncio
+import concurrent.futures
+import logging
+import time
+import traceback
+
+import httpx
+
+from app.core.config import config
+from app.services.bulk_subscriber import BulkSubscriber
+from app.services.streaming_manager import SUBSCRIBE_FAILURES, StreamingManager
+from app.util.sse import aiter_sse
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncStreamingManager(StreamingManager):
+    """asyncio engine: reads the SSE stream and calls Metasys over one pooled httpx.AsyncClient.
+
+    The stream, the REST API and the sinks then share the application's event loop. Event handling and the sink
+    writers are inherited from StreamingManager; only the network I/O is replaced.
+    """
+
+    def __init__(self, token_manager, db_session, redis_util, mqtt_utils, mysql_sink, influx_sink, redis_sink,
+                 latest_values, metasys_client, mqtt_sink=None, deadband=None, rollup=None, redis_prefix: str = "",
+                 backfill=None, subscriptions=None, fanout=None):
+        """
+        :param metasys_client: httpx.AsyncClient with base_url set to the Metasys server.
+        """
+        super().__init__(token_manager, db_session, redis_util, mqtt_utils, mysql_sink, influx_sink, redis_sink,
+                         latest_values, mqtt_sink, deadband, rollup, redis_prefix, backfill, subscriptions,
+                         fanout)
+        self.metasys_client = metasys_client
+        self.loop = None
+
+    def auth_headers(self) -> dict:
+        return self.token_manager.headers()
+
+    async def login_async(self):
+        if not self.token_manager.access_token:
+            logger.warning("No access token, retrying login...")
+            await self.token_manager.ensure_login_async(self.metasys_client)
+
+    def keep_stream_alive(self):
+        """Runs on the AuthScheduler's thread; the request itself goes over the pooled client on the loop."""
+        if self.loop is None or self.stream_id is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.keep_stream_alive_async(), self.loop).result(config.HTTP_TIMEOUT)
+
+    async def keep_stream_alive_async(self):
+        response = await self.token_manager.send_async(self.metasys_client, lambda headers: self.metasys_client.get(
+            "/api/v4/stream/keepalive", headers=headers))
+        response.raise_for_status()
+        logger.info(f"Stream keepalive: {response.status_code}")
+
+    async def run_async(self):
+        """Async counterpart of StreamingManager.run."""
+        attempt = 0
+        relogged = False
+        while not self.stop_requested.is_set():
+            connected_at = time.monotonic()
+            token = None
+            try:
+                await self.login_async()
+                token = self.token_manager.access_token
+                last_event_id = await asyncio.to_thread(self.resume_event_id) if self.resume else None
+                await self.establish_stream_async(last_event_id=last_event_id)
+                self.resume = True
+                relogged = False
+                await self.process_hello_async()
+                if await asyncio.to_thread(self.needs_subscription):
+                    await asyncio.to_thread(self.reconcile_subscriptions)
+                    await self.subscribe_to_all_active_guids_async()
+                    await asyncio.to_thread(self.mark_subscribed)
+                else:
+                    self.subscribe_drifted(await asyncio.to_thread(self.reconcile_subscriptions))
+                await self.process_events_async()
+            except Exception as e:
+                logger.error(f"Stream failed: {e}")
+                if self.is_unauthorized(e):
+                    self.token_manager.invalidate(token)
+                    if not relogged:
+                        relogged = True
+                        continue
+            if self.stop_requested.is_set():
+                break
+            attempt = 0 if time.monotonic() - connected_at > 60 else attempt + 1
+            delay = self.reconnect_delay(attempt)
+            self.reconnects += 1
+            logger.warning(f"Reconnecting to stream in {delay:.2f}s (attempt {attempt})")
+            await asyncio.sleep(delay)
+
+    async def establish_stream_async(self, last_event_id: str = None):
+        headers = self.auth_headers()
+        if last_event_id:
+            headers["Last-Event-ID"] = last_event_id
+            logger.info(f"Resuming stream after event {last_event_id}")
+        request = self.metasys_client.build_request(
+            "POST", "/api/v4/stream", headers=headers, timeout=httpx.Timeout(config.HTTP_TIMEOUT, read=None))
+        # A failed hello or subscribe leaves the last response open; hand its connection back to the pool.
+        if self.response is not None:
+            await self.response.aclose()
+        self.response = await self.metasys_client.send(request, stream=True)
+        self.response.raise_for_status()
+        self.events = aiter_sse(self.response)
+
+    async def process_hello_async(self):
+        event = await anext(self.events)
+        logger.info(f"Received event: {event}")
+        match event.event:
+            case "hello":
+                self.handle_hello_event(event)
+            case _:
+                raise Exception('expected only hello, found something else')
+
+    async def process_events_async(self):
+        try:
+            async for event in self.events:
+                if self.stop_requested.is_set():
+                    break
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"Received event: {event}")
+                await self.dispatch_async(self.build_record(event))
+        except Exception as e:
+            logger.error(f"Error during processing events: {e}")
+            traceback.print_exc()
+        finally:
+            if self.response is not None:
+                await self.response.aclose()
+
+    async def dispatch_async(self, record):
+        # These only append to buffers; flusher threads and the Influx flush task do the writes.
+        self.write_mysql(record)
+        self.write_influx(record)
+        self.write_checkpoint(record)
+        self.write_latest(record)
+        self.write_mqtt(record)
+        self.write_rollup(record)
+        self.write_fanout(record)
+
+    async def subscribe_to_guid_async(self, guid: str):
+        try:
+            response = await self.token_manager.send_async(self.metasys_client, lambda headers: self.metasys_client.get(
+                config.SUBSCRIBE_URL.format(guid), headers={**headers, "METASYS-SUBSCRIBE": self.stream_id}))
+            if response.status_code in (200, 202, 204):
+                logger.debug(f"Successfully subscribed to GUID: {guid}")
+            else:
+                SUBSCRIBE_FAILURES.inc()
+                logger.error(f"Failed to subscribe to GUID {guid}: {response.status_code} - {response.text}")
+            return response
+        except Exception as e:
+            SUBSCRIBE_FAILURES.inc()
+            logger.error(f"Error during subscription: {e}")
+            return None
+
+    async def subscribe_to_all_active_guids_async(self):
+        subscriptions = await asyncio.to_thread(self.active_guids)
+        self.bulk_subscriber = BulkSubscriber(self.subscribe_to_guid_async)
+        report = await self.bulk_subscriber.run_async(subscriptions[::-1])
+        logger.info(f"All subscriptions active: {len(report.succeeded)}/{len(subscriptions)}")
+
+    def subscribe_to_guid(self, guid: str):
+        """Blocking entry point for API handlers running in the threadpool and other threads.
+
+        Returns None when the request fails or takes longer than HTTP_TIMEOUT. On the stream's own loop it would wait
+        on itself forever, so it raises there; await subscribe_to_guid_async instead.
+        """
+        if self.loop is None:
+            raise RuntimeError("The stream's event loop is not running")
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            raise RuntimeError("subscribe_to_guid blocks and cannot run on the stream's event loop")
+        future = asyncio.run_coroutine_threadsafe(self.subscribe_to_guid_async(guid), self.loop)
+        try:
+            return future.result(config.HTTP_TIMEOUT)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            SUBSCRIBE_FAILURES.inc()
+            logger.error(f"Subscription of GUID {guid} timed out after {config.HTTP_TIMEOUT}s")
+            return None
+
+    def restart_stream(self):
+        self.resume = False
+        if self.response is not None and self.loop is not None:
+            asyncio.run_coroutine_threadsafe(self.response.aclose(), self.loop)
+
+    def stop(self):
+        # The runner cancels the reader task, which closes the response in process_events_async.
+        self.stop_requested.set()
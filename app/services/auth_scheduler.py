@@ -0,0 +1,57 @@
+import logging
+import time
+
+from app.core.config import config
+from app.services.cron_jobs import start_cron_job
+
+logger = logging.getLogger(__name__)
+
+
+class AuthScheduler:
+    """Refreshes the Metasys token and sends stream keepalives from a background job.
+
+    Both used to be checked for every event on the reader, where a due refresh or keepalive blocked ingestion.
+    The job runs every interval seconds: it refreshes the token once it is within the TokenManager's refresh margin
+    of expiry and calls keepalive every keepalive_interval seconds.
+    """
+    name = "auth"
+
+    def __init__(self, token_manager, keepalive=None, interval: int = config.AUTH_CHECK_INTERVAL,
+                 keepalive_interval: float = config.STREAM_KEEPALIVE_INTERVAL):
+        """
+        :param token_manager: TokenManager whose token is kept fresh.
+        :param keepalive: Callable sending a keepalive for the current stream, e.g. StreamingManager.keep_stream_alive.
+        :param interval: Seconds between checks.
+        :param keepalive_interval: Seconds between keepalives.
+        """
+        self.token_manager = token_manager
+        self.keepalive = keepalive
+        self.interval = interval
+        self.keepalive_interval = keepalive_interval
+        self.keepalives = 0
+        self.scheduler = None
+        self._keepalive_at = 0.0
+
+    def start(self):
+        if self.scheduler is None:
+            self._keepalive_at = time.monotonic() + self.keepalive_interval
+            self.scheduler = start_cron_job(self.run, interval_minutes=0, interval_seconds=self.interval)
+
+    def stop(self):
+        if self.scheduler is not None:
+            self.scheduler.shutdown(wait=False)
+            self.scheduler = None
+
+    def run(self):
+        self.token_manager.refresh_token()
+        if self.keepalive is None or time.monotonic() < self._keepalive_at:
+            return
+        try:
+            self.keepalive()
+            self.keepalives += 1
+            self._keepalive_at = time.monotonic() + self.keepalive_interval
+        except Exception as e:
+            logger.error(f"Stream keepalive failed: {e}")
+
+    def stats(self) -> dict:
+        return {**self.token_manager.stats(), "keepalives": self.keepalives}
@@ -0,0 +1,239 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.core.config import config
+from app.db.CRUDHandle import EventCrudHandler
+from app.util.metrics import registry
+from app.util.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+SAMPLES_PATH = "/api/v4/objects/{}/trendedAttributes/presentValue/samples"
+STREAM_ID = "backfill"
+RELIABLE = "reliabilityEnumSet.reliable"
+UNRELIABLE = "reliabilityEnumSet.unreliable"
+# GUIDs per gap query, to keep the IN list well within what MySQL handles comfortably.
+QUERY_CHUNK = 500
+
+GAPS = registry.counter("metasys_backfill_gaps_total", "Per-GUID gaps found after a new stream was opened")
+SAMPLES = registry.counter("metasys_backfill_samples_total", "Trend samples written to fill gaps")
+FAILURES = registry.counter("metasys_backfill_failures_total", "Gaps that could not be filled")
+
+
+def to_utc(moment: datetime) -> str:
+    """Local naive timestamp, as stored in events, to the UTC form the Metasys API takes."""
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def from_utc(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).astimezone().replace(tzinfo=None)
+
+
+class BackfillEngine:
+    """Fills what a stream outage leaves out of the events table from the Metasys trend samples.
+
+    The manager calls request() whenever it subscribed on a new stream instead of resuming one. After delay
+    seconds, so the first live events are stored, a GUID's gap runs from its newest event before the outage to
+    its oldest event since the new stream began. Only samples strictly inside it are written, under event ids made
+    from GUID and sample time, so neither live events nor an earlier backfill are duplicated.
+
+    Samples are paged in by a pool of concurrency threads at no more than rate requests per second and handed to
+    the MySQL, InfluxDB and rollup sinks from those threads, so the reader never waits on a backfill. Latest
+    values, checkpoints and MQTT keep taking live events only.
+    """
+    name = "backfill"
+
+    def __init__(self, token_manager, db_session, mysql_sink, influx_sink, latest_values=None, rollup=None,
+                 concurrency: int = config.BACKFILL_CONCURRENCY, rate: float = config.BACKFILL_RATE_LIMIT,
+                 page_size: int = config.BACKFILL_PAGE_SIZE, delay: float = config.BACKFILL_DELAY,
+                 min_gap: float = config.BACKFILL_MIN_GAP, max_age: float = config.BACKFILL_MAX_AGE):
+        """
+        :param latest_values: Optional LatestValueStore, used for GUIDs without any stored event.
+        :param rollup: Optional RollupEngine the samples are counted in as well.
+        :param concurrency: GUIDs fetched at the same time.
+        :param rate: Maximum sample requests per second to Metasys.
+        :param page_size: Samples per request.
+        :param delay: Seconds between a request and the gap search.
+        :param min_gap: Gaps shorter than this many seconds are left alone.
+        :param max_age: Gaps are cut to at most this many seconds before now.
+        """
+        self.token_manager = token_manager
+        self.db_session = db_session
+        self.mysql_sink = mysql_sink
+        self.influx_sink = influx_sink
+        self.latest_values = latest_values
+        self.rollup = rollup
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate, max(1, concurrency))
+        self.page_size = page_size
+        self.delay = delay
+        self.min_gap = min_gap
+        self.max_age = max_age
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=concurrency))
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=concurrency))
+        self.runs = 0
+        self.gaps = 0
+        self.samples = 0
+        self.pages = 0
+        self.failures = 0
+        self.last_run_at = None
+        self._lock = threading.Lock()
+        self._requests = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="backfill", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._requests.put(None)
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def request(self, guids: list, since: datetime, down_since: datetime = None):
+        """Queue a backfill of guids for the outage that ended when the stream opened at since. Returns at once.
+
+        :param down_since: When the previous stream last delivered an event, if known. Otherwise the newest stored
+                           event stands in for it.
+        """
+        self._requests.put((list(guids), since, down_since))
+
+    def stats(self) -> dict:
+        return {"runs": self.runs, "gaps": self.gaps, "pages": self.pages, "samples": self.samples,
+                "failures": self.failures, "queued": self._requests.qsize(), "last_run_at": self.last_run_at}
+
+    def _run(self):
+        while not self._stop.is_set():
+            item = self._requests.get()
+            if item is None or self._stop.wait(self.delay):
+                break
+            try:
+                self.run(*item)
+            except Exception as e:
+                logger.error(f"Backfill failed: {e}")
+
+    def run(self, guids: list, since: datetime, down_since: datetime = None) -> int:
+        """Find and fill the gaps of guids now. Blocks until done and returns the number of samples written."""
+        began = time.monotonic()
+        gaps = self.find_gaps(guids, since, down_since)
+        with self._lock:
+            self.runs += 1
+            self.gaps += len(gaps)
+        GAPS.inc(len(gaps))
+        if not gaps:
+            logger.info(f"No gaps to backfill for {len(guids)} GUIDs")
+            return 0
+        logger.info(f"Backfilling {len(gaps)} GUIDs from trend samples")
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="backfill") as executor:
+            written = sum(executor.map(lambda gap: self.fill(gap[0], *gap[1]), gaps.items()))
+        self.last_run_at = time.time()
+        logger.info(f"Backfilled {written} samples for {len(gaps)} GUIDs in {time.monotonic() - began:.1f}s")
+        return written
+
+    def find_gaps(self, guids: list, since: datetime, down_since: datetime = None) -> dict:
+        """Map each GUID with a gap worth filling to its (start, end), both exclusive."""
+        bounds = {}
+        with self.db_session.session_context() as db:
+            crud_session = EventCrudHandler(db)
+            if down_since is None:
+                down_since = crud_session.get_last_event_time(since)
+            for start in range(0, len(guids), QUERY_CHUNK):
+                bounds.update(crud_session.get_gap_bounds(guids[start:start + QUERY_CHUNK], since))
+        if down_since is None:
+            # Nothing was ever stored, so there is no outage to speak of.
+            return {}
+        now = datetime.now()
+        oldest = now - timedelta(seconds=self.max_age)
+        gaps = {}
+        for guid in guids:
+            last, first = bounds.get(guid, (None, None))
+            if last is None and self.latest_values is not None:
+                value = self.latest_values.get(guid)
+                if value is not None and datetime.fromisoformat(value["timestamp"]) < since:
+                    last = datetime.fromisoformat(value["timestamp"])
+            if last is None:
+                continue
+            # Samples from while the stream was up would only repeat values that did not change.
+            start = max(last, down_since, oldest)
+            end = first or now
+            if (end - start).total_seconds() >= self.min_gap:
+                gaps[guid] = (start, end)
+        return gaps
+
+    def fill(self, guid: str, start: datetime, end: datetime) -> int:
+        """Page through the samples of guid between start and end and hand them to the sinks."""
+        written = 0
+        try:
+            page = 1
+            while not self._stop.is_set():
+                body = self.fetch_page(guid, start, end, page)
+                samples = self.parse_samples(body.get("items") or [], start, end)
+                if samples:
+                    self.write(guid, samples)
+                    written += len(samples)
+                if not body.get("next") or len(body.get("items") or []) < self.page_size:
+                    break
+                page += 1
+        except Exception as e:
+            with self._lock:
+                self.failures += 1
+            FAILURES.inc()
+            logger.error(f"Backfill of {guid} failed after {written} samples: {e}")
+        with self._lock:
+            self.samples += written
+        SAMPLES.inc(written)
+        return written
+
+    def fetch_page(self, guid: str, start: datetime, end: datetime, page: int) -> dict:
+        self.bucket.acquire()
+        url = config.METASYS_SERVER + SAMPLES_PATH.format(guid)
+        params = {"startTime": to_utc(start), "endTime": to_utc(end), "page": page, "pageSize": self.page_size}
+        response = self.token_manager.send(
+            lambda headers: self.session.get(url, params=params, headers=headers, timeout=config.HTTP_TIMEOUT))
+        response.raise_for_status()
+        with self._lock:
+            self.pages += 1
+        return response.json()
+
+    @staticmethod
+    def parse_samples(items: list, start: datetime, end: datetime) -> list:
+        """(timestamp, value, reliable) of the numeric samples strictly between start and end."""
+        samples = []
+        for item in items:
+            value = item.get("value")
+            if isinstance(value, dict):
+                value = value.get("value")
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                continue
+            moment = from_utc(item["timestamp"])
+            if start < moment < end:
+                samples.append((moment, float(value), item.get("isReliable", True)))
+        return samples
+
+    def write(self, guid: str, samples: list):
+        self.mysql_sink.extend([{
+            "guid": guid,
+            "eventId": f"{STREAM_ID}-{guid}-{moment:%Y%m%dT%H%M%S}",
+            "presentValue": value,
+            "reliability": RELIABLE if reliable else UNRELIABLE,
+            "priority": None,
+            "stream_id": STREAM_ID,
+            "timestamp": moment,
+        } for moment, value, reliable in samples])
+        values = [(moment, value) for moment, value, _ in samples]
+        self.influx_sink.add_samples(guid, values, STREAM_ID)
+        if self.rollup is not None:
+            self.rollup.add_samples(guid, values)
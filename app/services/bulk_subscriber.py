@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from app.core.config import config
+from app.util.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+SUCCESS_STATUS_CODES = {200, 202, 204}
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+@dataclass
+class BulkSubscriptionReport:
+    total: int
+    succeeded: list = field(default_factory=list)
+    failed: dict = field(default_factory=dict)
+    retries: int = 0
+    started_at: float = field(default_factory=time.time)
+    finished_at: float = None
+
+    @property
+    def done(self) -> int:
+        return len(self.succeeded) + len(self.failed)
+
+    def snapshot(self) -> dict:
+        return {
+            "total": self.total,
+            "done": self.done,
+            "succeeded": len(self.succeeded),
+            "failed": self.failed,
+            "retries": self.retries,
+            "running": self.finished_at is None,
+            "elapsed_seconds": (self.finished_at or time.time()) - self.started_at,
+        }
+
+
+class BulkSubscriber:
+    """Subscribes many GUIDs concurrently while keeping the request rate under the Metasys limit."""
+
+    def __init__(self, subscribe_fn, concurrency: int = config.SUBSCRIBE_CONCURRENCY,
+                 rate: float = config.SUBSCRIBE_RATE_LIMIT, burst: int = config.SUBSCRIBE_BURST,
+                 max_retries: int = config.SUBSCRIBE_MAX_RETRIES):
+        """
+        :param subscribe_fn: Callable (or coroutine function for run_async) taking a GUID and returning the
+                             subscribe response, or None if the request failed. A GUID whose call raises is
+                             recorded as failed.
+        """
+        self.subscribe_fn = subscribe_fn
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.report = None
+        self._lock = threading.Lock()
+
+    def run(self, guids: list) -> BulkSubscriptionReport:
+        """Subscribe every GUID on a bounded thread pool and return the final report."""
+        self.report = BulkSubscriptionReport(total=len(guids))
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="subscribe") as executor:
+            for guid in guids:
+                executor.submit(self._subscribe, guid)
+        return self._finish()
+
+    async def run_async(self, guids: list) -> BulkSubscriptionReport:
+        """Same as run, for a coroutine subscribe_fn, bounded by a semaphore instead of threads."""
+        self.report = BulkSubscriptionReport(total=len(guids))
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def subscribe(guid):
+            async with semaphore:
+                await self._subscribe_async(guid)
+
+        await asyncio.gather(*(subscribe(guid) for guid in guids))
+        return self._finish()
+
+    def _subscribe(self, guid: str):
+        # The executor would keep an exception in a future nobody reads, so it is recorded as the GUID's failure.
+        try:
+            for attempt in range(self.max_retries + 1):
+                self.bucket.acquire()
+                delay = self._handle_response(guid, self.subscribe_fn(guid), attempt)
+                if delay is None:
+                    return
+                time.sleep(delay)
+        except Exception as e:
+            logger.error(f"Error subscribing to {guid}: {e}")
+            self._record(guid, f"error: {e}")
+
+    async def _subscribe_async(self, guid: str):
+        # Recorded here too, so one failing GUID neither cancels the gather nor goes missing from the report.
+        try:
+            for attempt in range(self.max_retries + 1):
+                await self.bucket.acquire_async()
+                delay = self._handle_response(guid, await self.subscribe_fn(guid), attempt)
+                if delay is None:
+                    return
+                await asyncio.sleep(delay)
+        except Exception as e:
+            logger.error(f"Error subscribing to {guid}: {e}")
+            self._record(guid, f"error: {e}")
+
+    def _handle_response(self, guid: str, response, attempt: int):
+        """Record the outcome of one attempt. Returns the delay before retrying, or None when finished."""
+        if response is not None and response.status_code in SUCCESS_STATUS_CODES:
+            self._record(guid, None)
+            return None
+        reason = "request failed" if response is None else f"{response.status_code}"
+        if (response is not None and response.status_code not in RETRY_STATUS_CODES) or attempt == self.max_retries:
+            self._record(guid, reason)
+            return None
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            self.bucket.pause(float(retry_after))
+        with self._lock:
+            self.report.retries += 1
+        return random.uniform(0, min(10.0, 0.5 * 2 ** attempt))
+
+    def _record(self, guid: str, error):
+        with self._lock:
+            if error is None:
+                self.report.succeeded.append(guid)
+            else:
+                self.report.failed[guid] = error
+            done, total = self.report.done, self.report.total
+        if done == total or done % max(1, total // 10) == 0:
+            logger.info(f"Subscribed {len(self.report.succeeded)}/{total} GUIDs ({len(self.report.failed)} failed)")
+
+    def _finish(self) -> BulkSubscriptionReport:
+        self.report.finished_at = time.time()
+        if self.report.failed:
+            logger.error(f"Failed to subscribe {len(self.report.failed)} GUIDs: {list(self.report.failed)[:20]}")
+        return self.report
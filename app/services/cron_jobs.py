@@ -4,13 +4,16 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-def start_cron_job(dump_function, interval_minutes: int = 5):
+def start_cron_job(dump_function, interval_minutes: int = 5, interval_seconds: int = 0):
     """
-    Start a cron job to execute dump_function every interval_minutes.
-    :param dump_function: Function that dumps events to InfluxDB.
+    Start a cron job to execute dump_function every interval_minutes (plus interval_seconds).
+    :param dump_function: Function to run, e.g. a retention pass.
     :param interval_minutes: How often to run the job.
+    :param interval_seconds: Seconds added to interval_minutes, for jobs that run more often than once a minute.
+    :return: The scheduler, so the caller can shut it down.
     """
     scheduler = BackgroundScheduler()
-    scheduler.add_job(dump_function, "interval", minutes=interval_minutes)
+    scheduler.add_job(dump_function, "interval", minutes=interval_minutes, seconds=interval_seconds)
     scheduler.start()
     logger.info("Cron job started.")
+    return scheduler
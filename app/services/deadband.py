@@ -0,0 +1,118 @@
+import fnmatch
+import json
+import logging
+import time
+from array import array
+from dataclasses import dataclass
+
+from app.core.config import config
+from app.models.EventBatch import EventBatch
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DeadbandRule:
+    """Report-by-exception settings for the GUIDs or itemReferences matching pattern (fnmatch syntax)."""
+    pattern: str = "*"
+    absolute: float = 0.0
+    percent: float = 0.0
+    min_interval: float = 0.0
+    max_silence: float = 0.0
+
+
+class DeadbandFilter:
+    """Drops updates that did not move a point outside its deadband since the last forwarded value.
+
+    An item is forwarded when it is the first for its GUID, when its reliability changed, or when the value moved
+    by more than the larger of the absolute and percent (of the last forwarded value) deadbands. Nothing is
+    forwarded sooner than min_interval after the previous forward, and an update arriving max_silence or more
+    after it is always forwarded. State is one slot per GUID in parallel arrays.
+    """
+
+    def __init__(self, rules: list = None, default: DeadbandRule = None):
+        """
+        :param rules: DeadbandRules tried in order; the first whose pattern matches the GUID or itemReference wins.
+        :param default: Rule for points that match none of rules.
+        """
+        self.rules = list(rules or []) + [default or DeadbandRule()]
+        self.slots = {}
+        self.last_values = array("d")
+        self.last_times = array("d")
+        self.rule_index = array("H")
+        self.reliability = array("H")
+        self.codes = {None: 0}
+        self.forwarded = 0
+        self.suppressed = 0
+        self.forced = 0
+
+    @classmethod
+    def from_config(cls) -> "DeadbandFilter":
+        default = DeadbandRule(absolute=config.DEADBAND_ABSOLUTE, percent=config.DEADBAND_PERCENT,
+                               min_interval=config.DEADBAND_MIN_INTERVAL, max_silence=config.DEADBAND_MAX_SILENCE)
+        rules = []
+        if config.DEADBAND_RULES:
+            with open(config.DEADBAND_RULES) as f:
+                rules = [DeadbandRule(**rule) for rule in json.load(f)]
+            logger.info(f"Loaded {len(rules)} deadband rules from {config.DEADBAND_RULES}")
+        return cls(rules, default)
+
+    def match(self, guid: str, item_reference: str = None) -> int:
+        for index, rule in enumerate(self.rules[:-1]):
+            if fnmatch.fnmatchcase(guid, rule.pattern) or (
+                    item_reference and fnmatch.fnmatchcase(item_reference, rule.pattern)):
+                return index
+        return len(self.rules) - 1
+
+    def apply(self, batch: EventBatch, now: float = None) -> EventBatch:
+        """Return a batch holding only the forwarded items, with their positions in the original batch."""
+        if now is None:
+            now = time.monotonic()
+        kept = EventBatch(skipped=batch.skipped, positions=array("I"))
+        for i in range(len(batch)):
+            guid = batch.guids[i]
+            value = batch.values[i]
+            reliability = self._code(batch.reliability[i])
+            slot = self.slots.get(guid)
+            if slot is None:
+                slot = len(self.slots)
+                self.slots[guid] = slot
+                self.last_values.append(value)
+                self.last_times.append(now)
+                self.rule_index.append(self.match(guid, batch.item_references[i]))
+                self.reliability.append(reliability)
+            elif not self._forward(slot, value, reliability, now):
+                self.suppressed += 1
+                continue
+            else:
+                self.last_values[slot] = value
+                self.last_times[slot] = now
+                self.reliability[slot] = reliability
+            self.forwarded += 1
+            kept.append(guid, value, batch.reliability[i], batch.priority[i], batch.item_references[i])
+            kept.positions.append(batch.positions[i] if batch.positions is not None else i)
+        return kept
+
+    def _forward(self, slot: int, value: float, reliability: int, now: float) -> bool:
+        rule = self.rules[self.rule_index[slot]]
+        elapsed = now - self.last_times[slot]
+        if elapsed < rule.min_interval:
+            return False
+        if rule.max_silence and elapsed >= rule.max_silence:
+            self.forced += 1
+            return True
+        if reliability != self.reliability[slot]:
+            return True
+        last = self.last_values[slot]
+        return abs(value - last) > max(rule.absolute, rule.percent * abs(last) / 100)
+
+    def _code(self, name) -> int:
+        code = self.codes.get(name)
+        if code is None:
+            code = len(self.codes)
+            self.codes[name] = code
+        return code
+
+    def stats(self) -> dict:
+        return {"guids": len(self.slots), "forwarded": self.forwarded, "suppressed": self.suppressed,
+                "forced": self.forced, "rules": len(self.rules)}
@@ -0,0 +1,254 @@
+import asyncio
+import logging
+import threading
+from collections import deque
+
+from app.core.config import config
+from app.models.EventUpdateObject import StreamRecord
+from app.util import codec
+from app.util.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("drop_oldest", "drop_newest", "disconnect")
+
+MESSAGES = registry.counter("metasys_fanout_messages_total", "Messages queued for live clients")
+DROPPED = registry.counter("metasys_fanout_dropped_total", "Messages dropped for live clients that fell behind")
+DISCONNECTS = registry.counter("metasys_fanout_slow_disconnects_total", "Live clients disconnected for falling behind")
+
+
+class ClientLimitReached(Exception):
+    pass
+
+
+class FanoutClient:
+    """One live consumer: its GUID filter and a bounded buffer of encoded messages, drained on the event loop."""
+
+    def __init__(self, guids, capacity: int, policy: str):
+        """
+        :param guids: Set of GUIDs the client receives, or None for all of them.
+        :param capacity: Messages buffered at most before policy applies.
+        :param policy: What happens to a message for a full buffer: drop_oldest, drop_newest or disconnect.
+        """
+        self.guids = guids
+        self.capacity = capacity
+        self.policy = policy
+        # Bounded for drop_oldest, so a full buffer drops its oldest message as the new one is appended. Popping it
+        # from the publishing thread could find the buffer already drained by the event loop.
+        self.buffer = deque(maxlen=capacity) if policy == "drop_oldest" else deque()
+        self.event = asyncio.Event()
+        self.waiting = False
+        self.closed = False
+        self.reason = None
+        self.sent = 0
+        self.dropped = 0
+
+    async def next_messages(self, timeout: float) -> list:
+        """Wait up to timeout seconds for messages and return all buffered ones; empty on timeout or close."""
+        if not self.buffer and not self.closed:
+            self.event.clear()
+            self.waiting = True
+            try:
+                # Checked again after raising the flag, so a message queued in between is not slept through.
+                if not self.buffer:
+                    await asyncio.wait_for(self.event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self.waiting = False
+        messages = []
+        while self.buffer:
+            messages.append(self.buffer.popleft())
+        self.sent += len(messages)
+        return messages
+
+    def close(self, reason: str = None):
+        self.closed = True
+        self.reason = reason or self.reason
+        self.event.set()
+
+
+class FanoutHub:
+    """Re-publishes the stream's updates to local WebSocket and SSE clients, all fed by the one upstream stream.
+
+    Clients with a GUID filter are found through an inverted index from GUID to clients, so an update costs a
+    lookup per item and a message per interested client, however many clients there are. Every item is encoded
+    once and shared by all the messages it goes into. The index holds tuples that are replaced, not changed, so
+    the reader publishes without taking a lock.
+
+    publish() runs on the reader thread (or a pipeline worker, or the event loop with the async engine) and only
+    appends to the clients' buffers. Clients waiting for messages are woken with a single callback on the event
+    loop per update. A full buffer drops its oldest or the new message, or disconnects the client, as its policy
+    says.
+    """
+    name = "fanout"
+
+    def __init__(self, latest_values, max_clients: int = config.FANOUT_MAX_CLIENTS,
+                 capacity: int = config.FANOUT_CLIENT_BUFFER, policy: str = config.FANOUT_SLOW_CLIENT_POLICY):
+        """
+        :param latest_values: LatestValueStore a new client's snapshot is taken from.
+        :param max_clients: Clients connected at most.
+        :param capacity: Default buffer size of a client, in messages.
+        :param policy: Default slow client policy.
+        """
+        self.latest_values = latest_values
+        self.max_clients = max_clients
+        self.capacity = capacity
+        self.policy = policy
+        self.loop = None
+        self.clients = set()
+        # GUID to the clients filtering on it, and the clients taking every GUID.
+        self.index = {}
+        self.everyone = ()
+        self.published = 0
+        self.dropped = 0
+        self.disconnects = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.clients)
+
+    def connect(self, guids=None, policy: str = None, capacity: int = None) -> FanoutClient:
+        """Register a client on the running event loop. It receives updates from now on."""
+        policy = policy or self.policy
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy: {policy}, expected one of {', '.join(POLICIES)}")
+        if len(self.clients) >= self.max_clients:
+            raise ClientLimitReached(f"{self.max_clients} live clients are connected already")
+        self.loop = asyncio.get_running_loop()
+        client = FanoutClient(set(guids) if guids else None, capacity or self.capacity, policy)
+        with self._lock:
+            self.clients.add(client)
+            if client.guids is None:
+                self.everyone = self.everyone + (client,)
+            else:
+                self._index(client, client.guids, ())
+        logger.info(f"Live client connected ({len(self.clients)} connected)")
+        return client
+
+    def disconnect(self, client: FanoutClient):
+        with self._lock:
+            if client not in self.clients:
+                return
+            self.clients.discard(client)
+            if client.guids is None:
+                self.everyone = tuple(other for other in self.everyone if other is not client)
+            else:
+                self._index(client, (), client.guids)
+        client.close(client.reason)
+        logger.info(f"Live client disconnected ({len(self.clients)} connected)")
+
+    def update(self, client: FanoutClient, add=(), remove=()) -> list:
+        """Change the GUIDs a filtered client receives. Returns the GUIDs it did not receive yet."""
+        if client.guids is None:
+            return []
+        with self._lock:
+            added = [guid for guid in dict.fromkeys(add) if guid not in client.guids]
+            removed = [guid for guid in dict.fromkeys(remove) if guid in client.guids]
+            client.guids = (client.guids | set(added)) - set(removed)
+            self._index(client, added, removed)
+        return added
+
+    def snapshot(self, guids=None) -> bytes:
+        """The latest value of guids, or of every GUID, as one message."""
+        values = self.latest_values.get_all() if guids is None else list(self.latest_values.get_many(guids).values())
+        return codec.dumps({"type": "snapshot", "values": values})
+
+    def enqueue(self, client: FanoutClient, message: bytes):
+        """Queue a message for one client from the event loop, e.g. a snapshot for GUIDs it just added."""
+        client.buffer.append(message)
+        client.event.set()
+
+    def publish(self, record: StreamRecord):
+        batch = record.batch
+        if not batch or not self.clients:
+            return
+        index, everyone = self.index, self.everyone
+        targets = {}
+        if index:
+            for position, guid in enumerate(batch.guids):
+                for client in index.get(guid, ()):
+                    items = targets.get(client)
+                    if items is None:
+                        targets[client] = [position]
+                    else:
+                        items.append(position)
+        if not targets and not everyone:
+            return
+        fragments = [None] * len(batch)
+        head = b'{"type":"update","eventId":' + codec.dumps(record.event_id) + b',"timestamp":' + \
+            codec.dumps(record.received_at.isoformat()) + b',"values":['
+        wake = []
+        queued = 0
+        if everyone:
+            message = self._message(head, batch, fragments, range(len(batch)))
+            for client in everyone:
+                queued += self._deliver(client, message, wake)
+        for client, items in targets.items():
+            queued += self._deliver(client, self._message(head, batch, fragments, items), wake)
+        self.published += 1
+        MESSAGES.inc(queued)
+        if wake and self.loop is not None:
+            self.loop.call_soon_threadsafe(self._wake, wake)
+
+    def close(self):
+        """Disconnect every client, e.g. on shutdown, so their responses end."""
+        for client in list(self.clients):
+            client.reason = "shutting down"
+            self.disconnect(client)
+
+    def stats(self) -> dict:
+        return {"clients": len(self.clients), "filtered_guids": len(self.index), "unfiltered": len(self.everyone),
+                "published": self.published, "dropped": self.dropped, "slow_disconnects": self.disconnects,
+                "buffered": sum(len(client.buffer) for client in list(self.clients))}
+
+    def _index(self, client: FanoutClient, added, removed):
+        # Called with the lock held. Entries are replaced so publish() may be reading the old ones.
+        index = self.index
+        for guid in added:
+            index[guid] = index.get(guid, ()) + (client,)
+        for guid in removed:
+            remaining = tuple(other for other in index.get(guid, ()) if other is not client)
+            if remaining:
+                index[guid] = remaining
+            else:
+                index.pop(guid, None)
+
+    def _deliver(self, client: FanoutClient, message: bytes, wake: list) -> bool:
+        if client.closed:
+            return False
+        if len(client.buffer) >= client.capacity:
+            client.dropped += 1
+            self.dropped += 1
+            DROPPED.inc()
+            if client.policy == "drop_newest":
+                return False
+            if client.policy == "disconnect":
+                self.disconnects += 1
+                DISCONNECTS.inc()
+                client.closed = True
+                client.reason = f"fell {client.capacity} messages behind"
+                wake.append(client)
+                return False
+        client.buffer.append(message)
+        if client.waiting:
+            wake.append(client)
+        return True
+
+    @staticmethod
+    def _message(head: bytes, batch, fragments: list, items) -> bytes:
+        parts = []
+        for position in items:
+            fragment = fragments[position]
+            if fragment is None:
+                fragment = fragments[position] = codec.dumps({
+                    "guid": batch.guids[position], "value": batch.values[position],
+                    "reliability": batch.reliability[position], "priority": batch.priority[position],
+                    "itemReference": batch.item_references[position]})
+            parts.append(fragment)
+        return head + b",".join(parts) + b"]}"
+
+    @staticmethod
+    def _wake(clients: list):
+        for client in clients:
+            client.event.set()
@@ -0,0 +1,262 @@
+"""Time-range reads of stored events, generated page by page so a response of any size keeps memory flat.
+
+Rows are read per GUID in (timestamp, id) order by keyset pagination on the (guid, timestamp) index, each page in
+a session of its own, so a slow client never holds a connection between pages. With an interval the rows are
+folded into buckets on the way, one open bucket at a time, from the raw events or from a rollup table.
+"""
+import base64
+import io
+import json
+import logging
+import re
+from datetime import datetime, timedelta, timezone
+
+from app.core.config import config
+from app.db.CRUDHandle import EventCrudHandler
+from app.sinks.rollup import COUNT, LAST, LAST_TIME, MAX, MIN, RESOLUTIONS, SUM, utc
+from app.util import codec
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+AGGREGATES = ("count", "avg", "min", "max", "last")
+SOURCES = ("events", "rollup")
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_interval(value: str) -> int:
+    """Seconds in an interval written as 90, 30s, 15m, 1h or 1d."""
+    match = re.fullmatch(r"(\d+)([smhd]?)", value.strip())
+    if match is None or int(match.group(1)) == 0:
+        raise ValueError(f"Invalid interval: {value}")
+    return int(match.group(1)) * UNITS[match.group(2) or "s"]
+
+
+def local_time(moment: datetime) -> datetime:
+    """Events are stored in naive local time; an aware moment is converted to it."""
+    return moment if moment.tzinfo is None else moment.astimezone().replace(tzinfo=None)
+
+
+def encode_cursor(guid: str, moment: datetime, row_id: int = None) -> str:
+    return base64.urlsafe_b64encode(json.dumps([guid, moment.isoformat(), row_id]).encode()).decode()
+
+
+def merge(into: list, agg):
+    """Merge one [count, min, max, sum, last, last time] aggregate into another, as rollup.coarsen does."""
+    into[COUNT] += agg[COUNT]
+    into[MIN] = min(into[MIN], agg[MIN])
+    into[MAX] = max(into[MAX], agg[MAX])
+    into[SUM] += agg[SUM]
+    if agg[LAST_TIME] >= into[LAST_TIME]:
+        into[LAST] = agg[LAST]
+        into[LAST_TIME] = agg[LAST_TIME]
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        guid, moment, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return guid, datetime.fromisoformat(moment), row_id
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+class HistoryQuery:
+    """The events of some GUIDs between start and end, raw or bucketed, as a generator of row pages."""
+
+    def __init__(self, db_session, guids: list, start: datetime, end: datetime = None, interval: int = None,
+                 aggregates=AGGREGATES, source: str = "events", limit: int = None, after: str = None,
+                 page_size: int = config.HISTORY_PAGE_SIZE):
+        """
+        :param interval: Bucket length in seconds. None returns the raw events.
+        :param aggregates: Subset of AGGREGATES returned per bucket.
+        :param source: "events", or "rollup" to bucket the rollup table with the longest window that divides
+                       interval. Rollups are kept for their resolution's retention.
+        :param limit: Rows returned at most. When reached, next_cursor continues after the last one.
+        :param after: Cursor of a previous response to continue from.
+        :param page_size: Rows read per query.
+        """
+        self.db_session = db_session
+        self.guids = sorted(dict.fromkeys(guids))
+        self.start = local_time(start)
+        self.end = local_time(end) if end is not None else datetime.now()
+        self.interval = interval
+        self.aggregates = [name for name in AGGREGATES if name in aggregates]
+        self.limit = limit
+        self.after = decode_cursor(after) if after else None
+        self.page_size = page_size
+        self.next_cursor = None
+        unknown = set(aggregates) - set(AGGREGATES)
+        if unknown:
+            raise ValueError(f"Unknown aggregates: {', '.join(sorted(unknown))}")
+        if source not in SOURCES:
+            raise ValueError(f"Unknown source: {source}")
+        self.rollup = None
+        if source == "rollup":
+            if interval is None:
+                raise ValueError("Reading rollups needs an interval")
+            dividing = [(seconds, model) for seconds, model, _ in RESOLUTIONS.values() if interval % seconds == 0]
+            if not dividing:
+                raise ValueError(f"No rollup resolution divides an interval of {interval}s")
+            self.rollup = max(dividing, key=lambda resolution: resolution[0])
+
+    def columns(self) -> list:
+        if self.interval is None:
+            return ["guid", "id", "timestamp", "value", "reliability", "priority"]
+        return ["guid", "bucket", *self.aggregates]
+
+    def pages(self):
+        """Yield lists of row dicts until the range, or limit, is exhausted."""
+        remaining = self.limit
+        pages = self.bucket_pages() if self.interval is not None else self.event_pages()
+        for page in pages:
+            if remaining is not None and len(page) >= remaining:
+                page = page[:remaining]
+                if page:
+                    self.next_cursor = self.cursor(page[-1])
+                    yield page
+                pages.close()
+                return
+            if remaining is not None:
+                remaining -= len(page)
+            yield page
+
+    def cursor(self, row: dict) -> str:
+        if self.interval is None:
+            return encode_cursor(row["guid"], row["timestamp"], row["id"])
+        return encode_cursor(row["guid"], row["bucket"])
+
+    def event_pages(self):
+        for guid in self.guids:
+            after_time, after_id = self.resume_point(guid)
+            if after_time is False:
+                continue
+            while True:
+                with self.db_session.session_context() as db:
+                    page = EventCrudHandler(db).get_events_page(guid, self.start, self.end, after_time, after_id,
+                                                                self.page_size)
+                if page:
+                    yield [{"guid": guid, "id": row_id, "timestamp": timestamp, "value": value,
+                            "reliability": reliability, "priority": priority}
+                           for row_id, timestamp, value, reliability, priority in page]
+                if len(page) < self.page_size:
+                    break
+                after_time, after_id = page[-1][1], page[-1][0]
+
+    def bucket_pages(self):
+        """Fold each GUID's rows, which arrive in time order, into buckets, holding only the open one."""
+        page = []
+        for guid in self.guids:
+            after_time, _ = self.resume_point(guid)
+            if after_time is False:
+                continue
+            start = self.start
+            if after_time is not None:
+                start = max(start, after_time + timedelta(seconds=self.interval))
+            bucket, agg = None, None
+            for values in (self.rollup_values(guid, start) if self.rollup else self.event_values(guid, start)):
+                moment = values[0].timestamp()
+                begins = moment - moment % self.interval
+                if begins == bucket:
+                    merge(agg, values[1:])
+                    continue
+                if agg is not None:
+                    page.append(self.bucket_row(guid, bucket, agg))
+                    if len(page) >= self.page_size:
+                        yield page
+                        page = []
+                bucket, agg = begins, list(values[1:])
+            if agg is not None:
+                page.append(self.bucket_row(guid, bucket, agg))
+        if page:
+            yield page
+
+    def event_values(self, guid: str, start: datetime):
+        """Each event as (timestamp, and the aggregate of it alone)."""
+        after_time, after_id = None, None
+        while True:
+            with self.db_session.session_context() as db:
+                page = EventCrudHandler(db).get_events_page(guid, start, self.end, after_time, after_id,
+                                                            self.page_size)
+            for row_id, timestamp, value, _, _ in page:
+                if value is not None:
+                    yield timestamp, 1, value, value, value, value, timestamp
+            if len(page) < self.page_size:
+                return
+            after_time, after_id = page[-1][1], page[-1][0]
+
+    def rollup_values(self, guid: str, start: datetime):
+        """Each rollup window as (window start, and its aggregate)."""
+        seconds, model = self.rollup
+        # Rollup times are naive UTC, the query bounds naive local time.
+        start, end = utc(start.timestamp()), utc(self.end.timestamp())
+        after_bucket = None
+        while True:
+            with self.db_session.session_context() as db:
+                page = EventCrudHandler(db).get_rollups_page(model, guid, start, end, after_bucket, self.page_size)
+            # The mysql DOUBLE columns read back as Decimal.
+            for bucket, count, minimum, maximum, total, last, last_time in page:
+                yield (bucket.replace(tzinfo=timezone.utc), count, float(minimum), float(maximum), float(total),
+                       float(last), last_time)
+            if len(page) < self.page_size:
+                return
+            after_bucket = page[-1][0]
+
+    def bucket_row(self, guid: str, bucket: float, agg: list) -> dict:
+        values = {"count": agg[COUNT], "avg": agg[SUM] / agg[COUNT], "min": agg[MIN], "max": agg[MAX],
+                  "last": agg[LAST]}
+        return {"guid": guid, "bucket": datetime.fromtimestamp(bucket),
+                **{name: values[name] for name in self.aggregates}}
+
+    def resume_point(self, guid: str) -> tuple:
+        """(time, id) to continue after for guid, (None, None) to start at the beginning, (False, None) to skip."""
+        if self.after is None:
+            return None, None
+        after_guid, after_time, after_id = self.after
+        if guid < after_guid:
+            return False, None
+        if guid == after_guid:
+            return after_time, after_id
+        return None, None
+
+
+def ndjson_stream(query: HistoryQuery):
+    """One JSON object per line and page, ending with {"next": cursor} when limit cut the result short."""
+    for page in query.pages():
+        yield b"".join(codec.dumps({name: value.isoformat() if isinstance(value, datetime) else value
+                                    for name, value in row.items()}) + b"\n" for row in page)
+    if query.next_cursor is not None:
+        yield codec.dumps({"next": query.next_cursor}) + b"\n"
+
+
+def arrow_schema(query: HistoryQuery):
+    types = {"guid": pyarrow.string(), "id": pyarrow.int64(), "timestamp": pyarrow.timestamp("us"),
+             "value": pyarrow.float64(), "reliability": pyarrow.string(), "priority": pyarrow.string(),
+             "bucket": pyarrow.timestamp("us"), "count": pyarrow.int64(), "avg": pyarrow.float64(),
+             "min": pyarrow.float64(), "max": pyarrow.float64(), "last": pyarrow.float64()}
+    return pyarrow.schema([(name, types[name]) for name in query.columns()])
+
+
+def arrow_stream(query: HistoryQuery):
+    """An Arrow IPC stream with one record batch per page.
+
+    When limit cut the result short, an empty last batch carries the cursor under "next" in its custom metadata.
+    """
+    schema = arrow_schema(query)
+    buffer = io.BytesIO()
+    writer = pyarrow.ipc.new_stream(buffer, schema)
+    for page in query.pages():
+        writer.write_batch(pyarrow.RecordBatch.from_pylist(page, schema=schema))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if query.next_cursor is not None:
+        writer.write_batch(pyarrow.RecordBatch.from_pylist([], schema=schema),
+                           custom_metadata={"next": query.next_cursor})
+    writer.close()
+    yield buffer.getvalue()
@@ -0,0 +1,171 @@
+import logging
+import os
+import pickle
+import threading
+from array import array
+from datetime import datetime
+
+from app.core.config import config
+from app.models.EventUpdateObject import StreamRecord
+
+logger = logging.getLogger(__name__)
+
+
+class LatestValueStore:
+    """Latest value of each GUID in fixed-size parallel arrays, one slot per GUID.
+
+    Memory is allocated once for capacity GUIDs; GUIDs seen after the store is full are counted in rejected and
+    not stored. Reliability and priority strings are kept as small integer codes.
+    """
+    name = "latest"
+
+    def __init__(self, capacity: int = config.LATEST_VALUES_CAPACITY,
+                 snapshot_path: str = config.LATEST_VALUES_SNAPSHOT,
+                 snapshot_interval: float = config.LATEST_VALUES_SNAPSHOT_INTERVAL):
+        """
+        :param capacity: Maximum number of GUIDs held.
+        :param snapshot_path: File the store is saved to on stop and loaded from on start. Empty to disable.
+        :param snapshot_interval: Seconds between periodic snapshots while running. 0 to only save on stop.
+        """
+        self.capacity = capacity
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.values = array("d", bytes(8 * capacity))
+        self.timestamps = array("d", bytes(8 * capacity))
+        self.reliability = array("H", bytes(2 * capacity))
+        self.priority = array("H", bytes(2 * capacity))
+        self.event_ids = [None] * capacity
+        self.guids = [None] * capacity
+        self.slots = {}
+        self.codes = {None: 0}
+        self.names = [None]
+        self.updates = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self.slots)
+
+    def add_record(self, record: StreamRecord):
+        batch = record.batch
+        if not batch:
+            return
+        timestamp = record.received_at.timestamp()
+        with self._lock:
+            for i in range(len(batch)):
+                guid = batch.guids[i]
+                slot = self.slots.get(guid)
+                if slot is None:
+                    slot = len(self.slots)
+                    if slot >= self.capacity:
+                        self.rejected += 1
+                        continue
+                    self.slots[guid] = slot
+                    self.guids[slot] = guid
+                self.values[slot] = batch.values[i]
+                self.timestamps[slot] = timestamp
+                self.reliability[slot] = self._code(batch.reliability[i])
+                self.priority[slot] = self._code(batch.priority[i])
+                self.event_ids[slot] = record.item_event_id(i)
+                self.updates += 1
+
+    def _code(self, name) -> int:
+        code = self.codes.get(name)
+        if code is None:
+            code = len(self.names)
+            self.codes[name] = code
+            self.names.append(name)
+        return code
+
+    def get(self, guid: str):
+        with self._lock:
+            slot = self.slots.get(guid)
+            if slot is None:
+                return None
+            return self._read(slot)
+
+    def get_many(self, guids: list) -> dict:
+        with self._lock:
+            return {guid: self._read(self.slots[guid]) for guid in guids if guid in self.slots}
+
+    def get_all(self) -> list:
+        with self._lock:
+            return [self._read(slot) for slot in self.slots.values()]
+
+    def _read(self, slot: int) -> dict:
+        return {
+            "guid": self.guids[slot],
+            "value": self.values[slot],
+            "reliability": self.names[self.reliability[slot]],
+            "priority": self.names[self.priority[slot]],
+            "timestamp": datetime.fromtimestamp(self.timestamps[slot]).isoformat(),
+            "eventId": self.event_ids[slot],
+        }
+
+    def stats(self) -> dict:
+        return {"guids": len(self.slots), "capacity": self.capacity, "updates": self.updates,
+                "rejected": self.rejected}
+
+    def start(self):
+        if self.snapshot_path and os.path.exists(self.snapshot_path) and not self.slots:
+            self.load(self.snapshot_path)
+        if self.snapshot_path and self.snapshot_interval > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="latest-snapshot", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.snapshot_path:
+            self.save(self.snapshot_path)
+
+    def _run(self):
+        while not self._stop.wait(self.snapshot_interval):
+            self.save(self.snapshot_path)
+
+    def save(self, path: str):
+        """Write the store to path atomically, so a crash mid-write leaves the previous snapshot intact."""
+        with self._lock:
+            count = len(self.slots)
+            state = {
+                "guids": self.guids[:count],
+                "values": self.values[:count],
+                "timestamps": self.timestamps[:count],
+                "reliability": self.reliability[:count],
+                "priority": self.priority[:count],
+                "event_ids": self.event_ids[:count],
+                "names": list(self.names),
+            }
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(f"{path}.tmp", "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(f"{path}.tmp", path)
+            logger.info(f"Saved {count} latest values to {path}")
+        except Exception as e:
+            logger.error(f"Error saving latest values snapshot: {e}")
+
+    def load(self, path: str):
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+        except Exception as e:
+            logger.error(f"Error loading latest values snapshot: {e}")
+            return
+        count = min(len(state["guids"]), self.capacity)
+        with self._lock:
+            self.names = state["names"]
+            self.codes = {name: code for code, name in enumerate(self.names)}
+            self.guids[:count] = state["guids"][:count]
+            self.values[:count] = state["values"][:count]
+            self.timestamps[:count] = state["timestamps"][:count]
+            self.reliability[:count] = state["reliability"][:count]
+            self.priority[:count] = state["priority"][:count]
+            self.event_ids[:count] = state["event_ids"][:count]
+            self.slots = {guid: slot for slot, guid in enumerate(self.guids[:count])}
+        logger.info(f"Loaded {count} latest values from {path}")
@@ -0,0 +1,190 @@
+import logging
+import os
+import threading
+from collections import deque
+
+from app.core.config import config
+from app.util.outbox import Outbox
+
+logger = logging.getLogger(__name__)
+
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+SPILL = "spill"
+POLICIES = (BLOCK, DROP_OLDEST, SPILL)
+
+
+class BoundedQueue:
+    """FIFO queue with a fixed capacity and a policy for what happens when it is full."""
+
+    def __init__(self, maxsize: int, policy: str = BLOCK, spill_dir: str = None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.spill = Outbox(spill_dir) if policy == SPILL else None
+        self.dropped = 0
+        self.spilled = 0
+        self._items = deque()
+        self._spill_position = None
+        self._spill_loaded = 0
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+
+    def put(self, item):
+        with self._lock:
+            if self.spill is not None and self.spill.pending:
+                # Keep FIFO order: once something is on disk, newer records queue up behind it.
+                self._spill(item)
+                return
+            if len(self._items) >= self.maxsize:
+                if self.policy == BLOCK:
+                    while len(self._items) >= self.maxsize:
+                        self._not_full.wait()
+                elif self.policy == DROP_OLDEST:
+                    self._items.popleft()
+                    self.dropped += 1
+                else:
+                    self._spill(item)
+                    return
+            self._items.append(item)
+            self._not_empty.notify()
+
+    def get(self, timeout: float = None):
+        """Return the next item, or None if nothing arrived within timeout."""
+        with self._lock:
+            if not self._items and self.spill is not None and self.spill.pending:
+                records, self._spill_position = self.spill.read(self.maxsize)
+                self._spill_loaded = len(records)
+                self._items.extend(records)
+            if not self._items and not self._not_empty.wait(timeout):
+                return None
+            if not self._items:
+                return None
+            item = self._items.popleft()
+            if self._spill_position is not None and not self._items:
+                # Read back records stay in the spill until all of them are taken, so a crash or stop before
+                # that finds them on disk again.
+                self.spill.commit(self._spill_position)
+                self._spill_position = None
+                self._spill_loaded = 0
+            self._not_full.notify()
+            return item
+
+    def depth(self) -> int:
+        return len(self._items)
+
+    def spill_depth(self) -> int:
+        if self.spill is None:
+            return 0
+        # Records read back into memory are still pending in the spill until all of them are taken.
+        return self.spill.pending - self._spill_loaded
+
+    def _spill(self, item):
+        self.spill.append(item)
+        self.spilled += 1
+        self._not_empty.notify()
+
+
+class SinkWorkerPool:
+    """A named sink fed from its own bounded queue by a pool of worker threads."""
+
+    def __init__(self, name: str, handler, workers: int, queue: BoundedQueue):
+        """
+        :param name: Sink name used for thread names and stats.
+        :param handler: Callable invoked with each record.
+        :param workers: Number of threads draining the queue. Use 1 when record order matters.
+        :param queue: Bounded queue feeding this sink.
+        """
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.queue = queue
+        self.enqueued = 0
+        self.processed = 0
+        self.errors = 0
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Signal the workers to exit once the queue is drained and wait for them."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def submit(self, record):
+        self.queue.put(record)
+        self.enqueued += 1
+
+    def _run(self):
+        while True:
+            record = self.queue.get(timeout=0.1)
+            if record is None:
+                if self._stop.is_set() and not self.queue.depth() and not self.queue.spill_depth():
+                    return
+                continue
+            try:
+                self.handler(record)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error in {self.name} sink: {e}")
+            self.processed += 1
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.queue.depth(),
+            "spill_depth": self.queue.spill_depth(),
+            "capacity": self.queue.maxsize,
+            "policy": self.queue.policy,
+            "workers": self.workers,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "dropped": self.queue.dropped,
+            "spilled": self.queue.spilled,
+            "errors": self.errors,
+        }
+
+
+class EventPipeline:
+    """Fans parsed stream records out to per-sink queues so the SSE reader never waits on a sink."""
+
+    def __init__(self, queue_size: int = config.PIPELINE_QUEUE_SIZE, policy: str = config.PIPELINE_BACKPRESSURE,
+                 spill_dir: str = config.PIPELINE_SPILL_DIR):
+        self.queue_size = queue_size
+        self.policy = policy
+        self.spill_dir = spill_dir
+        self.sinks = {}
+        self.running = False
+
+    def register(self, name: str, handler, workers: int = 1):
+        queue = BoundedQueue(self.queue_size, self.policy, os.path.join(self.spill_dir, name))
+        self.sinks[name] = SinkWorkerPool(name, handler, workers, queue)
+
+    def start(self):
+        for sink in self.sinks.values():
+            sink.start()
+        self.running = True
+        logger.info(f"Event pipeline started with sinks: {list(self.sinks)} ({self.policy})")
+
+    def stop(self):
+        """Stop accepting records and wait for every sink to drain its queue."""
+        self.running = False
+        for sink in self.sinks.values():
+            sink.stop()
+        logger.info("Event pipeline stopped")
+
+    def publish(self, record):
+        for sink in self.sinks.values():
+            sink.submit(record)
+
+    def stats(self) -> dict:
+        return {name: sink.stats() for name, sink in self.sinks.items()}
@@ -0,0 +1,82 @@
+import logging
+import time
+from datetime import date, datetime, timedelta
+
+from app.core.config import config
+from app.db.CRUDHandle import EventCrudHandler
+from app.db.models import Event, EventId
+from app.services.cron_jobs import start_cron_job
+from app.sinks.rollup import RESOLUTIONS, utc
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionJob:
+    """Periodically removes raw events and rollups past their retention.
+
+    When the events table is partitioned by day, old days are removed by dropping their partitions and new day
+    partitions are created partitions_ahead days in advance, and their eventIds are deleted from event_ids; otherwise
+    old events are deleted row by row.
+    """
+    name = "retention"
+
+    def __init__(self, db_session, interval_minutes: int = config.RETENTION_INTERVAL,
+                 partitions_ahead: int = config.EVENTS_PARTITIONS_AHEAD):
+        """
+        :param db_session: DBSession used for the retention statements.
+        :param interval_minutes: Minutes between passes. 0 disables the job.
+        :param partitions_ahead: Days ahead of today that must have a partition.
+        """
+        self.db_session = db_session
+        self.interval_minutes = interval_minutes
+        self.partitions_ahead = partitions_ahead
+        self.scheduler = None
+
+    def start(self):
+        if self.interval_minutes > 0 and self.scheduler is None:
+            self.scheduler = start_cron_job(self.run, self.interval_minutes)
+
+    def stop(self):
+        if self.scheduler is not None:
+            self.scheduler.shutdown(wait=False)
+            self.scheduler = None
+
+    def run(self):
+        try:
+            with self.db_session.session_context() as db:
+                crud_session = EventCrudHandler(db)
+                partitions = crud_session.get_event_partitions()
+                if partitions:
+                    self.extend_partitions(crud_session, partitions)
+                    if config.EVENTS_RETENTION_DAYS > 0:
+                        self.drop_expired_partitions(crud_session, partitions)
+                elif config.EVENTS_RETENTION_DAYS > 0:
+                    cutoff = datetime.now() - timedelta(days=config.EVENTS_RETENTION_DAYS)
+                    deleted = crud_session.delete_before(Event, "timestamp", cutoff)
+                    logger.info(f"Deleted {deleted} raw events past retention")
+                for name, (_, model, days) in RESOLUTIONS.items():
+                    if days > 0:
+                        deleted = crud_session.delete_before(model, "bucket", utc(time.time()) - timedelta(days=days))
+                        logger.info(f"Deleted {deleted} {name} rollups past retention")
+        except Exception as e:
+            logger.error(f"Error applying retention: {e}")
+
+    def extend_partitions(self, crud_session, partitions: dict):
+        days = [datetime.strptime(name[1:], "%Y%m%d").date() for name in partitions
+                if name[1:].isdigit() and len(name) == 9]
+        first = max(days) + timedelta(days=1) if days else date.today()
+        missing = [first + timedelta(days=offset)
+                   for offset in range((date.today() + timedelta(days=self.partitions_ahead) - first).days + 1)]
+        if missing:
+            crud_session.add_event_partitions(missing)
+            logger.info(f"Added {len(missing)} event partitions up to {missing[-1]}")
+
+    def drop_expired_partitions(self, crud_session, partitions: dict):
+        """Drop the partitions whose rows are all older than the retention cutoff."""
+        cutoff = (datetime.now() - timedelta(days=config.EVENTS_RETENTION_DAYS)).timestamp()
+        expired = [name for name, bound in partitions.items() if bound is not None and bound <= cutoff]
+        if expired:
+            crud_session.drop_event_partitions(expired)
+            logger.info(f"Dropped {len(expired)} event partitions past retention: {', '.join(expired)}")
+        deleted = crud_session.delete_before(EventId, "timestamp", datetime.fromtimestamp(cutoff))
+        logger.info(f"Deleted {deleted} event ids past retention")
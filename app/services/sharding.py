@@ -0,0 +1,352 @@
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+
+from app.core.config import config
+from app.db.CRUDHandle import EventCrudHandler
+from app.util.metrics import Family, registry
+
+logger = logging.getLogger(__name__)
+
+
+def shard_of(guid: str, shards: list) -> int:
+    """Rendezvous hashing: the shard with the highest score for guid owns it.
+
+    When a shard leaves, only its own GUIDs move and they spread over the others; when it comes back, exactly
+    those GUIDs return to it.
+    """
+    return max(shards, key=lambda shard: hashlib.blake2b(f"{shard}:{guid}".encode(), digest_size=8).digest())
+
+
+def assign(guids: list, shards: list) -> dict:
+    """Split guids over shards. Every shard gets a list, possibly empty."""
+    assignment = {shard: [] for shard in shards}
+    if shards:
+        for guid in guids:
+            assignment[shard_of(guid, shards)].append(guid)
+    return assignment
+
+
+def merge_stats(reports: list) -> dict:
+    """Sum the numbers of several /stats dicts key by key.
+
+    Timestamps (keys ending in _at) keep the earliest value and anything else that is not a number the last one.
+    """
+    merged = {}
+    for report in reports:
+        for key, value in report.items():
+            if isinstance(value, dict):
+                merged[key] = merge_stats([merged.get(key) or {}, value])
+            elif not isinstance(value, (int, float)) or isinstance(value, bool) or merged.get(key) is None:
+                merged[key] = value
+            elif key.endswith("_at"):
+                merged[key] = min(merged[key], value)
+            else:
+                merged[key] += value
+    return merged
+
+
+def run_shard(shard: int, commands, reports):
+    """Entry point of a shard process: stream the GUIDs the coordinator assigns and report stats back."""
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s shard-{shard} %(name)s %(levelname)s %(message)s")
+    # Imported here so the coordinator's process does not build sinks or connect anywhere on import.
+    from app.services.stream_factory import build_stream
+    stack = build_stream(engine="sync", shard=shard)
+    registry.register_collector(stack.metric_families)
+    started = False
+    guids = []
+    while True:
+        try:
+            command, payload = commands.get(timeout=config.SHARD_HEARTBEAT_INTERVAL)
+        except queue.Empty:
+            command, payload = None, None
+        if command == "stop":
+            break
+        if command == "assign":
+            guids = payload
+            stack.streaming_manager.assign(guids)
+            if not started:
+                started = stack.stream_runner.start()
+        try:
+            reports.put((time.time(), {**stack.stats(), "guids": len(guids)}, registry.collect()))
+        except Exception as e:
+            logger.error(f"Error reporting shard stats: {e}")
+    if started:
+        stack.stream_runner.stop()
+
+
+class Shard:
+    def __init__(self, shard: int):
+        self.shard = shard
+        self.process = None
+        self.commands = None
+        self.reports = None
+        # None until the shard process was sent its first assignment.
+        self.guids = None
+        self.stats = {}
+        self.metrics = []
+        self.started_at = None
+        self.last_seen = None
+        self.restarts = 0
+        self.down_since = None
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def status(self) -> dict:
+        return {
+            "alive": self.is_alive(),
+            "pid": self.process.pid if self.process is not None else None,
+            "guids": len(self.guids or []),
+            "started_at": self.started_at,
+            "last_seen": self.last_seen,
+            "restarts": self.restarts,
+            "stream": self.stats.get("stream", {}),
+        }
+
+
+class ShardCoordinator:
+    """Splits the active subscriptions over shard_count shard processes, each with its own stream and sinks.
+
+    Shards report their stats every SHARD_HEARTBEAT_INTERVAL seconds. A shard whose process exited or that has not
+    reported for heartbeat_timeout seconds is killed, its GUIDs are moved to the other shards and it is restarted
+    after restart_delay; on its return it takes its GUIDs back. The subscriptions table is re-read every
+    rebalance_interval seconds and on request, so new subscriptions reach a shard without a restart.
+
+    It stands in for the StreamRunner (start/stop/status) and, in the subscription API, for the StreamingManager.
+    """
+    name = "shards"
+
+    def __init__(self, db_session, shard_count: int = config.SHARD_COUNT, components=(),
+                 heartbeat_timeout: float = config.SHARD_HEARTBEAT_TIMEOUT,
+                 rebalance_interval: float = config.SHARD_REBALANCE_INTERVAL,
+                 restart_delay: float = config.SHARD_RESTART_DELAY):
+        """
+        :param db_session: DBSession the subscriptions are read from and written to.
+        :param shard_count: Number of shard processes.
+        :param components: Components run once for all shards in this process, e.g. the retention job.
+        :param heartbeat_timeout: Seconds without a report after which a shard is considered hung.
+        :param rebalance_interval: Seconds between reads of the subscriptions table.
+        :param restart_delay: Seconds before a dead shard is started again.
+        """
+        self.db_session = db_session
+        self.components = list(components)
+        self.heartbeat_timeout = heartbeat_timeout
+        self.rebalance_interval = rebalance_interval
+        self.restart_delay = restart_delay
+        self.shards = [Shard(shard) for shard in range(shard_count)]
+        self.state = "stopped"
+        self.started_at = None
+        self.error = None
+        self.rebalances = 0
+        self.bulk_subscriber = None
+        self._context = multiprocessing.get_context("spawn")
+        self._guids = []
+        self._rebalance = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> bool:
+        with self._lock:
+            if self.is_running():
+                return False
+            for component in self.components:
+                component.start()
+            for shard in self.shards:
+                self._spawn(shard)
+            self._stop.clear()
+            self._rebalance.set()
+            self.state = "streaming"
+            self.started_at = time.time()
+            self.error = None
+            self._thread = threading.Thread(target=self._run, name="shard-coordinator", daemon=True)
+            self._thread.start()
+            logger.info(f"Started {len(self.shards)} shards")
+            return True
+
+    def stop(self, timeout: float = 30) -> bool:
+        with self._lock:
+            if self._thread is None:
+                return False
+            self.state = "stopping"
+            self._stop.set()
+            self._rebalance.set()
+            self._thread.join(timeout)
+            self._thread = None
+            for shard in self.shards:
+                if shard.is_alive():
+                    shard.commands.put(("stop", None))
+            deadline = time.monotonic() + timeout
+            for shard in self.shards:
+                if shard.process is not None:
+                    shard.process.join(max(0.0, deadline - time.monotonic()))
+                    if shard.process.is_alive():
+                        logger.warning(f"Shard {shard.shard} did not stop within {timeout}s, terminating it")
+                        shard.process.terminate()
+            for component in reversed(self.components):
+                component.stop()
+            self.state = "stopped"
+            logger.info("Shards stopped")
+            return True
+
+    async def start_async(self) -> bool:
+        return await asyncio.to_thread(self.start)
+
+    async def stop_async(self) -> bool:
+        return await asyncio.to_thread(self.stop)
+
+    def status(self) -> dict:
+        streams = [shard.stats.get("stream", {}) for shard in self.shards]
+        return {
+            "state": self.state,
+            "running": self.is_running(),
+            "started_at": self.started_at,
+            "shards": len(self.shards),
+            "alive": sum(shard.is_alive() for shard in self.shards),
+            "reconnects": sum(stream.get("reconnects") or 0 for stream in streams),
+            "rebalances": self.rebalances,
+            "error": self.error,
+        }
+
+    def shard_status(self) -> dict:
+        return {shard.shard: shard.status() for shard in self.shards}
+
+    def stats(self) -> dict:
+        """Stats of all shards summed, in the shape of a single stream's."""
+        merged = merge_stats([{key: value for key, value in shard.stats.items() if key != "stream"}
+                              for shard in self.shards if shard.stats])
+        return {**merged, "stream": self.status(), "shards": self.shard_status()}
+
+    def metric_families(self) -> list:
+        """Collector for the metrics registry: the shards' last reported metrics, labelled with their shard."""
+        families = [Family("metasys_shard_up", "gauge", "1 if the shard process is alive")]
+        for shard in self.shards:
+            families[0].add(int(shard.is_alive()), shard=shard.shard)
+            for family in shard.metrics:
+                families.append(Family(family.name, family.kind, family.help, [
+                    (suffix, (("shard", shard.shard),) + labels, value) for suffix, labels, value in family.samples]))
+        return families
+
+    def request_rebalance(self):
+        """Re-read the subscriptions table and reassign on the next pass instead of waiting for the interval."""
+        self._rebalance.set()
+
+    # The subscription API calls these in sharded mode; the shards subscribe what the table says.
+    @property
+    def active_subscriptions(self) -> dict:
+        return {guid: True for guid in self._guids}
+
+    def subscribe(self, guid: str) -> bool:
+        with self.db_session.session_context() as db:
+            crud_session = EventCrudHandler(db)
+            if guid in crud_session.get_subscriptions():
+                return False
+            crud_session.add_subscriptions([guid])
+        self.request_rebalance()
+        return True
+
+    def start_bulk_subscription(self, guids: list) -> bool:
+        with self.db_session.session_context() as db:
+            EventCrudHandler(db).add_subscriptions(guids)
+        self.request_rebalance()
+        return True
+
+    def unsubscribe(self, guid: str) -> bool:
+        with self.db_session.session_context() as db:
+            crud_session = EventCrudHandler(db)
+            if guid not in crud_session.get_subscriptions():
+                return False
+            crud_session.deactivate_subscriptions([guid])
+        self.request_rebalance()
+        return True
+
+    def find_subscriptions(self, prefix: str = "", reference: str = "", limit: int = 100) -> list:
+        # Shards keep no subscription registry and learn no itemReferences, so only GUID prefixes can be searched.
+        if reference:
+            return []
+        return [{"guid": guid, "itemReference": None} for guid in sorted(self._guids)
+                if guid.startswith(prefix)][:limit]
+
+    def _spawn(self, shard: Shard):
+        # Queues of its own, so a shard killed while holding a queue's lock cannot block the others.
+        shard.commands = self._context.Queue()
+        shard.reports = self._context.Queue()
+        shard.process = self._context.Process(target=run_shard, args=(shard.shard, shard.commands, shard.reports),
+                                              name=f"shard-{shard.shard}", daemon=True)
+        shard.process.start()
+        shard.started_at = time.time()
+        shard.last_seen = time.time()
+        shard.down_since = None
+        shard.guids = None
+        logger.info(f"Started shard {shard.shard} (pid {shard.process.pid})")
+
+    def _run(self):
+        next_read = 0.0
+        while not self._stop.is_set():
+            try:
+                self._drain_reports()
+                changed = self._check_shards()
+                if self._rebalance.is_set() or time.monotonic() >= next_read:
+                    self._rebalance.clear()
+                    self._guids = self._read_guids()
+                    next_read = time.monotonic() + self.rebalance_interval
+                    changed = True
+                if changed:
+                    self._reassign()
+            except Exception as e:
+                logger.error(f"Shard coordinator failed: {e}")
+                self.error = str(e)
+            self._rebalance.wait(config.SHARD_HEARTBEAT_INTERVAL)
+
+    def _drain_reports(self):
+        for shard in self.shards:
+            while shard.down_since is None:
+                try:
+                    shard.last_seen, shard.stats, shard.metrics = shard.reports.get_nowait()
+                except queue.Empty:
+                    break
+
+    def _check_shards(self) -> bool:
+        """Retire dead or hung shards and restart the ones that were down long enough. True if any changed."""
+        changed = False
+        now = time.time()
+        for shard in self.shards:
+            if shard.down_since is None:
+                if shard.is_alive() and now - shard.last_seen < self.heartbeat_timeout:
+                    continue
+                logger.warning(f"Shard {shard.shard} is down, moving its {len(shard.guids or [])} GUIDs to the others")
+                if shard.is_alive():
+                    shard.process.terminate()
+                shard.down_since = now
+                shard.stats = {}
+                shard.metrics = []
+                changed = True
+            elif now - shard.down_since >= self.restart_delay:
+                shard.restarts += 1
+                self._spawn(shard)
+                changed = True
+        return changed
+
+    def _read_guids(self) -> list:
+        with self.db_session.session_context() as db:
+            return EventCrudHandler(db).get_subscriptions()
+
+    def _reassign(self):
+        live = [shard.shard for shard in self.shards if shard.down_since is None]
+        assignment = assign(self._guids, live)
+        for shard in self.shards:
+            if shard.shard in assignment and assignment[shard.shard] != shard.guids:
+                shard.guids = assignment[shard.shard]
+                shard.commands.put(("assign", shard.guids))
+            elif shard.shard not in assignment:
+                shard.guids = None
+        self.rebalances += 1
+        logger.info(f"Assigned {len(self._guids)} GUIDs to {len(live)} shards")
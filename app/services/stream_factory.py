@@ -0,0 +1,185 @@
+import logging
+import os
+from dataclasses import dataclass, field
+
+import httpx
+
+from app.core.config import config
+from app.db.dependency import db_session
+from app.services.async_streaming_manager import AsyncStreamingManager
+from app.services.auth_scheduler import AuthScheduler
+from app.services.backfill import BackfillEngine
+from app.services.deadband import DeadbandFilter
+from app.services.fanout import FanoutHub
+from app.services.latest_values import LatestValueStore
+from app.services.pipeline import EventPipeline
+from app.services.stream_runner import AsyncStreamRunner, StreamRunner
+from app.services.streaming_manager import StreamingManager
+from app.services.subscription_registry import SubscriptionRegistry
+from app.services.token_manager import TokenManager
+from app.sinks.influx import AsyncInfluxLineProtocolSink, InfluxLineProtocolSink
+from app.sinks.mqtt import SparkplugMQTTSink
+from app.sinks.mysql import MySQLEventSink
+from app.sinks.redis import RedisCheckpointSink
+from app.sinks.rollup import RollupEngine
+from app.util.metrics import Family
+from app.util.mqtt_utils import mqtt_utils
+from app.util.outbox import Outbox
+from app.util.redis_utils import redis_util
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StreamStack:
+    """Everything that reads one Metasys stream: the manager, its runner and the sinks it feeds."""
+    token_manager: TokenManager
+    streaming_manager: StreamingManager
+    stream_runner: StreamRunner
+    latest_values: LatestValueStore
+    auth: AuthScheduler
+    sinks: list
+    pipeline: EventPipeline = None
+    deadband: DeadbandFilter = None
+    rollup: RollupEngine = None
+    backfill: BackfillEngine = None
+    subscriptions: SubscriptionRegistry = None
+    fanout: FanoutHub = None
+    http_clients: list = field(default_factory=list)
+
+    def stats(self) -> dict:
+        return {
+            "stream": self.stream_runner.status(),
+            "auth": self.auth.stats(),
+            "sinks": {sink.name: {**sink.metrics.snapshot(), "pending": sink.pending(),
+                                  "outbox": sink.outbox.stats() if sink.outbox is not None else None}
+                      for sink in self.sinks},
+            "queues": self.pipeline.stats() if self.pipeline is not None else {},
+            "deadband": self.deadband.stats() if self.deadband is not None else {},
+            "rollup": self.rollup.stats() if self.rollup is not None else {},
+            "backfill": self.backfill.stats() if self.backfill is not None else {},
+            "subscriptions": self.subscriptions.stats() if self.subscriptions is not None else {},
+            "fanout": self.fanout.stats() if self.fanout is not None else {},
+        }
+
+    def metric_families(self) -> list:
+        """Collector for the metrics registry: the counters and depths the components already keep."""
+        rows = Family("metasys_sink_rows_total", "counter", "Rows handled by each sink, by outcome")
+        failures = Family("metasys_sink_failures_total", "counter", "Failed sink writes")
+        pending = Family("metasys_sink_pending_rows", "gauge", "Rows buffered in a sink awaiting a write")
+        outbox = Family("metasys_outbox_pending_entries", "gauge", "Batches waiting in a sink's outbox")
+        for sink in self.sinks:
+            metrics = sink.metrics
+            for outcome in ("written", "ignored", "failed", "spilled", "replayed"):
+                rows.add(getattr(metrics, f"rows_{outcome}"), sink=sink.name, outcome=outcome)
+            failures.add(metrics.failures, sink=sink.name)
+            pending.add(sink.pending(), sink=sink.name)
+            if sink.outbox is not None:
+                outbox.add(sink.outbox.pending, sink=sink.name)
+        families = [rows, failures, pending, outbox,
+                    Family("metasys_stream_reconnects_total", "counter", "Stream reconnects").add(
+                        self.streaming_manager.reconnects),
+                    Family("metasys_latest_values", "gauge", "GUIDs held in the latest value store").add(
+                        len(self.latest_values)),
+                    Family("metasys_auth_logins_total", "counter", "Logins to the Metasys API").add(
+                        self.token_manager.logins),
+                    Family("metasys_auth_refreshes_total", "counter", "Token refreshes").add(
+                        self.token_manager.refreshes)]
+        if self.pipeline is not None:
+            depth = Family("metasys_queue_depth", "gauge", "Records waiting in a pipeline queue, in memory and spilled")
+            dropped = Family("metasys_queue_dropped_total", "counter", "Records dropped by a full pipeline queue")
+            for name, pool in self.pipeline.sinks.items():
+                depth.add(pool.queue.depth(), queue=name, where="memory")
+                depth.add(pool.queue.spill_depth(), queue=name, where="spill")
+                dropped.add(pool.queue.dropped, queue=name)
+            families += [depth, dropped]
+        if self.subscriptions is not None:
+            families.append(Family("metasys_subscriptions", "gauge", "GUIDs subscribed").add(len(self.subscriptions)))
+        if self.fanout is not None:
+            families.append(Family("metasys_fanout_clients", "gauge", "Connected live clients").add(len(self.fanout)))
+        if self.deadband is not None:
+            families.append(Family("metasys_deadband_updates_total", "counter", "Updates seen by the deadband filter")
+                            .add(self.deadband.forwarded, outcome="forwarded")
+                            .add(self.deadband.suppressed, outcome="suppressed"))
+        return families
+
+
+def build_stream(engine: str = config.STREAM_ENGINE, shard: int = None, components=()) -> StreamStack:
+    """Wire a streaming manager, its sinks and its runner.
+
+    :param engine: "sync" or "async".
+    :param shard: Shard id when running as one of several shard processes. Keeps the shard's Redis keys, outbox
+                  and spill directories, latest value snapshot and Sparkplug edge node apart from the others'.
+    :param components: Extra components started before the stack's own, e.g. the retention job.
+    """
+    suffix = "" if shard is None else f"shard-{shard}"
+    redis_prefix = "" if shard is None else f"{suffix}:"
+    token_manager = TokenManager()
+    mysql_sink = MySQLEventSink(db_session=db_session)
+    redis_sink = RedisCheckpointSink(redis_util=redis_util, redis_prefix=redis_prefix)
+    snapshot = config.LATEST_VALUES_SNAPSHOT
+    latest_values = LatestValueStore(snapshot_path=f"{snapshot}.{suffix}" if snapshot and suffix else snapshot)
+    deadband = DeadbandFilter.from_config() if config.DEADBAND_ENABLED else None
+    mqtt_sink = None
+    if config.MQTT_ENABLED:
+        edge_node_id = config.SPARKPLUG_EDGE_NODE_ID if shard is None else f"{config.SPARKPLUG_EDGE_NODE_ID}-{shard}"
+        mqtt_sink = SparkplugMQTTSink(mqtt_util=mqtt_utils, edge_node_id=edge_node_id)
+    rollup = RollupEngine(db_session=db_session) if config.ROLLUP_ENABLED else None
+    optional_sinks = [sink for sink in (mqtt_sink, rollup) if sink is not None]
+    backfill = None
+    # A shard streams what the coordinator assigns it, so only a lone stream keeps the subscriptions itself.
+    subscriptions = SubscriptionRegistry(db_session=db_session) if shard is None else None
+    # Live clients connect to the app process, which has no stream of its own in sharded mode.
+    fanout = FanoutHub(latest_values) if config.FANOUT_ENABLED and shard is None else None
+    http_clients = []
+    pipeline = None
+    if engine == "async":
+        # One pooled client per upstream, shared by the stream, the API handlers and the sinks on the app's loop.
+        metasys_client = httpx.AsyncClient(base_url=config.METASYS_SERVER, timeout=config.HTTP_TIMEOUT,
+                                           limits=httpx.Limits(max_connections=config.METASYS_MAX_CONNECTIONS))
+        influx_client = httpx.AsyncClient(timeout=config.HTTP_TIMEOUT,
+                                          limits=httpx.Limits(max_connections=config.INFLUXDB_MAX_CONNECTIONS))
+        http_clients = [metasys_client, influx_client]
+        influx_sink = AsyncInfluxLineProtocolSink(client=influx_client)
+        # Stopped in reverse, so the Redis sink writes the checkpoint of MySQL's final flush.
+        sinks = [redis_sink, mysql_sink, influx_sink] + optional_sinks
+        if config.BACKFILL_ENABLED:
+            backfill = BackfillEngine(token_manager, db_session, mysql_sink, influx_sink, latest_values, rollup)
+        streaming_manager = AsyncStreamingManager(token_manager=token_manager, db_session=db_session,
+                                                  redis_util=redis_util, mqtt_utils=mqtt_utils, mysql_sink=mysql_sink,
+                                                  influx_sink=influx_sink, redis_sink=redis_sink,
+                                                  latest_values=latest_values, metasys_client=metasys_client,
+                                                  mqtt_sink=mqtt_sink, deadband=deadband, rollup=rollup,
+                                                  redis_prefix=redis_prefix, backfill=backfill,
+                                                  subscriptions=subscriptions, fanout=fanout)
+        auth = AuthScheduler(token_manager, keepalive=streaming_manager.keep_stream_alive)
+        # The backfill comes last so it is stopped before the sinks it writes to.
+        stream_runner = AsyncStreamRunner(streaming_manager, components=[auth, latest_values, *components] + sinks + [
+            component for component in (subscriptions, backfill) if component is not None])
+    else:
+        influx_sink = InfluxLineProtocolSink()
+        # Stopped in reverse, so the Redis sink writes the checkpoint of MySQL's final flush.
+        sinks = [redis_sink, mysql_sink, influx_sink] + optional_sinks
+        if config.BACKFILL_ENABLED:
+            backfill = BackfillEngine(token_manager, db_session, mysql_sink, influx_sink, latest_values, rollup)
+        streaming_manager = StreamingManager(token_manager=token_manager, db_session=db_session,
+                                             redis_util=redis_util, mqtt_utils=mqtt_utils, mysql_sink=mysql_sink,
+                                             influx_sink=influx_sink, redis_sink=redis_sink,
+                                             latest_values=latest_values, mqtt_sink=mqtt_sink, deadband=deadband,
+                                             rollup=rollup, redis_prefix=redis_prefix, backfill=backfill,
+                                             subscriptions=subscriptions, fanout=fanout)
+        if config.PIPELINE_ENABLED:
+            pipeline = EventPipeline(spill_dir=os.path.join(config.PIPELINE_SPILL_DIR, suffix))
+            streaming_manager.attach_pipeline(pipeline)
+        auth = AuthScheduler(token_manager, keepalive=streaming_manager.keep_stream_alive)
+        stream_runner = StreamRunner(streaming_manager, components=[auth, latest_values, *components] + sinks + [
+            component for component in (pipeline, subscriptions, backfill) if component is not None])
+    if config.OUTBOX_ENABLED:
+        # The Redis sink coalesces and retries in memory, so only the row-writing sinks get an outbox. The rollup
+        # sink is left out: its writes add to the stored windows, so replaying one that had committed counts it twice.
+        for sink in [sink for sink in (mysql_sink, influx_sink, mqtt_sink) if sink is not None]:
+            sink.outbox = Outbox(os.path.join(config.OUTBOX_DIR, suffix, sink.name))
+    return StreamStack(token_manager=token_manager, streaming_manager=streaming_manager, stream_runner=stream_runner,
+                       latest_values=latest_values, auth=auth, sinks=sinks, pipeline=pipeline, deadband=deadband,
+                       rollup=rollup, backfill=backfill, subscriptions=subscriptions, fanout=fanout,
+                       http_clients=http_clients)
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class StreamRunner:
+    """Owns the background thread that runs the Metasys stream and the sinks it feeds."""
+
+    def __init__(self, streaming_manager, components=()):
+        """
+        :param streaming_manager: Instance of StreamingManager.
+        :param components: Sinks and pipelines with start()/stop(), started in order and stopped in reverse.
+        """
+        self.streaming_manager = streaming_manager
+        self.components = list(components)
+        self.state = "stopped"
+        self.started_at = None
+        self.error = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> bool:
+        """Start streaming in the background. Returns False if it is already running."""
+        with self._lock:
+            if self.is_running():
+                return False
+            for component in self.components:
+                component.start()
+            self.streaming_manager.stop_requested.clear()
+            self.state = "starting"
+            self.started_at = time.time()
+            self.error = None
+            self._thread = threading.Thread(target=self._run, name="metasys-stream", daemon=True)
+            self._thread.start()
+            logger.info("Streaming thread started")
+            return True
+
+    def stop(self, timeout: float = 30) -> bool:
+        """Close the stream, wait for the reader thread, then drain and stop the sinks.
+
+        Returns False if nothing was running.
+        """
+        with self._lock:
+            if self._thread is None:
+                return False
+            self.state = "stopping"
+            self.streaming_manager.stop()
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.warning(f"Streaming thread did not exit within {timeout}s")
+            self._thread = None
+            for component in reversed(self.components):
+                component.stop()
+            self.state = "stopped"
+            logger.info("Streaming stopped and sinks drained")
+            return True
+
+    async def start_async(self) -> bool:
+        return self.start()
+
+    async def stop_async(self) -> bool:
+        return await asyncio.to_thread(self.stop)
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "running": self.is_running(),
+            "started_at": self.started_at,
+            "stream_id": self.streaming_manager.stream_id,
+            "last_event_id": self.streaming_manager.last_event_id,
+            "checkpoint_event_id": self.streaming_manager.mysql_sink.committed_event_id,
+            "reconnects": self.streaming_manager.reconnects,
+            "error": self.error,
+        }
+
+    def _run(self):
+        try:
+            self.state = "streaming"
+            self.streaming_manager.run()
+        except Exception as e:
+            logger.error(f"Streaming thread failed: {e}")
+            self.error = str(e)
+        if self.state != "stopping":
+            self.state = "failed" if self.error else "ended"
+
+
+class AsyncStreamRunner(StreamRunner):
+    """Runs an AsyncStreamingManager as a task on the application's event loop."""
+
+    def __init__(self, streaming_manager, components=()):
+        super().__init__(streaming_manager, components)
+        self._task = None
+
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start_async(self) -> bool:
+        if self.is_running():
+            return False
+        for component in self.components:
+            if hasattr(component, "start_async"):
+                await component.start_async()
+            else:
+                component.start()
+        self.streaming_manager.stop_requested.clear()
+        self.streaming_manager.loop = asyncio.get_running_loop()
+        self.state = "starting"
+        self.started_at = time.time()
+        self.error = None
+        self._task = asyncio.create_task(self._run_async(), name="metasys-stream")
+        logger.info("Streaming task started")
+        return True
+
+    async def stop_async(self) -> bool:
+        if self._task is None:
+            return False
+        self.state = "stopping"
+        self.streaming_manager.stop()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        for component in reversed(self.components):
+            if hasattr(component, "stop_async"):
+                await component.stop_async()
+            else:
+                await asyncio.to_thread(component.stop)
+        self.state = "stopped"
+        logger.info("Streaming stopped and sinks drained")
+        return True
+
+    def start(self) -> bool:
+        raise RuntimeError("AsyncStreamRunner must be started with start_async() on the event loop")
+
+    def stop(self, timeout: float = 30) -> bool:
+        raise RuntimeError("AsyncStreamRunner must be stopped with stop_async() on the event loop")
+
+    async def _run_async(self):
+        try:
+            self.state = "streaming"
+            await self.streaming_manager.run_async()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Streaming task failed: {e}")
+            self.error = str(e)
+        if self.state != "stopping":
+            self.state = "failed" if self.error else "ended"
@@ -1,125 +1,407 @@
-import json
 import logging
+import random
+import threading
 import time
 import traceback
 from datetime import datetime
 
 import requests
-from dacite import from_dict
+from requests.adapters import HTTPAdapter
 from sseclient import SSEClient
 
 from app.core.config import config
 from app.db.CRUDHandle import EventCrudHandler
-from app.db.models import Event, Subscriptions
-from app.models.EventUpdateObject import EventUpdateObject
+from app.models.EventUpdateObject import StreamRecord
+from app.services.bulk_subscriber import SUCCESS_STATUS_CODES, BulkSubscriber
+from app.util import codec
+from app.util.metrics import registry
 
 logger = logging.getLogger(__name__)
 
+EVENTS = registry.counter("metasys_events_total", "SSE events received, by event type", ("type",))
+ITEMS = registry.counter("metasys_event_items_total", "Object value updates decoded from update events")
+PARSE_SECONDS = registry.histogram("metasys_event_parse_seconds", "Time to decode an update event")
+PARSE_ERRORS = registry.counter("metasys_event_parse_errors_total", "Update events that could not be decoded")
+SUBSCRIBE_FAILURES = registry.counter("metasys_subscribe_failures_total", "GUID subscribe requests that failed")
+
 
 class StreamingManager:
-    def __init__(self, token_manager, db_session, redis_util, mqtt_utils):
+    def __init__(self, token_manager, db_session, redis_util, mqtt_utils, mysql_sink, influx_sink, redis_sink,
+                 latest_values, mqtt_sink=None, deadband=None, rollup=None, redis_prefix: str = "", backfill=None,
+                 subscriptions=None, fanout=None):
         """
         :param token_manager: Instance of TokenManager.
-        :param storage_service: "redis" or "mysql" (set via environment variable).
+        :param db_session: DBSession the subscriptions table is read and written through.
+        :param redis_util: RedisUtil holding the stream id and resume checkpoint.
+        :param mqtt_utils: MQTTUtil the MQTT sink publishes through.
+        :param mysql_sink: Instance of MySQLEventSink that buffers rows for the events table.
+        :param influx_sink: Instance of InfluxLineProtocolSink that batches points for InfluxDB.
+        :param redis_sink: Instance of RedisCheckpointSink that coalesces checkpoints and latest values.
+        :param latest_values: Instance of LatestValueStore serving current values to the API.
+        :param mqtt_sink: Optional SparkplugMQTTSink publishing values to the MQTT broker.
+        :param deadband: Optional DeadbandFilter dropping updates inside a point's deadband before the sinks.
+        :param rollup: Optional RollupEngine keeping per-GUID aggregates in the rollup tables.
+        :param redis_prefix: Prepended to the Redis keys of the stream state, so every shard keeps its own.
+        :param backfill: Optional BackfillEngine asked to fill the outage whenever a new stream was subscribed.
+        :param subscriptions: Optional SubscriptionRegistry holding the active GUIDs. Without one, subscribe and
+                              unsubscribe go to the table directly.
+        :param fanout: Optional FanoutHub re-publishing updates to local WebSocket and SSE clients.
         """
         self.token_manager = token_manager
-        self.active_subscriptions = {}
         self.db_session = db_session
+        self.mysql_sink = mysql_sink
+        self.influx_sink = influx_sink
+        self.redis_sink = redis_sink
+        self.latest_values = latest_values
+        self.mqtt_sink = mqtt_sink
+        self.deadband = deadband
+        self.rollup = rollup
+        self.backfill = backfill
+        self.subscriptions = subscriptions
+        self.fanout = fanout
+        # The resume checkpoint follows what MySQL has stored, not what the stream has delivered.
+        mysql_sink.on_commit = redis_sink.set_checkpoint
+        if subscriptions is not None:
+            subscriptions.on_added = self.subscribe_added
+            subscriptions.on_removed = self.unsubscribe_removed
+        self.pipeline = None
         self.redis_util = redis_util
+        self.redis_prefix = redis_prefix
         self.mqtt_util = mqtt_utils
         self.session = None
         self.response = None
         self.sse_client = None
         self.events = None
-        self.keep_alive_ts = time.time()
+        self.stream_id = None
+        self.subscribed_stream_id = None
+        self.last_event_id = None
+        self.last_received_at = None
+        self.stream_opened_at = None
+        self.down_since = None
+        self.reconnects = 0
+        self.assigned_guids = None
+        self.resume = True
+        self.bulk_subscriber = None
+        self._bulk_thread = None
+        self.stop_requested = threading.Event()
+        self.events_received = 0
+        self._progress_at = time.monotonic() + config.LOG_PROGRESS_INTERVAL
+        self._progress_events = 0
 
     def login(self):
         if not self.token_manager.access_token:
             logger.warning("No access token, retrying login...")
-            self.token_manager.login()
+            self.token_manager.ensure_login()
 
     def keep_stream_alive(self):
-        if time.time() >= self.keep_alive_ts + 1800:
-            url = f"{config.METASYS_SERVER}/api/v4/stream/keepalive"
-            headers = {"Authorization": f"Bearer {self.token_manager.access_token}"}
-            response = self.session.get(url, headers=headers)
-            logger.info(response.json())
-            self.keep_alive_ts = time.time()
-
-    def refresh_token_keep_alive(self):
-        self.token_manager.refresh_token()
-        self.keep_stream_alive()
-
-    def establish_stream(self):
-        """Establish a persistent SSE connection using requests and wrap it with ssepy."""
-        self.session = requests.Session()
-        try:
-            url = f"{config.METASYS_SERVER}/api/v4/stream"
-            headers = {"Authorization": f"Bearer {self.token_manager.access_token}"}
-            self.response = self.session.post(url, headers=headers, stream=True)
-            self.response.raise_for_status()
-            # Wrap the response with SSEClient from ssepy
-            self.sse_client = SSEClient(self.response.raw)
-            self.events = self.sse_client.events()
+        """Tell Metasys the stream is still read. Called by the AuthScheduler, never by the reader."""
+        if self.stream_id is None or self.session is None:
             return
-        except Exception as e:
-            logger.error(f"Error during streaming connection: {e}")
-            traceback.print_exc()
-            time.sleep(5)
+        url = f"{config.METASYS_SERVER}/api/v4/stream/keepalive"
+        response = self.token_manager.send(
+            lambda headers: self.session.get(url, headers=headers, timeout=config.HTTP_TIMEOUT))
+        response.raise_for_status()
+        logger.info(f"Stream keepalive: {response.status_code}")
 
-    def process_hello(self, events):
+    @staticmethod
+    def is_unauthorized(error: Exception) -> bool:
+        return getattr(getattr(error, "response", None), "status_code", None) == 401
+
+    def run(self):
+        """Keep the stream up until stop() is called.
+
+        Every reconnect asks the server to resume after the last event seen, and GUIDs are only re-subscribed
+        when the hello carries a different stream id than the one the subscriptions were made on.
+        """
+        attempt = 0
+        relogged = False
+        while not self.stop_requested.is_set():
+            connected_at = time.monotonic()
+            token = None
+            try:
+                self.login()
+                token = self.token_manager.access_token
+                self.establish_stream(last_event_id=self.resume_event_id() if self.resume else None)
+                self.resume = True
+                relogged = False
+                self.process_hello(self.events)
+                self.ensure_subscriptions()
+                self.process_events(self.events)
+            except Exception as e:
+                if self.stop_requested.is_set():
+                    break
+                logger.error(f"Stream failed: {e}")
+                if self.is_unauthorized(e):
+                    self.token_manager.invalidate(token)
+                    if not relogged:
+                        # The token was rejected before it was due for refresh: log in and reconnect right away.
+                        relogged = True
+                        continue
+            if self.stop_requested.is_set():
+                break
+            # A connection that stayed up for a while starts the backoff over.
+            attempt = 0 if time.monotonic() - connected_at > 60 else attempt + 1
+            delay = self.reconnect_delay(attempt)
+            self.reconnects += 1
+            logger.warning(f"Reconnecting to stream in {delay:.2f}s (attempt {attempt})")
+            self.stop_requested.wait(delay)
+
+    @staticmethod
+    def reconnect_delay(attempt: int) -> float:
+        """Reconnect immediately the first time, then back off exponentially with full jitter."""
+        if attempt <= 1:
+            return 0.0
+        return random.uniform(0, min(config.STREAM_RECONNECT_MAX_DELAY, 0.5 * 2 ** (attempt - 1)))
+
+    def resume_event_id(self):
+        if self.last_event_id is None:
+            cached = self.redis_util.get_event(f"{self.redis_prefix}STREAM_LAST_EVENT_ID")
+            self.last_event_id = cached.decode() if isinstance(cached, bytes) else cached
+        return self.last_event_id
+
+    def ensure_subscriptions(self):
+        """Subscribe all active GUIDs unless the server resumed the stream the subscriptions belong to."""
+        if self.needs_subscription():
+            self.reconcile_subscriptions()
+            self.subscribe_to_all_active_guids()
+            self.mark_subscribed()
+        else:
+            self.subscribe_drifted(self.reconcile_subscriptions())
+
+    def reconcile_subscriptions(self) -> list:
+        """Bring the registry back in line with the table on every reconnect. Returns the GUIDs it was missing."""
+        if self.subscriptions is None or self.assigned_guids is not None:
+            return []
         try:
-            # Iterate over events continuously from the SSE connection.
-            event = next(self.events)
-            logger.info(f"Received event: {event}")
-            match event.event:
-                case "hello":
-                    self.handle_hello_event(event)
-                case _:
-                    raise Exception('expected only hello, found something else')
+            added, removed = self.subscriptions.reconcile()
         except Exception as e:
-            logger.error(f"Error during processing events: {e}")
-            traceback.print_exc()
-        return
+            logger.error(f"Error reconciling subscriptions: {e}")
+            return []
+        if removed and self.stream_id == self.subscribed_stream_id:
+            logger.info(f"{len(removed)} GUIDs unsubscribed elsewhere stay on stream {self.stream_id} until the next")
+        return added
+
+    def subscribe_drifted(self, guids: list):
+        """Subscribe GUIDs added to the table elsewhere on the resumed stream, in the background."""
+        if guids and not self.subscribe_in_background(guids):
+            self.restart_stream()
+
+    def needs_subscription(self) -> bool:
+        if self.subscribed_stream_id is None:
+            cached = self.redis_util.get_event(f"{self.redis_prefix}STREAM_ID")
+            self.subscribed_stream_id = cached.decode() if isinstance(cached, bytes) else cached
+        if self.stream_id == self.subscribed_stream_id:
+            logger.info(f"Resumed stream {self.stream_id}, keeping existing subscriptions")
+            return False
+        return True
+
+    def mark_subscribed(self):
+        self.subscribed_stream_id = self.stream_id
+        self.redis_util.store_event(f"{self.redis_prefix}STREAM_ID", self.stream_id)
+        if self.backfill is not None:
+            # A new stream only carries values from now on; whatever changed while none was open is fetched apart.
+            self.backfill.request(self.active_guids(), self.stream_opened_at, self.down_since)
+
+    def establish_stream(self, last_event_id: str = None):
+        """Establish a persistent SSE connection using requests and wrap it with ssepy.
+
+        :param last_event_id: Sent as Last-Event-ID so the server replays what was missed since that event.
+        """
+        if self.response is not None:
+            self.response.close()
+        if self.session is None:
+            self.session = requests.Session()
+            # Bulk subscription shares this session across its worker threads.
+            self.session.mount("https://", HTTPAdapter(pool_maxsize=config.SUBSCRIBE_CONCURRENCY))
+            self.session.mount("http://", HTTPAdapter(pool_maxsize=config.SUBSCRIBE_CONCURRENCY))
+        url = f"{config.METASYS_SERVER}/api/v4/stream"
+        headers = self.token_manager.headers()
+        if last_event_id:
+            headers["Last-Event-ID"] = last_event_id
+            logger.info(f"Resuming stream after event {last_event_id}")
+        self.response = self.session.post(url, headers=headers, stream=True)
+        self.response.raise_for_status()
+        # Wrap the response with SSEClient from ssepy
+        self.sse_client = SSEClient(self.response.raw)
+        self.events = self.sse_client.events()
+
+    def process_hello(self, events):
+        event = next(self.events)
+        logger.info(f"Received event: {event}")
+        match event.event:
+            case "hello":
+                self.handle_hello_event(event)
+            case _:
+                raise Exception('expected only hello, found something else')
 
     def process_events(self, events):
         """Continuously process incoming SSE events using ssepy."""
         try:
             # Iterate over events continuously from the SSE connection.
             for event in self.events:
-                logger.info(f"Received event: {event}")
-                self.refresh_token_keep_alive()
-                match event.event:
-                    case "hello":
-                        raise Exception('unexpected second hello')
-                    case "object.values.update":
-                        self.handle_object_update(event)
-                    case "object.values.heartbeat":
-                        logger.info(event.data + "Event ID: " + event.id)
-                if event.id is not None:
-                    self.redis_util.store_event("STREAM_LAST_EVENT_ID", event.id)
+                if self.stop_requested.is_set():
+                    break
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"Received event: {event}")
+                self.dispatch(self.build_record(event))
         except Exception as e:
+            if self.stop_requested.is_set():
+                logger.info("Stream closed on request")
+                return
             logger.error(f"Error during processing events: {e}")
             traceback.print_exc()
         return
 
+    def build_record(self, event) -> StreamRecord:
+        if event.id is not None:
+            self.last_event_id = event.id
+        EVENTS.labels(event.event).inc()
+        self.events_received += 1
+        if time.monotonic() >= self._progress_at:
+            self.log_progress()
+        record = StreamRecord(event_id=event.id, event_type=event.event, stream_id=self.stream_id,
+                              received_at=datetime.now())
+        self.last_received_at = record.received_at
+        match event.event:
+            case "hello":
+                raise Exception('unexpected second hello')
+            case "object.values.update":
+                record.batch = self.handle_object_update(event)
+                if self.subscriptions is not None and record.batch:
+                    self.subscriptions.note_references(record.batch)
+                if self.deadband is not None and record.batch:
+                    record.batch = self.deadband.apply(record.batch)
+            case "object.values.heartbeat":
+                logger.debug(f"Heartbeat {event.data} Event ID: {event.id}")
+        # Registered here, on the reader in arrival order, before any pipeline worker can write the rows.
+        record.sequence = self.mysql_sink.track(record.event_id, bool(record.batch))
+        return record
+
+    def assign(self, guids: list):
+        """Stream only guids instead of every active subscription, as one shard of several.
+
+        GUIDs added while the stream is subscribed are subscribed on it in the background. Metasys has no way to
+        unsubscribe a GUID from a stream, so when GUIDs are taken away a new stream is opened for the rest.
+        """
+        previous = self.assigned_guids
+        self.assigned_guids = list(guids)
+        if previous is None:
+            return
+        added = set(guids) - set(previous)
+        removed = set(previous) - set(guids)
+        if not added and not removed:
+            return
+        logger.info(f"Assignment changed: {len(added)} GUIDs added, {len(removed)} removed")
+        subscribed = self.stream_id is not None and self.stream_id == self.subscribed_stream_id
+        if removed or not subscribed or not self.subscribe_in_background(list(added)):
+            self.restart_stream()
+
+    def restart_stream(self):
+        """Close the stream so run() opens a new one, rather than resuming it, and subscribes on that."""
+        self.resume = False
+        if self.response is not None:
+            self.response.close()
+
+    def stop(self):
+        """Make process_events return and unblock a read that is waiting on the stream."""
+        self.stop_requested.set()
+        if self.response is not None:
+            self.response.close()
+
+    def log_progress(self):
+        """Log event throughput once per LOG_PROGRESS_INTERVAL instead of a line per event."""
+        now = time.monotonic()
+        elapsed = now - self._progress_at + config.LOG_PROGRESS_INTERVAL
+        count = self.events_received - self._progress_events
+        logger.info(f"Received {count} events in the last {elapsed:.0f}s ({count / elapsed:.1f}/s), "
+                    f"last event {self.last_event_id}")
+        self._progress_events = self.events_received
+        self._progress_at = now + config.LOG_PROGRESS_INTERVAL
+
     def handle_object_update(self, event):
-        """Parse SSE event lines into a JSON object."""
+        """Decode every item of an update event into one columnar batch."""
         try:
-            event_data = from_dict(data_class=EventUpdateObject, data=json.loads(event.data)[0])
-            event_object = Event(guid=event_data.item.id, eventId=event.id, presentValue=event_data.item.presentValue,
-                                 event_metadata=str(event_data.condition), stream_id=self.stream_id,
-                                 timestamp=datetime.now())
-            with self.db_session.session_context() as db:
-                crud_session = EventCrudHandler(db)
-                crud_session.store_event_mysql(event_object)
-                self.dump_to_influx(event_data)
+            began = time.perf_counter()
+            batch = codec.decode_update(event.data)
+            PARSE_SECONDS.observe(time.perf_counter() - began)
+            ITEMS.inc(len(batch))
+            return batch
         except Exception as e:
+            PARSE_ERRORS.inc()
             logger.error(f"Error during processing event: {e}")
             traceback.print_exc()
+            return None
+
+    def attach_pipeline(self, pipeline):
+        """Hand sink writes to pipeline workers instead of running them on the reader thread."""
+        pipeline.register("mysql", self.write_mysql, workers=config.PIPELINE_WORKERS)
+        pipeline.register("influx", self.write_influx, workers=config.PIPELINE_WORKERS)
+        # The checkpoint must never move backwards, so the Redis sink keeps a single worker.
+        pipeline.register("redis", self.write_checkpoint)
+        pipeline.register("latest", self.write_latest)
+        if self.mqtt_sink is not None:
+            # Sparkplug sequence numbers and aliases assume one publisher, so MQTT also keeps a single worker.
+            pipeline.register("mqtt", self.write_mqtt)
+        if self.rollup is not None:
+            # One worker, so the watermark only sees events in arrival order.
+            pipeline.register("rollup", self.write_rollup)
+        if self.fanout is not None:
+            # One worker, so every client receives updates in arrival order.
+            pipeline.register("fanout", self.write_fanout)
+        self.pipeline = pipeline
+
+    def dispatch(self, record: StreamRecord):
+        if self.pipeline is not None:
+            self.pipeline.publish(record)
+            return
+        self.write_mysql(record)
+        self.write_influx(record)
+        self.write_checkpoint(record)
+        self.write_latest(record)
+        self.write_mqtt(record)
+        self.write_rollup(record)
+        self.write_fanout(record)
+
+    def write_mysql(self, record: StreamRecord):
+        if not record.batch:
+            return
+        batch = record.batch
+        self.mysql_sink.extend([{
+            "guid": batch.guids[i],
+            "eventId": record.item_event_id(i),
+            "presentValue": batch.values[i],
+            "reliability": batch.reliability[i],
+            "priority": batch.priority[i],
+            "stream_id": record.stream_id,
+            "timestamp": record.received_at,
+        } for i in range(len(batch))], record.received_at.timestamp(), record.sequence)
+
+    def write_influx(self, record: StreamRecord):
+        if record.batch:
+            self.influx_sink.add_record(record)
+
+    def write_checkpoint(self, record: StreamRecord):
+        self.redis_sink.add_record(record)
+
+    def write_latest(self, record: StreamRecord):
+        self.latest_values.add_record(record)
+
+    def write_mqtt(self, record: StreamRecord):
+        if self.mqtt_sink is not None and record.batch:
+            self.mqtt_sink.add_record(record)
+
+    def write_rollup(self, record: StreamRecord):
+        if self.rollup is not None and record.batch:
+            self.rollup.add_record(record)
+
+    def write_fanout(self, record: StreamRecord):
+        if self.fanout is not None and record.batch:
+            self.fanout.publish(record)
 
     def handle_hello_event(self, event):
         self.stream_id = event.data.strip('"')
+        self.stream_opened_at = datetime.now()
+        self.down_since = self.last_received_at
         logger.info(f"Stream ID set to: {self.stream_id}")
         return
 
@@ -127,81 +409,129 @@ class StreamingManager:
         """ Subscribes to the given GUID and returns the response """
         try:
 
-            subscribe_headers = {
-                'Authorization': f'Bearer {self.token_manager.access_token}',
-                'METASYS-SUBSCRIBE': self.stream_id
-            }
-            print(config.SUBSCRIBE_URL.format(guid))
-            subscribe_response = self.session.get(config.SUBSCRIBE_URL.format(guid), headers=subscribe_headers)
+            logger.debug(config.SUBSCRIBE_URL.format(guid))
+            subscribe_response = self.token_manager.send(lambda headers: self.session.get(
+                config.SUBSCRIBE_URL.format(guid), headers={**headers, 'METASYS-SUBSCRIBE': self.stream_id}))
 
             if subscribe_response.status_code == 200 or subscribe_response.status_code == 204 or subscribe_response.status_code == 202:
-                logger.info(f"Successfully subscribed to GUID: {guid}")
+                logger.debug(f"Successfully subscribed to GUID: {guid}")
             else:
+                SUBSCRIBE_FAILURES.inc()
                 logger.error(
                     f"Failed to subscribe to GUID {guid}: {subscribe_response.status_code} - {subscribe_response.text}")
 
             return subscribe_response
         except Exception as e:
+            SUBSCRIBE_FAILURES.inc()
             logger.error(f"Error during subscription: {e}")
             traceback.print_exc()
             return None
 
+    @property
+    def active_subscriptions(self) -> dict:
+        if self.subscriptions is not None:
+            return self.subscriptions.guids
+        return dict.fromkeys(self.active_guids())
+
     def subscribe(self, guid: str):
-        """Subscribe to events for a given GUID."""
-        if guid not in self.active_subscriptions:
+        """Subscribe to events for a given GUID. The registry stores it and subscribes it on the stream shortly.
+
+        Returns False when the GUID is subscribed already or, without a registry, Metasys did not take it.
+        """
+        if self.subscriptions is not None:
+            if self.subscriptions.add([guid]):
+                logger.info(f"Subscribed to GUID: {guid}")
+                return True
+        elif guid not in self.active_guids():
             subscribe_response = self.subscribe_to_guid(guid)
+            # subscribe_to_guid logged the failure; the GUID is only stored once Metasys took it.
+            if subscribe_response is None or subscribe_response.status_code not in SUCCESS_STATUS_CODES:
+                return False
             logger.info(f"Subscribed to GUID: {guid} - Status Code - {subscribe_response.status_code}")
-            subscribe_obj = Subscriptions(guid=guid, active=True)
             with self.db_session.session_context() as db:
                 crud_session = EventCrudHandler(db)
-                crud_session.add_subscription(subscribe_obj)
+                crud_session.add_subscriptions([guid])
             return True
         logger.info(f"Already subscribed to GUID: {guid}")
         return False
 
-    def subscribe_to_all_active_guids(self):
+    def subscribe_added(self, guids: list):
+        """Subscribe GUIDs the registry stored on the current stream; a stream opened later subscribes them anyway."""
+        if not self.stop_requested.is_set() and self.stream_id is not None \
+                and self.stream_id == self.subscribed_stream_id:
+            self.subscribe_bulk(guids)
+
+    def active_guids(self) -> list:
+        if self.assigned_guids is not None:
+            return list(self.assigned_guids)
+        if self.subscriptions is not None and self.subscriptions.loaded:
+            return self.subscriptions.active()
         with self.db_session.session_context() as db:
             crud_session = EventCrudHandler(db)
-            subscriptions = crud_session.get_subscriptions()
-            for guid in subscriptions[::-1]:
-                self.subscribe_to_guid(guid)
-        logger.info(f"All subscriptions active: {len(subscriptions)}")
+            return crud_session.get_subscriptions()
+
+    def subscribe_to_all_active_guids(self):
+        subscriptions = self.active_guids()
+        self.bulk_subscriber = BulkSubscriber(self.subscribe_to_guid)
+        report = self.bulk_subscriber.run(subscriptions[::-1])
+        logger.info(f"All subscriptions active: {len(report.succeeded)}/{len(subscriptions)}")
         return
 
+    def start_bulk_subscription(self, guids: list) -> bool:
+        """Subscribe guids in the background. Returns False if a bulk subscription is still running."""
+        if self.subscriptions is not None:
+            self.subscriptions.add(guids)
+            return True
+        return self.subscribe_in_background(guids)
+
+    def subscribe_in_background(self, guids: list) -> bool:
+        """Run subscribe_bulk on a background thread. Returns False if a bulk subscription is still running."""
+        if self._bulk_thread is not None and self._bulk_thread.is_alive():
+            return False
+        self._bulk_thread = threading.Thread(target=self.subscribe_bulk, args=(guids,), name="bulk-subscribe",
+                                             daemon=True)
+        self._bulk_thread.start()
+        return True
+
+    def subscribe_bulk(self, guids: list):
+        """Subscribe guids concurrently. Blocks until done. Without a registry, the ones that succeeded are stored."""
+        subscriber = BulkSubscriber(self.subscribe_to_guid)
+        self.bulk_subscriber = subscriber
+        report = subscriber.run(list(dict.fromkeys(guids)))
+        if report.succeeded and self.subscriptions is None:
+            with self.db_session.session_context() as db:
+                crud_session = EventCrudHandler(db)
+                crud_session.add_subscriptions(report.succeeded)
+        return report
+
     def unsubscribe(self, guid: str):
         """Unsubscribe from events for a given GUID."""
-        if guid in self.active_subscriptions:
-            del self.active_subscriptions[guid]
+        if self.subscriptions is not None:
+            removed = self.subscriptions.remove([guid])
+        elif guid in self.active_guids():
+            removed = [guid]
+            with self.db_session.session_context() as db:
+                crud_session = EventCrudHandler(db)
+                crud_session.deactivate_subscriptions(removed)
+            self.unsubscribe_removed(removed)
+        else:
+            removed = []
+        if removed:
             logger.info(f"Unsubscribed from GUID: {guid}")
             return True
         logger.info(f"Not subscribed to GUID: {guid}")
         return False
 
-    def dump_to_influx(self, event: EventUpdateObject):
-        """Cron job: Dump stored events from the chosen storage into InfluxDB."""
-        try:
-            headers = {
-                'Authorization': f'Bearer {config.INFLUXDB_TOKEN}',
-                'Content-Type': 'application/json'
-            }
-            print(config.INFLUXDB_URL)
-            data = self.prepare_data(event)
-            print(data)
-            response = self.session.post(config.INFLUXDB_URL, headers=headers, data=data)
-            if response.status_code // 100 == 2:
-                logger.info(f"InfluxDB response code: {response.status_code}")
-            else:
-                logger.error(f"Failed to save to influx, Content saved in MySQL Table: {response.status_code}")
-        except Exception as e:
-            logger.error(f"Error during processing event: {e}")
-        return
-
-    def prepare_data(self, event: EventUpdateObject) -> str:
-        request = dict()
-        request["measurement"] = "Building Data"
-        request["presentValue"] = event.item.__dict__.get("presentValue")
-        request["guid"] = event.item.__dict__.get("id")
-        request["itemReference"] = event.item.__dict__.get("itemReference")
-        logger.info(str(request).replace("'", "\""))
+    def unsubscribe_removed(self, guids: list):
+        """Metasys cannot take GUIDs off a stream, so a new one is opened without the ones removed."""
+        if self.stream_id is not None and self.stream_id == self.subscribed_stream_id:
+            logger.info(f"Opening a new stream without {len(guids)} unsubscribed GUIDs")
+            self.restart_stream()
 
-        return str(request).replace("'", "\"")
+    def find_subscriptions(self, prefix: str = "", reference: str = "", limit: int = 100) -> list:
+        if self.subscriptions is not None:
+            return self.subscriptions.find(prefix, reference, limit)
+        if reference:
+            return []
+        return [{"guid": guid, "itemReference": None} for guid in sorted(self.active_guids())
+                if guid.startswith(prefix)][:limit]
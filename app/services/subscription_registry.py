@@ -0,0 +1,283 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from app.core.config import config
+from app.db.CRUDHandle import EventCrudHandler
+from app.models.EventBatch import EventBatch
+
+logger = logging.getLogger(__name__)
+
+
+class SubscriptionRegistry:
+    """The active subscriptions, held in memory after one read of the subscriptions table.
+
+    Membership is a dict lookup and GUID or itemReference prefix searches bisect sorted copies of the keys, rebuilt
+    on the first search after a change. add() and remove() only change memory. A flusher thread writes the pending
+    changes to the table and hands them to on_added and on_removed in one batch, once no change came for debounce
+    seconds or max_delay seconds after the first pending one, so a burst of API calls costs one transaction and
+    one bulk subscribe. itemReferences are learned from the updates of GUIDs that have none yet and stored the
+    same way.
+    """
+    name = "subscriptions"
+
+    def __init__(self, db_session, debounce: float = config.SUBSCRIPTION_DEBOUNCE,
+                 max_delay: float = config.SUBSCRIPTION_MAX_DELAY):
+        """
+        :param debounce: Seconds without a change before pending changes are written.
+        :param max_delay: Seconds pending changes wait at most while changes keep coming.
+        """
+        self.db_session = db_session
+        self.debounce = debounce
+        self.max_delay = max_delay
+        # GUID to itemReference, None until an update or the table tells.
+        self.guids = {}
+        self.references = {}
+        # Called from the flusher thread with the GUIDs whose change was stored.
+        self.on_added = None
+        self.on_removed = None
+        self.loaded = False
+        self.flushes = 0
+        self.failures = 0
+        self.reconciles = 0
+        self.drift = 0
+        self._added = {}
+        self._removed = {}
+        self._new_references = {}
+        self._unreferenced = 0
+        self._sorted_guids = None
+        self._sorted_references = None
+        self._first_change = None
+        self._last_change = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __contains__(self, guid: str) -> bool:
+        return guid in self.guids
+
+    def __len__(self):
+        return len(self.guids)
+
+    def start(self):
+        try:
+            self.load()
+        except Exception as e:
+            # The stream reconciles with the table before it subscribes, which loads it then.
+            logger.error(f"Could not load subscriptions: {e}")
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="subscriptions", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def load(self):
+        with self.db_session.session_context() as db:
+            references = EventCrudHandler(db).get_subscription_references()
+        with self._lock:
+            self.guids = dict(references)
+            self.references = {reference: guid for guid, reference in references.items() if reference}
+            self._unreferenced = len(self.guids) - len(self.references)
+            self._sorted_guids = self._sorted_references = None
+            self.loaded = True
+        logger.info(f"Loaded {len(references)} subscriptions")
+
+    def active(self) -> list:
+        with self._lock:
+            return list(self.guids)
+
+    def add(self, guids: list) -> list:
+        """Subscribe guids and return the ones that were not subscribed yet."""
+        added = []
+        with self._lock:
+            for guid in dict.fromkeys(guids):
+                if guid in self.guids:
+                    continue
+                self.guids[guid] = None
+                self._unreferenced += 1
+                # Removed and added again before a flush: the row and the stream still have it.
+                if self._removed.pop(guid, False) is False:
+                    self._added[guid] = None
+                added.append(guid)
+            if added:
+                self._changed()
+        return added
+
+    def remove(self, guids: list) -> list:
+        """Unsubscribe guids and return the ones that were subscribed."""
+        removed = []
+        with self._lock:
+            for guid in dict.fromkeys(guids):
+                if guid not in self.guids:
+                    continue
+                reference = self.guids.pop(guid)
+                if reference is None:
+                    self._unreferenced -= 1
+                elif self.references.get(reference) == guid:
+                    del self.references[reference]
+                self._new_references.pop(guid, None)
+                if self._added.pop(guid, False) is False:
+                    self._removed[guid] = None
+                removed.append(guid)
+            if removed:
+                self._changed()
+        return removed
+
+    def note_references(self, batch: EventBatch):
+        """Learn the itemReferences of subscribed GUIDs that have none yet from a decoded update."""
+        if not self._unreferenced:
+            return
+        with self._lock:
+            learned = False
+            for guid, reference in zip(batch.guids, batch.item_references):
+                if reference and guid in self.guids and self.guids[guid] is None:
+                    self.guids[guid] = reference
+                    self.references[reference] = guid
+                    self._new_references[guid] = reference
+                    self._unreferenced -= 1
+                    learned = True
+            if learned:
+                self._changed()
+
+    def guid_for(self, reference: str):
+        return self.references.get(reference)
+
+    def find(self, prefix: str = "", reference: str = "", limit: int = 100) -> list:
+        """Subscriptions whose GUID starts with prefix and whose itemReference starts with reference."""
+        matches = []
+        with self._lock:
+            if reference:
+                if self._sorted_references is None:
+                    self._sorted_references = sorted(self.references)
+                candidates = ((self.references[key], key) for key in self._prefixed(self._sorted_references, reference))
+            else:
+                if self._sorted_guids is None:
+                    self._sorted_guids = sorted(self.guids)
+                candidates = ((key, self.guids[key]) for key in self._prefixed(self._sorted_guids, prefix))
+            for guid, item_reference in candidates:
+                if len(matches) >= limit:
+                    break
+                if guid.startswith(prefix):
+                    matches.append({"guid": guid, "itemReference": item_reference})
+        return matches
+
+    def flush(self) -> bool:
+        """Write the pending changes now and hand them on. Returns False if the write failed; they stay pending."""
+        with self._flush_lock:
+            with self._lock:
+                added, removed, references = list(self._added), list(self._removed), self._new_references
+                self._added, self._removed, self._new_references = {}, {}, {}
+                self._first_change = None
+                self._wake.clear()
+            if not (added or removed or references):
+                return True
+            try:
+                with self.db_session.session_context() as db:
+                    crud_session = EventCrudHandler(db)
+                    crud_session.add_subscriptions(added)
+                    crud_session.deactivate_subscriptions(removed)
+                    crud_session.set_item_references(references)
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Error storing subscription changes: {e}")
+                self._restore(added, removed, references)
+                return False
+            self.flushes += 1
+            if added or removed:
+                logger.info(f"Stored subscription changes: {len(added)} added, {len(removed)} removed")
+            for callback, guids in ((self.on_added, added), (self.on_removed, removed)):
+                if guids and callback is not None:
+                    try:
+                        callback(guids)
+                    except Exception as e:
+                        logger.error(f"Error applying subscription changes to the stream: {e}")
+            return True
+
+    def reconcile(self) -> tuple:
+        """Store pending changes, then take in what others changed in the table since it was read.
+
+        Returns the (added, removed) GUIDs by which memory had drifted from the table. Changes still pending after
+        a failed write are kept rather than overwritten.
+        """
+        self.flush()
+        with self.db_session.session_context() as db:
+            references = EventCrudHandler(db).get_subscription_references()
+        with self._lock:
+            added = [guid for guid in references if guid not in self.guids and guid not in self._removed]
+            removed = [guid for guid in self.guids if guid not in references and guid not in self._added]
+            for guid in added:
+                self.guids[guid] = None
+                self._unreferenced += 1
+            for guid in removed:
+                self.guids.pop(guid)
+            for guid, reference in references.items():
+                if reference and self.guids.get(guid, "") is None:
+                    self.guids[guid] = reference
+                    self._unreferenced -= 1
+            self.references = {reference: guid for guid, reference in self.guids.items() if reference}
+            self._sorted_guids = self._sorted_references = None
+            self.reconciles += 1
+            self.drift += len(added) + len(removed)
+            self.loaded = True
+        if added or removed:
+            logger.warning(f"Subscriptions drifted from the table: {len(added)} added, {len(removed)} removed")
+        return added, removed
+
+    def stats(self) -> dict:
+        return {"guids": len(self.guids), "references": len(self.references), "pending_added": len(self._added),
+                "pending_removed": len(self._removed), "flushes": self.flushes, "failures": self.failures,
+                "reconciles": self.reconciles, "drift": self.drift}
+
+    def _changed(self):
+        # Called with the lock held.
+        self._last_change = time.monotonic()
+        if self._first_change is None:
+            self._first_change = self._last_change
+        self._sorted_guids = self._sorted_references = None
+        self._wake.set()
+
+    def _restore(self, added: list, removed: list, references: dict):
+        """Queue a failed write again, leaving out what was undone while it ran."""
+        with self._lock:
+            for guid in added:
+                if guid in self.guids:
+                    self._added.setdefault(guid, None)
+            for guid in removed:
+                if guid not in self.guids:
+                    self._removed.setdefault(guid, None)
+            for guid, reference in references.items():
+                if self.guids.get(guid) == reference:
+                    self._new_references.setdefault(guid, reference)
+            self._changed()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait()
+            while not self._stop.is_set():
+                with self._lock:
+                    if self._first_change is None:
+                        break
+                    wait = min(self._last_change + self.debounce, self._first_change + self.max_delay)
+                wait -= time.monotonic()
+                if wait <= 0 or self._stop.wait(wait):
+                    break
+            if not self._stop.is_set() and not self.flush():
+                # Do not hammer a database that is down; the changes wait in memory meanwhile.
+                self._stop.wait(self.max_delay)
+
+    @staticmethod
+    def _prefixed(keys: list, prefix: str):
+        for index in range(bisect_left(keys, prefix), len(keys)):
+            if not keys[index].startswith(prefix):
+                break
+            yield keys[index]
@@ -1,3 +1,5 @@
+import asyncio
+import threading
 from datetime import datetime, timezone
 
 import requests
@@ -9,45 +11,148 @@ logger = logging.getLogger(__name__)
 
 
 class TokenManager:
-    def __init__(self):
-        self.access_token = None
-        self.expiry_time = None  # Expected as a Unix timestamp
+    """Holds the Metasys access token.
+
+    The token, its expiry and the Authorization header are replaced together as one tuple, so readers never take a
+    lock. Logins and refreshes are single-flight: callers that find one already in progress wait for it and use its
+    token instead of requesting another.
+    """
+
+    def __init__(self, refresh_margin: float = config.TOKEN_REFRESH_MARGIN):
+        """
+        :param refresh_margin: Seconds before expiry from which the token is refreshed.
+        """
+        self.refresh_margin = refresh_margin
+        self.session = requests.Session()
+        self.logins = 0
+        self.refreshes = 0
+        self._token = (None, None, {})
+        self._lock = threading.Lock()
+        self._async_lock = None
+
+    @property
+    def access_token(self):
+        return self._token[0]
+
+    @property
+    def expiry_time(self):
+        """Expiry as a Unix timestamp."""
+        return self._token[1]
+
+    def headers(self) -> dict:
+        return dict(self._token[2])
 
     def login(self):
         """Login to obtain an access token and expiry time."""
         try:
             url = config.METASYS_SERVER + "/api/v4/login"
-            response = requests.post(url, json={
+            response = self.session.post(url, json={
                 "username": config.METASYS_USER,
                 "password": config.METASYS_PASSWORD
             })
             response.raise_for_status()
-            data = response.json()
-            self.access_token = data['accessToken']
-            dt = datetime.strptime(data['expires'], "%Y-%m-%dT%H:%M:%SZ")
-            self.expiry_time = dt.replace(tzinfo=timezone.utc).timestamp()
+            self._store_token(response.json())
+            self.logins += 1
             logger.info(f"Logged in. Token expires at {self.expiry_time}")
         except requests.RequestException as e:
             logger.error(f"Login failed: {e}")
             raise
 
+    def ensure_login(self, stale: str = None):
+        """Log in unless there is a token other than stale, e.g. one a concurrent login just obtained."""
+        if self._has_token(stale):
+            return
+        with self._lock:
+            if not self._has_token(stale):
+                self.login()
+
+    def invalidate(self, stale: str):
+        """Forget stale after the server rejected it, unless it was already replaced."""
+        with self._lock:
+            if self.access_token == stale:
+                self._token = (None, None, {})
+
+    def refresh_due(self) -> bool:
+        """True when the token is within refresh_margin seconds of expiry."""
+        return bool(self.expiry_time) and time.time() >= self.expiry_time - self.refresh_margin
+
     def refresh_token(self):
-        """Refresh the token if within 30 minutes of expiry."""
-        if self.expiry_time and time.time() >= self.expiry_time - 1800:
+        """Refresh the token if within refresh_margin seconds of expiry. Falls back to a login on a 401."""
+        if not self.refresh_due():
+            return
+        with self._lock:
+            if not self.refresh_due():
+                return
             try:
                 logger.info("Refreshing token...")
                 url = config.METASYS_SERVER + "/api/v4/refreshToken"
-                header = {
-                    "Authorization": f"Bearer {self.access_token}"
-                }
-                response = requests.get(url, headers=header)
+                response = self.session.get(url, headers=self.headers(), timeout=config.HTTP_TIMEOUT)
+                if response.status_code == 401:
+                    logger.warning("Token rejected on refresh, logging in again")
+                    self.login()
+                    return
                 response.raise_for_status()
-                data = response.json()
-                self.access_token = data['accessToken']
-                logger.info(f"Refreshed token. Token expires at {self.expiry_time}")
-                self.expiry_time = datetime.strptime(data['expires'], "%Y-%m-%dT%H:%M:%SZ").replace(
-                    tzinfo=timezone.utc).timestamp()
+                self._store_token(response.json())
+                self.refreshes += 1
                 logger.info(f"Refreshed token. Token expires at {self.expiry_time}")
-
             except Exception as e:
                 logger.error(f"Refresh failed: {e}")
+
+    def send(self, request_fn):
+        """Call request_fn(headers) and, if it is answered with a 401, log in again and call it once more."""
+        token = self.access_token
+        response = request_fn(self.headers())
+        if response is not None and response.status_code == 401:
+            logger.warning("Request unauthorized, logging in again")
+            self.invalidate(token)
+            self.ensure_login()
+            response = request_fn(self.headers())
+        return response
+
+    async def login_async(self, client):
+        """Same as login, over the shared httpx.AsyncClient for the Metasys server."""
+        try:
+            response = await client.post("/api/v4/login", json={
+                "username": config.METASYS_USER,
+                "password": config.METASYS_PASSWORD
+            })
+            response.raise_for_status()
+            self._store_token(response.json())
+            self.logins += 1
+            logger.info(f"Logged in. Token expires at {self.expiry_time}")
+        except Exception as e:
+            logger.error(f"Login failed: {e}")
+            raise
+
+    async def ensure_login_async(self, client, stale: str = None):
+        """Same as ensure_login, for coroutines on the event loop."""
+        if self._has_token(stale):
+            return
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        async with self._async_lock:
+            if not self._has_token(stale):
+                await self.login_async(client)
+
+    async def send_async(self, client, request_fn):
+        """Same as send, for a request_fn returning an awaitable."""
+        token = self.access_token
+        response = await request_fn(self.headers())
+        if response is not None and response.status_code == 401:
+            logger.warning("Request unauthorized, logging in again")
+            self.invalidate(token)
+            await self.ensure_login_async(client)
+            response = await request_fn(self.headers())
+        return response
+
+    def stats(self) -> dict:
+        return {"expires_at": self.expiry_time, "logins": self.logins, "refreshes": self.refreshes}
+
+    def _has_token(self, stale: str = None) -> bool:
+        return self.access_token is not None and self.access_token != stale
+
+    def _store_token(self, data: dict):
+        access_token = data['accessToken']
+        expiry_time = datetime.strptime(data['expires'], "%Y-%m-%dT%H:%M:%SZ").replace(
+            tzinfo=timezone.utc).timestamp()
+        self._token = (access_token, expiry_time, {"Authorization": f"Bearer {access_token}"})
@@ -0,0 +1,246 @@
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass, asdict
+
+from app.core.config import config
+from app.util.metrics import LAG_BUCKETS, SIZE_BUCKETS, registry
+
+logger = logging.getLogger(__name__)
+
+WRITE_SECONDS = registry.histogram("metasys_sink_write_seconds", "Duration of a sink write", ("sink",))
+BATCH_ROWS = registry.histogram("metasys_sink_batch_rows", "Rows per sink write", ("sink",), SIZE_BUCKETS)
+COMMIT_LAG = registry.histogram("metasys_commit_lag_seconds",
+                                "Time from receiving an event to committing the oldest row of a write", ("sink",),
+                                LAG_BUCKETS)
+
+
+class PermanentWriteError(Exception):
+    """The backing store rejected a batch for good, so writing it again cannot succeed."""
+
+
+@dataclass
+class FlushMetrics:
+    flushes: int = 0
+    rows_written: int = 0
+    rows_ignored: int = 0
+    rows_failed: int = 0
+    failures: int = 0
+    retries: int = 0
+    rows_spilled: int = 0
+    rows_replayed: int = 0
+    last_flush_size: int = 0
+    last_flush_seconds: float = 0.0
+    total_flush_seconds: float = 0.0
+
+    def snapshot(self) -> dict:
+        return asdict(self)
+
+
+class BufferedSink:
+    """Write-behind buffer that flushes once it holds batch_size rows or its oldest row is flush_interval old.
+
+    Once started, a full buffer wakes the flusher thread, so the thread filling it, such as the stream's reader,
+    never waits on the backing store. Without a running flusher, or with flush_in_background unset, it is flushed
+    on the thread that filled it.
+
+    With an outbox attached, rows of a failed write are appended to it instead of being dropped, and so are all
+    later rows until the flusher thread has replayed the outbox, several batches per write, into the store. Rows
+    also go to the outbox when overflow_batches batches are pending because the flusher is still busy with a slow
+    write, so a slow store costs disk rather than memory or the caller's time.
+    """
+    name = "buffered"
+    flush_in_background = True
+    overflow_batches = config.OUTBOX_OVERFLOW_BATCHES
+    outbox = None
+
+    def __init__(self, batch_size: int, flush_interval: float):
+        """
+        :param batch_size: Number of pending rows that triggers a flush.
+        :param flush_interval: Maximum age in seconds of a pending row before it is flushed.
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.metrics = FlushMetrics()
+        self._buffer = []
+        self._oldest = None
+        self._received = None
+        self._taken_received = None
+        self._write_seconds = WRITE_SECONDS.labels(self.name)
+        self._batch_rows = BATCH_ROWS.labels(self.name)
+        self._commit_lag = COMMIT_LAG.labels(self.name)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._replay_lock = threading.Lock()
+        self._replay_attempt = 0
+        self._replay_at = 0.0
+
+    def start(self):
+        """Start the background thread that enforces the age threshold."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._wake.clear()
+            self._thread = threading.Thread(target=self._run, name=f"{self.name}-flusher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the flusher thread and write out whatever is still pending."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def add(self, row):
+        self.extend((row,))
+
+    def extend(self, rows, received_at: float = None):
+        """
+        :param received_at: Unix time the rows' event was received, for the commit lag metric.
+        """
+        with self._lock:
+            if not self._buffer:
+                self._oldest = time.monotonic()
+                self._received = received_at
+            self._buffer.extend(rows)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._on_full()
+
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    def flush(self):
+        """Hand all pending rows to write_batch, in chunks of at most batch_size."""
+        with self._flush_lock:
+            rows = self._take()
+            committed = False
+            for start in range(0, len(rows), self.batch_size):
+                committed = self._write(rows[start:start + self.batch_size])
+            self._observe_lag(committed)
+
+    def _on_full(self):
+        if self.flush_in_background and self._thread is not None:
+            if self.outbox is not None and self.pending() >= self.batch_size * self.overflow_batches:
+                self._overflow()
+            self._wake.set()
+        else:
+            self.flush()
+
+    def _overflow(self):
+        """Move the buffered rows to the outbox, behind which the flusher writes everything in order."""
+        rows = self._take()
+        if rows:
+            logger.warning(f"{self.name} sink is falling behind, keeping {len(rows)} rows in the outbox")
+            self._spill(rows)
+
+    def _take(self) -> list:
+        with self._lock:
+            rows, self._buffer, self._oldest = self._buffer, [], None
+            self._taken_received, self._received = self._received, None
+        return rows
+
+    def _observe_lag(self, committed: bool):
+        if committed and self._taken_received is not None:
+            self._commit_lag.observe(time.time() - self._taken_received)
+        self._taken_received = None
+
+    def _write(self, rows) -> bool:
+        """Write rows, or keep them in the outbox. True if they reached the store."""
+        if self.outbox is not None and self.outbox.pending:
+            # Older rows are still waiting in the outbox; queue behind them so the store gets rows in order.
+            self._spill(rows)
+            return False
+        began = time.perf_counter()
+        try:
+            written = self.write_batch(rows)
+        except Exception as e:
+            self._handle_write_error(rows, e)
+            return False
+        self._record_flush(rows, written, time.perf_counter() - began)
+        return True
+
+    def _handle_write_error(self, rows, error):
+        if self.outbox is None or isinstance(error, PermanentWriteError):
+            self._record_failure(rows, error)
+            return
+        self.metrics.failures += 1
+        logger.warning(f"{self.name} sink failed to flush {len(rows)} rows, keeping them in the outbox: {error}")
+        self._spill(rows)
+        self._schedule_replay()
+
+    def _spill(self, rows):
+        self.outbox.append(rows)
+        self.metrics.rows_spilled += len(rows)
+
+    def _schedule_replay(self):
+        """Back off exponentially with jitter between replay attempts while the store keeps failing."""
+        delay = random.uniform(0.5, 1.0) * min(config.OUTBOX_RETRY_MAX_DELAY, 0.5 * 2 ** self._replay_attempt)
+        self._replay_attempt += 1
+        self._replay_at = time.monotonic() + delay
+
+    def replay_due(self) -> bool:
+        return self.outbox is not None and self.outbox.pending > 0 and time.monotonic() >= self._replay_at
+
+    def replay(self) -> bool:
+        """Write rows back from the outbox until it is empty or a write fails. Returns True once it is empty."""
+        with self._replay_lock:
+            while self.outbox.pending:
+                entries, position = self.outbox.read(config.OUTBOX_REPLAY_BATCHES)
+                rows = [row for entry in entries for row in entry]
+                began = time.perf_counter()
+                try:
+                    written = self.write_batch(rows)
+                except PermanentWriteError:
+                    # Write the batches one by one, so only the rejected ones are lost.
+                    written = 0
+                    for entry in entries:
+                        try:
+                            written += self.write_batch(entry)
+                        except Exception as entry_error:
+                            self._record_failure(entry, entry_error)
+                except Exception as e:
+                    self.metrics.failures += 1
+                    logger.warning(f"{self.name} sink could not replay {len(rows)} rows from the outbox: {e}")
+                    self._schedule_replay()
+                    return False
+                self._record_flush(rows, written, time.perf_counter() - began)
+                self.metrics.rows_replayed += len(rows)
+                self.outbox.commit(position)
+            self._replay_attempt = 0
+            logger.info(f"{self.name} sink replayed its outbox")
+            return True
+
+    def _record_failure(self, rows, error):
+        self.metrics.failures += 1
+        self.metrics.rows_failed += len(rows)
+        logger.error(f"{self.name} sink failed to flush {len(rows)} rows: {error}")
+
+    def _record_flush(self, rows, written, elapsed):
+        self.metrics.flushes += 1
+        self.metrics.rows_written += written
+        self.metrics.rows_ignored += len(rows) - written
+        self.metrics.last_flush_size = len(rows)
+        self.metrics.last_flush_seconds = elapsed
+        self.metrics.total_flush_seconds += elapsed
+        self._write_seconds.observe(elapsed)
+        self._batch_rows.observe(len(rows))
+
+    def _run(self):
+        while not self._stop.is_set():
+            woken = self._wake.wait(min(self.flush_interval, 0.1))
+            self._wake.clear()
+            oldest = self._oldest
+            if woken or (oldest is not None and time.monotonic() - oldest >= self.flush_interval):
+                self.flush()
+            if self.replay_due():
+                self.replay()
+
+    def write_batch(self, rows) -> int:
+        """Write rows to the backing store and return how many were actually stored."""
+        raise NotImplementedError
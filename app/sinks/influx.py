@@ -0,0 +1,240 @@
+import asyncio
+import gzip
+import logging
+import random
+import time
+from datetime import datetime
+
+import requests
+
+from app.core.config import config
+from app.models.EventUpdateObject import StreamRecord
+from app.sinks.base import BufferedSink, PermanentWriteError
+
+logger = logging.getLogger(__name__)
+
+MEASUREMENT = "Building Data"
+PRECISION_DIVISORS = {"ns": 1, "us": 1_000, "ms": 1_000_000, "s": 1_000_000_000}
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_KEY_ESCAPES = str.maketrans({",": r"\,", "=": r"\=", " ": r"\ ", "\n": r"\n"})
+_MEASUREMENT_ESCAPES = str.maketrans({",": r"\,", " ": r"\ ", "\n": r"\n"})
+_STRING_ESCAPES = str.maketrans({'"': r'\"', "\\": r"\\"})
+
+
+def escape_key(value: str) -> str:
+    """Escape a tag key, tag value or field key."""
+    return value.translate(_KEY_ESCAPES)
+
+
+def format_field(value) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return f"{value}i"
+    if isinstance(value, float):
+        return repr(value)
+    return f'"{str(value).translate(_STRING_ESCAPES)}"'
+
+
+def encode_point(measurement: str, tags: dict, fields: dict, timestamp: int) -> str:
+    """Encode one point as an InfluxDB line protocol line. Empty tag values are left out."""
+    tag_set = "".join(f",{escape_key(key)}={escape_key(str(value))}"
+                      for key, value in sorted(tags.items()) if value not in (None, ""))
+    field_set = ",".join(f"{escape_key(key)}={format_field(value)}"
+                         for key, value in fields.items() if value is not None)
+    return f"{measurement.translate(_MEASUREMENT_ESCAPES)}{tag_set} {field_set} {timestamp}"
+
+
+class InfluxLineProtocolSink(BufferedSink):
+    """Batches points as line protocol and writes them gzipped to the InfluxDB v2 write API.
+
+    Failed writes are retried with backoff on the flusher thread, so an InfluxDB outage never stalls the thread that
+    adds the points, which is the stream's reader when the pipeline is off. Once stopping, a failing write is not
+    retried but handed to the outbox.
+    """
+    name = "influx"
+
+    def __init__(self, batch_size: int = config.INFLUXDB_BATCH_SIZE,
+                 flush_interval: float = config.INFLUXDB_FLUSH_INTERVAL,
+                 precision: str = config.INFLUXDB_PRECISION, max_retries: int = config.INFLUXDB_MAX_RETRIES):
+        super().__init__(batch_size, flush_interval)
+        if precision not in PRECISION_DIVISORS:
+            raise ValueError(f"Unsupported InfluxDB precision: {precision}")
+        self.precision = precision
+        self.max_retries = max_retries
+        self.url = f"{config.INFLUXDB_URL.rstrip('/')}/api/v2/write"
+        self.params = {"org": config.INFLUXDB_ORG, "bucket": config.INFLUXDB_BUCKET, "precision": precision}
+        self.headers = {
+            "Authorization": f"Token {config.INFLUXDB_TOKEN}",
+            "Content-Type": "text/plain; charset=utf-8",
+            "Content-Encoding": "gzip",
+        }
+        self.session = requests.Session()
+
+    def add_record(self, record: StreamRecord):
+        batch = record.batch
+        received_at = record.received_at
+        timestamp = self.timestamp(received_at)
+        self.extend([encode_point(MEASUREMENT,
+                                  {"guid": guid, "itemReference": reference, "stream_id": record.stream_id},
+                                  {"presentValue": value}, timestamp)
+                     for guid, value, reference in zip(batch.guids, batch.values, batch.item_references)],
+                    received_at.timestamp())
+
+    def add_samples(self, guid: str, samples: list, stream_id: str):
+        """Add (datetime, value) samples of one GUID, e.g. backfilled trend samples, as points."""
+        self.extend([encode_point(MEASUREMENT, {"guid": guid, "stream_id": stream_id}, {"presentValue": value},
+                                  self.timestamp(moment)) for moment, value in samples])
+
+    def timestamp(self, moment: datetime) -> int:
+        nanoseconds = (int(moment.timestamp()) * 1_000_000 + moment.microsecond) * 1_000
+        return nanoseconds // PRECISION_DIVISORS[self.precision]
+
+    def write_batch(self, rows) -> int:
+        body = gzip.compress("\n".join(rows).encode("utf-8"))
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(self.url, params=self.params, headers=self.headers, data=body)
+            except requests.RequestException as e:
+                error = str(e)
+                retry_after = None
+            else:
+                if response.status_code // 100 == 2:
+                    return len(rows)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    raise PermanentWriteError(f"InfluxDB rejected batch: {response.status_code} - {response.text}")
+                error = f"{response.status_code} - {response.text}"
+                retry_after = response.headers.get("Retry-After")
+            if attempt == self.max_retries:
+                break
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else self.backoff(attempt)
+            logger.warning(f"InfluxDB write failed ({error}), retrying in {delay:.2f}s")
+            if self._stop.wait(delay):
+                break
+            self.metrics.retries += 1
+        raise Exception(f"InfluxDB write failed after {attempt} retries: {error}")
+
+    @staticmethod
+    def backoff(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+        """Full-jitter exponential backoff."""
+        return random.uniform(0, min(cap, base * 2 ** attempt))
+
+    def stop(self):
+        super().stop()
+        self.session.close()
+
+
+class AsyncInfluxLineProtocolSink(InfluxLineProtocolSink):
+    """Event-loop variant of the Influx sink: flushes from an asyncio task over a pooled httpx.AsyncClient."""
+
+    def __init__(self, client, **kwargs):
+        """
+        :param client: httpx.AsyncClient dedicated to the InfluxDB server.
+        """
+        super().__init__(**kwargs)
+        self.client = client
+        self._wake_async = None
+        self._task = None
+        self._stopping = False
+
+    def _on_full(self):
+        if self._wake_async is not None:
+            self._wake_async.set()
+
+    async def start_async(self):
+        self._stopping = False
+        self._wake_async = asyncio.Event()
+        self._task = asyncio.create_task(self._run_async())
+
+    async def stop_async(self):
+        """Let the flush task finish its current write, then write out whatever is still pending."""
+        if self._task is not None:
+            self._stopping = True
+            self._wake_async.set()
+            await self._task
+            self._task = None
+        await self.flush_async()
+
+    async def flush_async(self):
+        rows = self._take()
+        committed = False
+        for start in range(0, len(rows), self.batch_size):
+            chunk = rows[start:start + self.batch_size]
+            committed = False
+            if self.outbox is not None and self.outbox.pending:
+                self._spill(chunk)
+                continue
+            began = time.perf_counter()
+            try:
+                written = await self.write_batch_async(chunk)
+            except Exception as e:
+                self._handle_write_error(chunk, e)
+                continue
+            self._record_flush(chunk, written, time.perf_counter() - began)
+            committed = True
+        self._observe_lag(committed)
+
+    async def replay_async(self) -> bool:
+        """Same as replay, writing over the shared httpx client."""
+        while self.outbox.pending:
+            entries, position = self.outbox.read(config.OUTBOX_REPLAY_BATCHES)
+            rows = [row for entry in entries for row in entry]
+            began = time.perf_counter()
+            try:
+                written = await self.write_batch_async(rows)
+            except PermanentWriteError:
+                written = 0
+                for entry in entries:
+                    try:
+                        written += await self.write_batch_async(entry)
+                    except Exception as entry_error:
+                        self._record_failure(entry, entry_error)
+            except Exception as e:
+                self.metrics.failures += 1
+                logger.warning(f"{self.name} sink could not replay {len(rows)} rows from the outbox: {e}")
+                self._schedule_replay()
+                return False
+            self._record_flush(rows, written, time.perf_counter() - began)
+            self.metrics.rows_replayed += len(rows)
+            self.outbox.commit(position)
+        self._replay_attempt = 0
+        logger.info(f"{self.name} sink replayed its outbox")
+        return True
+
+    async def _run_async(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake_async.wait(), min(self.flush_interval, 0.1))
+                woken = True
+            except asyncio.TimeoutError:
+                woken = False
+            self._wake_async.clear()
+            oldest = self._oldest
+            if woken or (oldest is not None and time.monotonic() - oldest >= self.flush_interval):
+                await self.flush_async()
+            if self.replay_due():
+                await self.replay_async()
+
+    async def write_batch_async(self, rows) -> int:
+        body = await asyncio.to_thread(gzip.compress, "\n".join(rows).encode("utf-8"))
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self.client.post(self.url, params=self.params, headers=self.headers, content=body)
+            except Exception as e:
+                error = str(e)
+                retry_after = None
+            else:
+                if response.status_code // 100 == 2:
+                    return len(rows)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    raise PermanentWriteError(f"InfluxDB rejected batch: {response.status_code} - {response.text}")
+                error = f"{response.status_code} - {response.text}"
+                retry_after = response.headers.get("Retry-After")
+            if attempt == self.max_retries:
+                break
+            self.metrics.retries += 1
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else self.backoff(attempt)
+            logger.warning(f"InfluxDB write failed ({error}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+        raise Exception(f"InfluxDB write failed after {self.max_retries} retries: {error}")
@@ -0,0 +1,212 @@
+import logging
+import threading
+import time
+
+from paho.mqtt import client as mqtt
+
+from app.core.config import config
+from app.models.EventUpdateObject import StreamRecord
+from app.sinks.base import BufferedSink
+from app.util import sparkplug
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = "spBv1.0"
+BD_SEQ_METRIC = "bdSeq"
+REBIRTH_METRIC = "Node Control/Rebirth"
+
+
+class SparkplugMQTTSink(BufferedSink):
+    """Publishes present values as Sparkplug B DDATA messages for one edge node and device.
+
+    Every GUID gets a metric alias. A DBIRTH naming all known metrics is published before the first DDATA that
+    uses a new alias, after each (re)connect and on a Node Control/Rebirth command; DDATA messages then carry up to
+    metrics_per_message metrics identified by alias only. With QoS 1, at most max_inflight messages are
+    unacknowledged at a time and the flusher waits for the broker before publishing more.
+    """
+    name = "mqtt"
+
+    def __init__(self, mqtt_util, group_id: str = config.SPARKPLUG_GROUP_ID,
+                 edge_node_id: str = config.SPARKPLUG_EDGE_NODE_ID, device_id: str = config.SPARKPLUG_DEVICE_ID,
+                 batch_size: int = config.MQTT_BATCH_SIZE, flush_interval: float = config.MQTT_FLUSH_INTERVAL,
+                 metrics_per_message: int = config.MQTT_METRICS_PER_MESSAGE, qos: int = config.MQTT_QOS,
+                 max_inflight: int = config.MQTT_MAX_INFLIGHT, publish_timeout: float = config.MQTT_PUBLISH_TIMEOUT):
+        """
+        :param mqtt_util: MQTTUtil whose client is used for publishing.
+        :param group_id: Sparkplug group id.
+        :param edge_node_id: Sparkplug edge node id.
+        :param device_id: Sparkplug device id the GUID metrics belong to.
+        :param metrics_per_message: Maximum number of metrics in one DDATA message.
+        :param qos: QoS of birth and data messages.
+        :param max_inflight: Maximum number of unacknowledged QoS 1 messages.
+        :param publish_timeout: Seconds to wait for room in the in-flight window before giving up on a flush.
+        """
+        super().__init__(batch_size, flush_interval)
+        self.mqtt_util = mqtt_util
+        self.client = mqtt_util.client
+        self.metrics_per_message = metrics_per_message
+        self.qos = qos
+        self.max_inflight = max_inflight
+        self.publish_timeout = publish_timeout
+        self.nbirth_topic = f"{NAMESPACE}/{group_id}/NBIRTH/{edge_node_id}"
+        self.ndeath_topic = f"{NAMESPACE}/{group_id}/NDEATH/{edge_node_id}"
+        self.ncmd_topic = f"{NAMESPACE}/{group_id}/NCMD/{edge_node_id}"
+        self.dbirth_topic = f"{NAMESPACE}/{group_id}/DBIRTH/{edge_node_id}/{device_id}"
+        self.ddata_topic = f"{NAMESPACE}/{group_id}/DDATA/{edge_node_id}/{device_id}"
+        self.aliases = {}
+        self.last_values = {}
+        self.bd_seq = 0
+        self.messages_published = 0
+        self.births = 0
+        self._seq = 0
+        self._rebirth = True
+        self._inflight = []
+        self._acked = threading.Condition()
+        # Flushes and outbox replays both publish; aliases, sequence numbers and the order of messages on the wire
+        # have to be kept consistent across them.
+        self._publish_lock = threading.RLock()
+        # paho refuses to change this once a connection is open, and MQTTUtil may connect before start().
+        self.client.max_inflight_messages_set(max_inflight)
+
+    def add_record(self, record: StreamRecord):
+        batch = record.batch
+        timestamp = int(record.received_at.timestamp() * 1000)
+        self.extend([(guid, value, timestamp) for guid, value in zip(batch.guids, batch.values)], timestamp / 1000)
+
+    def start(self):
+        self.client.on_publish = self._on_publish
+        self.client.message_callback_add(self.ncmd_topic, self._on_command)
+        self.mqtt_util.connect_callbacks.append(self._on_connect)
+        self.mqtt_util.disconnect_callbacks.append(self._on_disconnect)
+        self._set_will()
+        # The will is only sent to the broker with CONNECT, so reconnect for the NDEATH to take effect.
+        self.mqtt_util.reconnect()
+        super().start()
+
+    def stop(self):
+        super().stop()
+        try:
+            self.client.publish(self.ndeath_topic, self._ndeath_payload(), qos=1)
+        except Exception as e:
+            logger.error(f"Error publishing NDEATH: {e}")
+
+    def flush(self):
+        # Without any aliases yet, the births go out with the first batch instead.
+        if self._rebirth and self.aliases:
+            with self._publish_lock:
+                try:
+                    self._publish_births()
+                except Exception as e:
+                    logger.error(f"Error publishing Sparkplug births: {e}")
+        super().flush()
+
+    def write_batch(self, rows) -> int:
+        with self._publish_lock:
+            new_guids = False
+            for guid, value, timestamp in rows:
+                if guid not in self.aliases:
+                    self.aliases[guid] = len(self.aliases)
+                    new_guids = True
+                self.last_values[guid] = (value, timestamp)
+            if new_guids or self._rebirth:
+                self._publish_births()
+            now = int(time.time() * 1000)
+            for start in range(0, len(rows), self.metrics_per_message):
+                metrics = [sparkplug.encode_double_metric(self.aliases[guid], timestamp, value)
+                           for guid, value, timestamp in rows[start:start + self.metrics_per_message]]
+                self._publish(self.ddata_topic, sparkplug.encode_payload(now, metrics, self._next_seq()))
+        return len(rows)
+
+    def _publish_births(self):
+        now = int(time.time() * 1000)
+        self._seq = 0
+        self._publish(self.nbirth_topic, sparkplug.encode_payload(now, [
+            sparkplug.encode_metric(name=BD_SEQ_METRIC, timestamp=now, datatype=sparkplug.UINT64, value=self.bd_seq),
+            sparkplug.encode_metric(name=REBIRTH_METRIC, timestamp=now, datatype=sparkplug.BOOLEAN, value=False),
+        ], self._next_seq()))
+        metrics = []
+        for guid, alias in self.aliases.items():
+            value, timestamp = self.last_values.get(guid, (None, now))
+            metrics.append(sparkplug.encode_metric(name=guid, alias=alias, timestamp=timestamp,
+                                                   datatype=sparkplug.DOUBLE, value=value))
+        self._publish(self.dbirth_topic, sparkplug.encode_payload(now, metrics, self._next_seq()))
+        self._rebirth = False
+        self.births += 1
+
+    def _next_seq(self) -> int:
+        # Called with the publish lock held.
+        seq = self._seq
+        self._seq = (seq + 1) % 256
+        return seq
+
+    def _publish(self, topic: str, payload: bytes):
+        if not self.client.is_connected():
+            raise ConnectionError("MQTT client is not connected")
+        if self.qos > 0:
+            self._wait_for_window()
+        info = self.client.publish(topic, payload, qos=self.qos)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            raise ConnectionError(f"MQTT publish failed: {mqtt.error_string(info.rc)}")
+        if self.qos > 0:
+            self._inflight.append(info)
+        self.messages_published += 1
+
+    def _wait_for_window(self):
+        """Block until fewer than max_inflight published messages are waiting for their PUBACK."""
+        deadline = time.monotonic() + self.publish_timeout
+        with self._acked:
+            while True:
+                self._inflight = [info for info in self._inflight if not info.is_published()]
+                if len(self._inflight) < self.max_inflight:
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    # Forget what the broker never acknowledged so the window does not stay closed for good.
+                    logger.warning(f"Dropping {len(self._inflight)} unacknowledged MQTT messages from the window")
+                    self._inflight = []
+                    raise TimeoutError(f"No MQTT acknowledgement within {self.publish_timeout}s")
+                # paho marks a message published only after on_publish returns, so poll in short slices.
+                self._acked.wait(min(remaining, 0.05))
+
+    def _on_publish(self, client, userdata, mid):
+        # Runs on paho's network thread while it holds its own locks; only wake the waiting flusher.
+        with self._acked:
+            self._acked.notify()
+
+    def _on_connect(self):
+        self.client.subscribe(self.ncmd_topic, qos=1)
+        self._request_rebirth()
+
+    def _on_disconnect(self):
+        # A new session needs a new bdSeq, and the will has to announce it before paho reconnects.
+        self.bd_seq = (self.bd_seq + 1) % 256
+        self._set_will()
+        self._rebirth = True
+
+    def _on_command(self, client, userdata, message):
+        try:
+            payload = sparkplug.decode_payload(message.payload)
+        except Exception as e:
+            logger.error(f"Error decoding NCMD: {e}")
+            return
+        if any(metric.get("name") == REBIRTH_METRIC and metric.get("value") for metric in payload["metrics"]):
+            logger.info("Rebirth requested")
+            self._request_rebirth()
+
+    def _request_rebirth(self):
+        # Births are published by the flusher thread; the network thread must never wait on the window.
+        self._rebirth = True
+        self._wake.set()
+
+    def _set_will(self):
+        self.client.will_set(self.ndeath_topic, self._ndeath_payload(), qos=1)
+
+    def _ndeath_payload(self) -> bytes:
+        now = int(time.time() * 1000)
+        return sparkplug.encode_payload(now, [
+            sparkplug.encode_metric(name=BD_SEQ_METRIC, timestamp=now, datatype=sparkplug.UINT64, value=self.bd_seq),
+        ])
+
+    def stats(self) -> dict:
+        return {"aliases": len(self.aliases), "births": self.births, "messages": self.messages_published,
+                "inflight": len(self._inflight), "bd_seq": self.bd_seq}
@@ -0,0 +1,133 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from app.core.config import config
+from app.db.CRUDHandle import EventCrudHandler
+from app.sinks.base import BufferedSink
+
+logger = logging.getLogger(__name__)
+
+
+class MySQLEventSink(BufferedSink):
+    """Buffers event rows and bulk inserts them into the events table.
+
+    Stream events are registered with track() in arrival order, and committed_event_id only advances to an event
+    once it and every event before it are stored: committed, or without rows to store. on_commit is called with
+    each new committed_event_id, so the resume checkpoint never passes an event that a crash would lose. Rows of a
+    failed write that wait in the outbox hold it back until the outbox is replayed; rows lost for good do not.
+    """
+    name = "mysql"
+
+    def __init__(self, db_session, batch_size: int = config.MYSQL_BATCH_SIZE,
+                 flush_interval: float = config.MYSQL_FLUSH_INTERVAL, dedupe_ids: bool = config.EVENTS_PARTITIONING):
+        """
+        :param dedupe_ids: Deduplicate on the event_ids table, for an events table partitioned by timestamp.
+        """
+        super().__init__(batch_size, flush_interval)
+        self.db_session = db_session
+        self.dedupe_ids = dedupe_ids
+        self.on_commit = None
+        self.committed_event_id = None
+        self._sequence = 0
+        # (sequence, event id) of tracked events in arrival order, until they and all before them are stored.
+        self._outstanding = deque()
+        self._stored = set()
+        # Sequences of the events whose rows are buffered, and of those whose rows wait in the outbox.
+        self._sequences = []
+        self._held = []
+        self._spilled = False
+        self._checkpoint_lock = threading.RLock()
+
+    def track(self, event_id, has_rows: bool) -> int:
+        """Register a stream event in arrival order and return the sequence its rows are extended with."""
+        with self._checkpoint_lock:
+            self._sequence += 1
+            sequence = self._sequence
+            self._outstanding.append((sequence, event_id))
+            if not has_rows:
+                self._complete([sequence])
+        return sequence
+
+    def extend(self, rows, received_at: float = None, sequence: int = None):
+        """
+        :param sequence: Sequence from track() of the event the rows belong to.
+        """
+        # The sequence goes in with the rows, so a flush never takes one without the other.
+        with self._lock:
+            if not self._buffer:
+                self._oldest = time.monotonic()
+                self._received = received_at
+            self._buffer.extend(rows)
+            if sequence is not None:
+                self._sequences.append(sequence)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._on_full()
+
+    def flush(self):
+        with self._flush_lock:
+            # Taken before the rows: an event extended in between then has its rows taken and its sequence left
+            # for the next flush, which only delays the checkpoint.
+            with self._lock:
+                sequences, self._sequences = self._sequences, []
+            rows = self._take()
+            self._spilled = False
+            committed = False
+            for start in range(0, len(rows), self.batch_size):
+                committed = self._write(rows[start:start + self.batch_size])
+            self._observe_lag(committed)
+            if sequences:
+                with self._checkpoint_lock:
+                    if self._spilled and self.outbox.pending:
+                        self._held.extend(sequences)
+                    else:
+                        self._complete(sequences)
+
+    def replay(self) -> bool:
+        replayed = super().replay()
+        if replayed:
+            with self._checkpoint_lock:
+                if not self.outbox.pending:
+                    held, self._held = self._held, []
+                    self._complete(held)
+        return replayed
+
+    def write_batch(self, rows) -> int:
+        with self.db_session.session_context() as db:
+            crud_session = EventCrudHandler(db)
+            written = crud_session.store_events_bulk(rows, dedupe_ids=self.dedupe_ids)
+        if written < len(rows):
+            logger.info(f"Skipped {len(rows) - written} duplicate events")
+        return written
+
+    def _overflow(self):
+        # Rows and sequences are taken together, so no event whose rows are in the outbox is completed early.
+        with self._lock:
+            sequences, self._sequences = self._sequences, []
+            rows, self._buffer, self._oldest, self._received = self._buffer, [], None, None
+        if rows:
+            logger.warning(f"{self.name} sink is falling behind, keeping {len(rows)} rows in the outbox")
+            self._spill(rows)
+        with self._checkpoint_lock:
+            self._held.extend(sequences)
+
+    def _spill(self, rows):
+        super()._spill(rows)
+        self._spilled = True
+
+    def _complete(self, sequences):
+        # Called with the checkpoint lock held, which also keeps on_commit calls in order.
+        self._stored.update(sequences)
+        event_id = None
+        outstanding = self._outstanding
+        while outstanding and outstanding[0][0] in self._stored:
+            sequence, current = outstanding.popleft()
+            self._stored.discard(sequence)
+            if current is not None:
+                event_id = current
+        if event_id is not None:
+            self.committed_event_id = event_id
+            if self.on_commit is not None:
+                self.on_commit(event_id)
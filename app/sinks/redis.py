@@ -0,0 +1,104 @@
+import logging
+import time
+
+from app.core.config import config
+from app.models.EventUpdateObject import StreamRecord
+from app.sinks.base import BufferedSink
+
+logger = logging.getLogger(__name__)
+
+LAST_EVENT_ID_KEY = "STREAM_LAST_EVENT_ID"
+
+
+class RedisCheckpointSink(BufferedSink):
+    """Coalesces the stream checkpoint and per-GUID latest values, and writes them in one Redis pipeline.
+
+    Only the newest checkpoint and the newest value of each GUID since the last flush are written. A flush
+    happens every batch_size events or flush_interval seconds, whichever comes first. The checkpoint is not taken
+    from the events themselves but set through set_checkpoint() once the MySQL sink has stored them, so resuming
+    from it after a crash never skips events that were only buffered.
+    """
+    name = "redis"
+
+    def __init__(self, redis_util, batch_size: int = config.REDIS_CHECKPOINT_EVENTS,
+                 flush_interval: float = config.REDIS_CHECKPOINT_INTERVAL, ttl: int = config.REDIS_TTL,
+                 redis_prefix: str = ""):
+        """
+        :param redis_prefix: Prepended to the checkpoint key, so every shard keeps its own checkpoint.
+        """
+        super().__init__(batch_size, flush_interval)
+        self.redis_util = redis_util
+        self.last_event_id_key = f"{redis_prefix}{LAST_EVENT_ID_KEY}"
+        self.ttl = ttl
+        self._buffer = {}
+        self._last_event_id = None
+        self._events = 0
+
+    def add_record(self, record: StreamRecord):
+        batch = record.batch
+        latest = {}
+        if batch:
+            timestamp = record.received_at.isoformat()
+            for i in range(len(batch)):
+                fields = {"value": batch.values[i], "eventId": record.item_event_id(i), "timestamp": timestamp}
+                if batch.reliability[i] is not None:
+                    fields["reliability"] = batch.reliability[i]
+                if batch.priority[i] is not None:
+                    fields["priority"] = batch.priority[i]
+                latest[batch.guids[i]] = fields
+        with self._lock:
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self._buffer.update(latest)
+            self._events += 1
+            full = self._events >= self.batch_size
+        if full:
+            self._on_full()
+
+    def set_checkpoint(self, event_id: str):
+        """Resume from event_id after a restart; written with the next flush."""
+        with self._lock:
+            self._last_event_id = event_id
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+
+    def _take(self):
+        with self._lock:
+            latest, event_id = self._buffer, self._last_event_id
+            self._buffer, self._last_event_id, self._events, self._oldest = {}, None, 0, None
+        return latest, event_id
+
+    def _restore(self, latest: dict, event_id):
+        """Put back what a failed flush took, unless newer data arrived in the meantime."""
+        with self._lock:
+            for guid, fields in latest.items():
+                self._buffer.setdefault(guid, fields)
+            if self._last_event_id is None:
+                self._last_event_id = event_id
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+
+    def flush(self):
+        with self._flush_lock:
+            latest, event_id = self._take()
+            if not latest and event_id is None:
+                return
+            began = time.perf_counter()
+            try:
+                written = self.write_checkpoint(latest, event_id)
+            except Exception as e:
+                self._record_failure(latest, e)
+                self._restore(latest, event_id)
+                return
+            self._record_flush(latest, written, time.perf_counter() - began)
+
+    def write_checkpoint(self, latest: dict, event_id) -> int:
+        pipe = self.redis_util.redis_client.pipeline(transaction=False)
+        for guid, fields in latest.items():
+            key = f"{config.REDIS_LATEST_PREFIX}{guid}"
+            pipe.hset(key, mapping=fields)
+            pipe.expire(key, self.ttl)
+        if event_id is not None:
+            pipe.set(self.last_event_id_key, event_id)
+        pipe.execute()
+        return len(latest)
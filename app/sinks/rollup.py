@@ -0,0 +1,132 @@
+import logging
+from datetime import datetime, timezone
+
+from app.core.config import config
+from app.db.CRUDHandle import EventCrudHandler
+from app.db.models import EventRollup15m, EventRollup1h, EventRollup1m
+from app.models.EventUpdateObject import StreamRecord
+from app.sinks.base import BufferedSink
+
+logger = logging.getLogger(__name__)
+
+# Window length in seconds, rollup table and retention in days (0 keeps rows forever) of each resolution.
+RESOLUTIONS = {
+    "1m": (60, EventRollup1m, config.ROLLUP_1M_RETENTION_DAYS),
+    "15m": (900, EventRollup15m, config.ROLLUP_15M_RETENTION_DAYS),
+    "1h": (3600, EventRollup1h, config.ROLLUP_1H_RETENTION_DAYS),
+}
+
+# Positions in an aggregate list.
+COUNT, MIN, MAX, SUM, LAST, LAST_TIME = range(6)
+
+
+def utc(timestamp: float) -> datetime:
+    """Rollup tables keep naive UTC times, so windows aligned on the epoch do not move with the server's zone."""
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).replace(tzinfo=None)
+
+
+def aggregate(rows, seconds: int) -> dict:
+    """Aggregate (guid, time, value) rows into {(guid, window start): [count, min, max, sum, last, last time]}."""
+    windows = {}
+    get = windows.get
+    for guid, timestamp, value in rows:
+        key = (guid, timestamp - timestamp % seconds)
+        agg = get(key)
+        if agg is None:
+            windows[key] = [1, value, value, value, value, timestamp]
+            continue
+        agg[COUNT] += 1
+        if value < agg[MIN]:
+            agg[MIN] = value
+        if value > agg[MAX]:
+            agg[MAX] = value
+        agg[SUM] += value
+        if timestamp >= agg[LAST_TIME]:
+            agg[LAST] = value
+            agg[LAST_TIME] = timestamp
+    return windows
+
+
+def coarsen(windows: dict, seconds: int) -> dict:
+    """Merge aggregates of shorter windows into windows of the given length."""
+    merged = {}
+    for (guid, start), agg in windows.items():
+        key = (guid, start - start % seconds)
+        into = merged.get(key)
+        if into is None:
+            merged[key] = list(agg)
+            continue
+        into[COUNT] += agg[COUNT]
+        into[MIN] = min(into[MIN], agg[MIN])
+        into[MAX] = max(into[MAX], agg[MAX])
+        into[SUM] += agg[SUM]
+        if agg[LAST_TIME] >= into[LAST_TIME]:
+            into[LAST] = agg[LAST]
+            into[LAST_TIME] = agg[LAST_TIME]
+    return merged
+
+
+class RollupEngine(BufferedSink):
+    """Keeps 1-minute, 15-minute and 1-hour min/max/avg/last/count of every GUID in the rollup tables.
+
+    Buffered values are aggregated per flush: raw rows into 1-minute windows, those into the longer ones. The
+    partial aggregates are then merged into the stored rows, so a window can be written by any number of flushes.
+
+    Values are placed by their event time. The stream carries no sample time, so a live value's time is when it
+    was received, as stored in the events table; a backfilled trend sample has its own. Live values older than the
+    watermark (the newest event time seen minus allowed_lateness), such as records read back from a pipeline spill
+    long after they arrived, are dropped and counted. Backfilled samples are always counted: they only fill gaps
+    that no live value covers, so they cannot count a value twice.
+    """
+    name = "rollup"
+
+    def __init__(self, db_session, batch_size: int = config.ROLLUP_BATCH_SIZE,
+                 flush_interval: float = config.ROLLUP_FLUSH_INTERVAL,
+                 allowed_lateness: float = config.ROLLUP_ALLOWED_LATENESS):
+        """
+        :param db_session: DBSession the rollup tables are written through.
+        :param allowed_lateness: Seconds an event may lag behind the newest one and still be counted.
+        """
+        super().__init__(batch_size, flush_interval)
+        self.db_session = db_session
+        self.allowed_lateness = allowed_lateness
+        self.watermark = 0.0
+        self.late_dropped = 0
+
+    def add_record(self, record: StreamRecord):
+        batch = record.batch
+        timestamp = record.received_at.timestamp()
+        if timestamp < self.watermark:
+            self.late_dropped += len(batch)
+            return
+        self.watermark = max(self.watermark, timestamp - self.allowed_lateness)
+        self.extend([(guid, timestamp, value) for guid, value in zip(batch.guids, batch.values)], timestamp)
+
+    def add_samples(self, guid: str, samples: list):
+        """Count backfilled (time, value) samples of guid in the windows of their own times."""
+        self.extend([(guid, moment.timestamp(), value) for moment, value in samples])
+
+    def write_batch(self, rows) -> int:
+        windows = aggregate(rows, RESOLUTIONS["1m"][0])
+        with self.db_session.session_context() as db:
+            crud_session = EventCrudHandler(db)
+            for seconds, model, _ in RESOLUTIONS.values():
+                windows = coarsen(windows, seconds)
+                crud_session.upsert_rollups(model, [{
+                    "guid": guid,
+                    "bucket": utc(start),
+                    "count": agg[COUNT],
+                    "min_value": agg[MIN],
+                    "max_value": agg[MAX],
+                    "sum_value": agg[SUM],
+                    "avg_value": agg[SUM] / agg[COUNT],
+                    "last_value": agg[LAST],
+                    "last_timestamp": utc(agg[LAST_TIME]),
+                } for (guid, start), agg in windows.items()])
+            # One commit for every resolution: a failure rolls them all back, so a retry never counts a window twice.
+            db.commit()
+        return len(rows)
+
+    def stats(self) -> dict:
+        return {"watermark": datetime.fromtimestamp(self.watermark).isoformat() if self.watermark else None,
+                "late_dropped": self.late_dropped}
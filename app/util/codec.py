@@ -0,0 +1,83 @@
+"""JSON codec used on the hot path.
+
+Picks the fastest installed backend: msgspec (typed struct decoding), then orjson, then the stdlib json module.
+"""
+import json
+import logging
+from typing import Any
+
+from app.models.EventBatch import EventBatch
+
+logger = logging.getLogger(__name__)
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if msgspec is not None:
+    BACKEND = "msgspec"
+
+    class PresentValueStruct(msgspec.Struct):
+        reliability: str | None = None
+        priority: str | None = None
+
+    class ConditionStruct(msgspec.Struct):
+        presentValue: PresentValueStruct | None = None
+
+    class ItemStruct(msgspec.Struct):
+        id: str
+        # Any, so an item with an object value is skipped like on the other backends instead of failing the event.
+        presentValue: Any = None
+        itemReference: str | None = None
+
+    class EventUpdateStruct(msgspec.Struct):
+        item: ItemStruct
+        condition: ConditionStruct | None = None
+
+    _update_decoder = msgspec.json.Decoder(list[EventUpdateStruct])
+    _decoder = msgspec.json.Decoder()
+    _encoder = msgspec.json.Encoder()
+
+    def loads(data):
+        return _decoder.decode(data)
+
+    def dumps(obj) -> bytes:
+        return _encoder.encode(obj)
+
+    def decode_update(data) -> EventBatch:
+        """Decode the JSON array of an object.values.update event into an EventBatch."""
+        return EventBatch.from_structs(_update_decoder.decode(data))
+
+elif orjson is not None:
+    BACKEND = "orjson"
+
+    def loads(data):
+        return orjson.loads(data)
+
+    def dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+
+    def decode_update(data) -> EventBatch:
+        """Decode the JSON array of an object.values.update event into an EventBatch."""
+        return EventBatch.from_items(orjson.loads(data))
+
+else:
+    BACKEND = "json"
+
+    def loads(data):
+        return json.loads(data)
+
+    def dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+    def decode_update(data) -> EventBatch:
+        """Decode the JSON array of an object.values.update event into an EventBatch."""
+        return EventBatch.from_items(json.loads(data))
+
+logger.debug(f"Using {BACKEND} JSON codec")
@@ -0,0 +1,194 @@
+"""Counters, gauges and histograms rendered in the Prometheus text exposition format.
+
+Metrics are plain objects updated in place on the hot path: an increment or an observation is a dict lookup and a
+few additions under a lock. Values that already live elsewhere (sink FlushMetrics, queue depths) are not copied
+into metrics but read by collectors, functions returning families, when /metrics is scraped.
+"""
+import bisect
+import math
+import threading
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LAG_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 900)
+SIZE_BUCKETS = (1, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+
+
+class Family:
+    """One metric as collected for exposition: samples are (name suffix, ((label, value), ...), value)."""
+
+    def __init__(self, name: str, kind: str, help: str, samples: list = None):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.samples = samples if samples is not None else []
+
+    def add(self, value, suffix: str = "", **labels):
+        self.samples.append((suffix, tuple(labels.items()), value))
+        return self
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """The child for one combination of label values. Keep it around on hot paths instead of looking it up."""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._child())
+        return child
+
+    def _child(self):
+        raise NotImplementedError
+
+    def collect(self) -> Family:
+        family = Family(self.name, self.kind, self.help)
+        for values, child in list(self._children.items()):
+            labels = tuple(zip(self.label_names, values))
+            family.samples.extend((suffix, labels + extra, value) for suffix, extra, value in child.samples())
+        return family
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def set(self, value: float):
+        self.value = value
+
+    def samples(self):
+        return [("", (), self.value)]
+
+
+class _Buckets:
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def samples(self):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        samples, cumulative = [], 0
+        for bound, count in zip(self.bounds + (math.inf,), counts):
+            cumulative += count
+            samples.append(("_bucket", (("le", format_value(bound)),), cumulative))
+        samples.append(("_sum", (), total))
+        samples.append(("_count", (), cumulative))
+        return samples
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def _child(self):
+        return _Value()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def _child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: tuple = ()) -> Gauge:
+        return self._register(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def register_collector(self, collector):
+        """Add a callable returning a list of Families, called on every collect()."""
+        self.collectors.append(collector)
+
+    def collect(self) -> list:
+        families = [metric.collect() for metric in self.metrics.values()]
+        for collector in self.collectors:
+            families.extend(collector())
+        return families
+
+    def _register(self, metric: Metric) -> Metric:
+        # Registering the same name again returns the first metric, so modules can be imported more than once.
+        return self.metrics.setdefault(metric.name, metric)
+
+
+def format_value(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+
+def render(families: list) -> str:
+    """Render families in the Prometheus text format, merging families of the same name."""
+    merged = {}
+    for family in families:
+        if family.name in merged:
+            merged[family.name].samples.extend(family.samples)
+        else:
+            merged[family.name] = Family(family.name, family.kind, family.help, list(family.samples))
+    lines = []
+    for family in merged.values():
+        lines.append(f"# HELP {family.name} {family.help}")
+        lines.append(f"# TYPE {family.name} {family.kind}")
+        for suffix, labels, value in family.samples:
+            label_set = ",".join(f'{key}="{_escape(label)}"' for key, label in labels)
+            lines.append(f"{family.name}{suffix}{{{label_set}}} {format_value(value)}" if label_set
+                         else f"{family.name}{suffix} {format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+registry = Registry()
@@ -1,7 +1,85 @@
-import json
+import logging
+import queue
+import threading
 
 from paho.mqtt import client as mqtt
 from app.core.config import config
+from app.util import codec
+
+logger = logging.getLogger(__name__)
+
+
+class LoopbackMessageInfo:
+    def __init__(self, mid: int):
+        self.mid = mid
+        self.rc = mqtt.MQTT_ERR_SUCCESS
+        self._published = threading.Event()
+
+    def is_published(self) -> bool:
+        return self._published.is_set()
+
+
+class LoopbackMQTTClient:
+    """In-process stand-in for the paho client, used when MQTT_URL is "loopback".
+
+    Published messages are kept in messages and QoS 1 messages are acknowledged from a separate thread, as a
+    broker would. deliver() hands a message to the callbacks registered for its topic.
+    """
+
+    def __init__(self, keep: int = 10000):
+        self.messages = []
+        self.keep = keep
+        self.on_publish = None
+        self.will = None
+        self._mid = 0
+        self._callbacks = {}
+        self._acks = queue.Queue()
+        threading.Thread(target=self._ack_loop, name="mqtt-loopback", daemon=True).start()
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self._mid += 1
+        info = LoopbackMessageInfo(self._mid)
+        self.messages.append((topic, payload, qos, retain))
+        del self.messages[:-self.keep]
+        if qos > 0:
+            self._acks.put(info)
+        else:
+            info._published.set()
+        return info
+
+    def _ack_loop(self):
+        while True:
+            info = self._acks.get()
+            if self.on_publish:
+                self.on_publish(self, None, info.mid)
+            info._published.set()
+
+    def deliver(self, topic: str, payload: bytes):
+        message = mqtt.MQTTMessage(topic=topic.encode("utf-8"))
+        message.payload = payload
+        if topic in self._callbacks:
+            self._callbacks[topic](self, None, message)
+
+    def message_callback_add(self, topic, callback):
+        self._callbacks[topic] = callback
+
+    def will_set(self, topic, payload=None, qos=0, retain=False):
+        self.will = (topic, payload, qos, retain)
+
+    def is_connected(self) -> bool:
+        return True
+
+    def subscribe(self, topic, qos=0):
+        return mqtt.MQTT_ERR_SUCCESS, 0
+
+    def max_inflight_messages_set(self, inflight):
+        pass
+
+    def reconnect(self):
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def loop_start(self):
+        return mqtt.MQTT_ERR_SUCCESS
 
 
 class MQTTUtil:
@@ -15,29 +93,75 @@ class MQTTUtil:
             if hasattr(cls, "_initialized") and cls._initialized:
                 return
 
+            # Called with no arguments from paho's network thread after every (re)connect and disconnect.
+            cls._instance.connect_callbacks = []
+            cls._instance.disconnect_callbacks = []
+            if config.MQTT_URL == "loopback":
+                cls._instance.client = LoopbackMQTTClient()
+                cls._instance._initialized = True
+                return cls._instance
+
+            # The broker is only contacted by connect(), so importing this module never blocks on the network.
             cls._instance.client = mqtt.Client()
             cls._instance.client.username_pw_set(config.MQTT_USERNAME, config.MQTT_PASSWORD)
             cls._instance.client.on_connect = cls._instance.on_connect
             cls._instance.client.on_disconnect = cls._instance.on_disconnect
-
-            try:
-                cls._instance.client.connect(config.MQTT_URL, config.MQTT_PORT)
-                # Start a background network loop to process network traffic
-                cls._instance.client.loop_start()
-            except Exception as e:
-                print(f"Connection failed: {e}")
-
+            cls._instance._loop_started = False
+            cls._instance._connected = threading.Event()
             cls._instance._initialized = True
         return cls._instance
 
-    def on_connect(self, rc):
+    def connect(self, timeout: float = config.MQTT_STARTUP_TIMEOUT):
+        """Start the network loop, which connects to the broker and reconnects whenever the connection is lost, then
+        wait up to timeout seconds for the connection.
+
+        Raises ConnectionError if the broker was not reached in time; the loop keeps trying in the background, so a
+        broker that is down at startup is picked up once it is back.
+        """
+        if config.MQTT_URL == "loopback":
+            return
+        self._start_loop()
+        if not self._connected.wait(timeout):
+            logger.error(f"MQTT broker {config.MQTT_URL}:{config.MQTT_PORT} not reached yet, still retrying")
+            raise ConnectionError(f"MQTT broker not reached after {timeout}s")
+
+    def is_connected(self) -> bool:
+        return self.client.is_connected()
+
+    def on_connect(self, client, userdata, flags, rc):
         if rc == 0:
-            print("Connected to MQTT Broker!")
+            logger.info("Connected to MQTT Broker!")
+            self._connected.set()
+            for callback in self.connect_callbacks:
+                callback()
         else:
-            print(f"Failed to connect, return code: {rc}")
+            logger.error(f"Failed to connect, return code: {rc}")
+
+    def on_disconnect(self, client, userdata, rc):
+        logger.warning("Disconnected from MQTT Broker")
+        for callback in self.disconnect_callbacks:
+            callback()
+
+    def reconnect(self):
+        """Reconnect, e.g. so a will set after the first connect reaches the broker.
 
-    def on_disconnect(self):
-        print("Disconnected from MQTT Broker")
+        While the broker is not reached yet, the network loop's next attempt sends the will anyway.
+        """
+        try:
+            if config.MQTT_URL != "loopback" and not self.is_connected():
+                self._start_loop()
+                return
+            self.client.reconnect()
+        except Exception as e:
+            logger.error(f"MQTT reconnect failed: {e}")
+
+    def _start_loop(self):
+        if not self._loop_started:
+            # Only records the broker; the loop's thread connects and keeps retrying with backoff until it is reached.
+            self.client.connect_async(config.MQTT_URL, int(config.MQTT_PORT), config.MQTT_KEEPALIVE)
+            # Start a background network loop to process network traffic
+            self.client.loop_start()
+            self._loop_started = True
 
     def publish(self, topic, payload, qos=0, retain=False):
         """Publish a message to the MQTT broker.
@@ -48,13 +172,11 @@ class MQTTUtil:
             qos (int, optional): The Quality of Service level. Defaults to 0.
             retain (bool, optional): Whether the message should be retained by the broker. Defaults to False.
         """
-        # Convert payload to JSON string before publishing.
-        message = json.dumps(payload)
+        # Convert payload to JSON bytes before publishing.
+        message = codec.dumps(payload)
         result = self.client.publish(topic, payload=message, qos=qos, retain=retain)
-        if result.rc == mqtt.MQTT_ERR_SUCCESS:
-            print("Message published successfully")
-        else:
-            print(f"Failed to publish message. Error: {result.rc}")
+        if result.rc != mqtt.MQTT_ERR_SUCCESS:
+            logger.error(f"Failed to publish message. Error: {result.rc}")
 
 
 mqtt_utils = MQTTUtil()
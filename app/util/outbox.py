@@ -0,0 +1,193 @@
+import logging
+import mmap
+import os
+import pickle
+import struct
+import threading
+
+from app.core.config import config
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = ".seg"
+CURSOR_FILE = "cursor"
+_LENGTH = struct.Struct("<I")
+
+
+class Outbox:
+    """Append-only log of pickled entries in memory-mapped segment files, read through a persisted cursor.
+
+    Segments are preallocated to segment_size and zero filled, so a zero length marks the end of the written part.
+    Entries are read with read() and only consumed once their position is passed to commit(), which persists the
+    cursor and deletes segments that are fully consumed. Entries survive a restart of the process. When more than
+    max_segments segments exist, the oldest one is deleted and its unread entries are counted in dropped.
+    """
+
+    def __init__(self, directory: str, segment_size: int = config.OUTBOX_SEGMENT_SIZE,
+                 max_segments: int = config.OUTBOX_MAX_SEGMENTS):
+        """
+        :param directory: Directory holding the segment files and the cursor. Created if missing.
+        :param segment_size: Size in bytes of a segment file. Larger entries get a segment of their own.
+        :param max_segments: Maximum number of segment files kept on disk (at least 2).
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max(2, max_segments)
+        self.pending = 0
+        self.appended = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._maps = {}
+        os.makedirs(directory, exist_ok=True)
+        self._segments = sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(directory)
+                                if name.endswith(SEGMENT_SUFFIX))
+        if not self._segments:
+            self._writer = -1
+            self._roll(segment_size)
+            self._cursor = (self._writer, 0)
+            return
+        for index in self._segments:
+            self._map(index)
+        self._writer = self._segments[-1]
+        self._cursor = self._load_cursor()
+        self._write_offset = self._scan(self._writer, 0)[1]
+        segment, offset = self._cursor
+        for index in self._segments[self._segments.index(segment):]:
+            self.pending += self._scan(index, offset)[0]
+            offset = 0
+        if self.pending:
+            logger.info(f"Outbox {directory} holds {self.pending} entries from a previous run")
+
+    def __len__(self):
+        return self.pending
+
+    def append(self, entry):
+        data = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+        size = _LENGTH.size + len(data)
+        with self._lock:
+            if self._write_offset + size > len(self._maps[self._writer][1]):
+                self._roll(max(self.segment_size, size))
+            segment = self._maps[self._writer][1]
+            # The length goes in last, so an entry cut short by a crash is never seen as written.
+            segment[self._write_offset + _LENGTH.size:self._write_offset + size] = data
+            segment[self._write_offset:self._write_offset + _LENGTH.size] = _LENGTH.pack(len(data))
+            self._write_offset += size
+            self.pending += 1
+            self.appended += 1
+
+    def read(self, limit: int):
+        """Return up to limit entries from the cursor on, and the position to commit once they are handled."""
+        entries = []
+        # Entries read per segment, so commit() can tell which of them a dropped segment took along.
+        counts = {}
+        with self._lock:
+            index, offset = self._cursor
+            while len(entries) < limit:
+                segment = self._maps[index][1]
+                length = _LENGTH.unpack_from(segment, offset)[0] if offset + _LENGTH.size <= len(segment) else 0
+                if length == 0:
+                    if index == self._writer:
+                        break
+                    index, offset = self._segments[self._segments.index(index) + 1], 0
+                    continue
+                start = offset + _LENGTH.size
+                entries.append(pickle.loads(segment[start:start + length]))
+                offset = start + length
+                counts[index] = counts.get(index, 0) + 1
+        return entries, (index, offset, tuple(counts.items()))
+
+    def commit(self, position):
+        index, offset, counts = position
+        with self._lock:
+            # Segments dropped to stay within max_segments while these entries were being handled already took
+            # them off pending and counted them as dropped, but they were delivered after all.
+            delivered = sum(count for segment, count in counts if segment < self._segments[0])
+            self.dropped -= delivered
+            if index < self._segments[0]:
+                return
+            self._cursor = (index, offset)
+            self.pending -= sum(count for _, count in counts) - delivered
+            self._save_cursor()
+            while self._segments[0] < index:
+                self._remove(self._segments[0])
+
+    def close(self):
+        with self._lock:
+            for segment, (file, segment_map) in list(self._maps.items()):
+                segment_map.flush()
+                segment_map.close()
+                file.close()
+            self._maps = {}
+
+    def stats(self) -> dict:
+        return {"pending": self.pending, "segments": len(self._segments), "appended": self.appended,
+                "dropped": self.dropped}
+
+    def _path(self, index: int) -> str:
+        return os.path.join(self.directory, f"{index:012d}{SEGMENT_SUFFIX}")
+
+    def _map(self, index: int, size: int = None):
+        path = self._path(index)
+        file = open(path, "r+b" if size is None else "w+b")
+        if size is not None:
+            file.truncate(size)
+        segment_map = mmap.mmap(file.fileno(), 0)
+        self._maps[index] = (file, segment_map)
+        return segment_map
+
+    def _roll(self, size: int):
+        if self._writer in self._maps:
+            self._maps[self._writer][1].flush()
+        self._writer += 1
+        self._segments.append(self._writer)
+        self._map(self._writer, size)
+        self._write_offset = 0
+        while len(self._segments) > self.max_segments:
+            self._drop_oldest()
+
+    def _drop_oldest(self):
+        index = self._segments[0]
+        if self._cursor[0] == index:
+            lost = self._scan(index, self._cursor[1])[0]
+            self.pending -= lost
+            self.dropped += lost
+            self._cursor = (self._segments[1], 0)
+            self._save_cursor()
+            if lost:
+                logger.warning(f"Outbox {self.directory} is full, dropped {lost} unread entries")
+        self._remove(index)
+
+    def _remove(self, index: int):
+        file, segment_map = self._maps.pop(index)
+        segment_map.close()
+        file.close()
+        os.remove(self._path(index))
+        self._segments.remove(index)
+
+    def _scan(self, index: int, offset: int):
+        """Count the entries of a segment from offset on and return the count and the end of the written part."""
+        segment = self._maps[index][1]
+        count = 0
+        while offset + _LENGTH.size <= len(segment):
+            length = _LENGTH.unpack_from(segment, offset)[0]
+            if length == 0:
+                break
+            offset += _LENGTH.size + length
+            count += 1
+        return count, offset
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.directory, CURSOR_FILE)) as f:
+                index, offset = (int(part) for part in f.read().split())
+        except (OSError, ValueError):
+            return self._segments[0], 0
+        if index < self._segments[0]:
+            return self._segments[0], 0
+        return index, offset
+
+    def _save_cursor(self):
+        path = os.path.join(self.directory, CURSOR_FILE)
+        with open(f"{path}.tmp", "w") as f:
+            f.write(f"{self._cursor[0]} {self._cursor[1]}")
+        os.replace(f"{path}.tmp", path)
@@ -15,14 +15,27 @@ class RedisUtil:
                                                            db=config.REDIS_DB)
         return cls._instance
 
+    def ping(self) -> bool:
+        """Round trip to the server, raising if it cannot be reached. The client itself connects on first use."""
+        return self.redis_client.ping()
+
     def store_event(self, key, value):
         """Store event data in Redis."""
         try:
             self.redis_client.set(key, value)
-            logger.info(f"Stored {key} in Redis.")
+            logger.debug(f"Stored {key} in Redis.")
         except Exception as e:
             logger.error(f"Error storing data in Redis: {e}")
 
+    def get_latest(self, guid):
+        """Latest value hash of a GUID written by RedisCheckpointSink."""
+        try:
+            values = self.redis_client.hgetall(f"{config.REDIS_LATEST_PREFIX}{guid}")
+            return {key.decode(): value.decode() for key, value in values.items()}
+        except Exception as e:
+            logger.error(f"Error retrieving data from Redis: {e}")
+            return None
+
     def get_event(self, key):
         """Retrieve event data from Redis."""
         try:
@@ -0,0 +1,164 @@
+"""Minimal Sparkplug B payload codec.
+
+Encodes and decodes the subset of the Sparkplug B protobuf schema (org.eclipse.tahu.protobuf.Payload) used by the
+MQTT sink, writing the protobuf wire format directly so no generated code or protobuf runtime is needed.
+"""
+import struct
+
+# Sparkplug B DataType values
+INT64 = 4
+UINT64 = 8
+DOUBLE = 10
+BOOLEAN = 11
+STRING = 12
+
+# Payload fields
+_PAYLOAD_TIMESTAMP = 1
+_PAYLOAD_METRICS = 2
+_PAYLOAD_SEQ = 3
+
+# Metric fields
+_METRIC_NAME = 1
+_METRIC_ALIAS = 2
+_METRIC_TIMESTAMP = 3
+_METRIC_DATATYPE = 4
+_METRIC_IS_NULL = 7
+_METRIC_LONG_VALUE = 11
+_METRIC_DOUBLE_VALUE = 13
+_METRIC_BOOLEAN_VALUE = 14
+_METRIC_STRING_VALUE = 15
+
+_VARINT = 0
+_FIXED64 = 1
+_LENGTH_DELIMITED = 2
+
+_pack_double = struct.Struct("<d").pack
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _key(field: int, wire_type: int) -> bytes:
+    return _varint((field << 3) | wire_type)
+
+
+def _length_delimited(field: int, data: bytes) -> bytes:
+    return _key(field, _LENGTH_DELIMITED) + _varint(len(data)) + data
+
+
+_ALIAS_KEY = _key(_METRIC_ALIAS, _VARINT)
+_TIMESTAMP_KEY = _key(_METRIC_TIMESTAMP, _VARINT)
+_DOUBLE_KEY = _key(_METRIC_DOUBLE_VALUE, _FIXED64)
+_METRICS_KEY = _key(_PAYLOAD_METRICS, _LENGTH_DELIMITED)
+
+
+def encode_metric(name: str = None, alias: int = None, timestamp: int = None, datatype: int = None,
+                  value=None) -> bytes:
+    """Encode one Metric. Data messages should pass only alias, timestamp and value; births add name and datatype."""
+    out = bytearray()
+    if name is not None:
+        out += _length_delimited(_METRIC_NAME, name.encode("utf-8"))
+    if alias is not None:
+        out += _ALIAS_KEY + _varint(alias)
+    if timestamp is not None:
+        out += _TIMESTAMP_KEY + _varint(timestamp)
+    if datatype is not None:
+        out += _key(_METRIC_DATATYPE, _VARINT) + _varint(datatype)
+    if value is None:
+        out += _key(_METRIC_IS_NULL, _VARINT) + b"\x01"
+    elif isinstance(value, bool):
+        out += _key(_METRIC_BOOLEAN_VALUE, _VARINT) + (b"\x01" if value else b"\x00")
+    elif isinstance(value, int):
+        out += _key(_METRIC_LONG_VALUE, _VARINT) + _varint(value)
+    elif isinstance(value, float):
+        out += _DOUBLE_KEY + _pack_double(value)
+    else:
+        out += _length_delimited(_METRIC_STRING_VALUE, str(value).encode("utf-8"))
+    return bytes(out)
+
+
+def encode_double_metric(alias: int, timestamp: int, value: float) -> bytes:
+    """Fast path for the metrics in DDATA messages."""
+    return _ALIAS_KEY + _varint(alias) + _TIMESTAMP_KEY + _varint(timestamp) + _DOUBLE_KEY + _pack_double(value)
+
+
+def encode_payload(timestamp: int, metrics: list, seq: int = None) -> bytes:
+    """Encode a Payload from already encoded metrics."""
+    out = bytearray(_key(_PAYLOAD_TIMESTAMP, _VARINT) + _varint(timestamp))
+    for metric in metrics:
+        out += _METRICS_KEY + _varint(len(metric)) + metric
+    if seq is not None:
+        out += _key(_PAYLOAD_SEQ, _VARINT) + _varint(seq)
+    return bytes(out)
+
+
+def _read_varint(data: bytes, pos: int):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _fields(data: bytes):
+    pos = 0
+    while pos < len(data):
+        key, pos = _read_varint(data, pos)
+        field, wire_type = key >> 3, key & 7
+        if wire_type == _VARINT:
+            value, pos = _read_varint(data, pos)
+        elif wire_type == _FIXED64:
+            value, pos = data[pos:pos + 8], pos + 8
+        elif wire_type == _LENGTH_DELIMITED:
+            length, pos = _read_varint(data, pos)
+            value, pos = data[pos:pos + length], pos + length
+        elif wire_type == 5:
+            value, pos = data[pos:pos + 4], pos + 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+        yield field, value
+
+
+def decode_metric(data: bytes) -> dict:
+    metric = {}
+    for field, value in _fields(data):
+        if field == _METRIC_NAME:
+            metric["name"] = value.decode("utf-8")
+        elif field == _METRIC_ALIAS:
+            metric["alias"] = value
+        elif field == _METRIC_TIMESTAMP:
+            metric["timestamp"] = value
+        elif field == _METRIC_DATATYPE:
+            metric["datatype"] = value
+        elif field == _METRIC_IS_NULL:
+            metric["value"] = None
+        elif field == _METRIC_LONG_VALUE:
+            metric["value"] = value
+        elif field == _METRIC_DOUBLE_VALUE:
+            metric["value"] = struct.unpack("<d", value)[0]
+        elif field == _METRIC_BOOLEAN_VALUE:
+            metric["value"] = bool(value)
+        elif field == _METRIC_STRING_VALUE:
+            metric["value"] = value.decode("utf-8")
+    return metric
+
+
+def decode_payload(data: bytes) -> dict:
+    payload = {"metrics": []}
+    for field, value in _fields(data):
+        if field == _PAYLOAD_TIMESTAMP:
+            payload["timestamp"] = value
+        elif field == _PAYLOAD_METRICS:
+            payload["metrics"].append(decode_metric(value))
+        elif field == _PAYLOAD_SEQ:
+            payload["seq"] = value
+    return payload
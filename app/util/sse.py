@@ -0,0 +1,37 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class ServerSentEvent:
+    """Mirrors the attributes of sseclient's Event so both engines can share event handling."""
+    event: str = "message"
+    data: str = ""
+    id: str = None
+    retry: int = None
+
+
+async def aiter_sse(response):
+    """Parse an httpx streaming response into ServerSentEvents as lines arrive."""
+    event = ServerSentEvent()
+    data_lines = []
+    async for line in response.aiter_lines():
+        if not line:
+            if data_lines:
+                event.data = "\n".join(data_lines)
+                yield event
+            event = ServerSentEvent()
+            data_lines = []
+            continue
+        if line.startswith(":"):
+            continue
+        field, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+        if field == "data":
+            data_lines.append(value)
+        elif field == "event":
+            event.event = value
+        elif field == "id":
+            event.id = value
+        elif field == "retry" and value.isdigit():
+            event.retry = int(value)
@@ -0,0 +1,77 @@
+"""Per-event decode cost of object.values.update payloads for each available JSON backend.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_codec --items 1 20 --events 20000
+"""
+import argparse
+import json
+import random
+import time
+
+from app.models.EventBatch import EventBatch
+from app.models.EventUpdateObject import EventUpdateObject
+from app.util import codec
+
+
+def make_payload(items: int) -> str:
+    return json.dumps([{
+        "item": {
+            "presentValue": round(random.uniform(50, 90), 2),
+            "id": f"{random.getrandbits(128):032x}",
+            "itemReference": f"gt-metasys:NAE-{n // 100}/Field Bus.VAV-{n}.ZN-T",
+        },
+        "condition": {
+            "presentValue": {
+                "reliability": "reliabilityEnumSet.reliable",
+                "priority": "writePriorityEnumSet.priorityNone",
+            }
+        },
+    } for n in range(items)])
+
+
+def decoders() -> dict:
+    found = {"json columnar": lambda data: EventBatch.from_items(json.loads(data))}
+    try:
+        from dacite import from_dict
+        # The decode path before the codec layer: stdlib json plus dacite, first item only.
+        found["json + dacite, item[0] only"] = lambda data: from_dict(data_class=EventUpdateObject,
+                                                                   data=json.loads(data)[0])
+    except ImportError:
+        pass
+    try:
+        import orjson
+        found["orjson columnar"] = lambda data: EventBatch.from_items(orjson.loads(data))
+    except ImportError:
+        pass
+    if codec.BACKEND == "msgspec":
+        found["msgspec structs"] = codec.decode_update
+    return found
+
+
+def run(decode, payloads) -> float:
+    began = time.perf_counter_ns()
+    for data in payloads:
+        decode(data)
+    return (time.perf_counter_ns() - began) / len(payloads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, nargs="+", default=[1, 20], help="items per update event")
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"codec backend in use: {codec.BACKEND}")
+    for items in args.items:
+        payloads = [make_payload(items) for _ in range(min(args.events, 1000))]
+        payloads = (payloads * (args.events // len(payloads) + 1))[:args.events]
+        print(f"\n{items} item(s) per event, {len(payloads[0])} bytes")
+        for name, decode in decoders().items():
+            best = min(run(decode, payloads) for _ in range(args.repeat))
+            print(f"  {name:<28} {best / 1000:8.2f} us/event  {best / items:8.0f} ns/item")
+
+
+if __name__ == "__main__":
+    main()
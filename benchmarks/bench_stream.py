@@ -0,0 +1,172 @@
+"""End-to-end stream throughput: a fake Metasys server feeding StreamingManager and in-memory sinks.
+
+Runs the real manager, decoding, sink buffering and row/line protocol encoding; only the final writes to MySQL,
+InfluxDB and Redis are replaced by counters. Latency is measured per event from the moment the server writes it
+to the stream until the MySQL sink's batch holding its first row is written. The server holds the events back
+until the manager has subscribed its GUIDs, at the subscribe rate limit, and that time is reported on its own.
+Run from the repository root:
+
+    python -m benchmarks.bench_stream --events 20000 --items 1 20 --rate 0
+    python -m benchmarks.bench_stream --engine async --replay recorded-stream.txt
+"""
+import argparse
+import asyncio
+import logging
+import resource
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.fake_metasys import FakeMetasysServer
+
+
+class MemoryRedis:
+    """The get_event/store_event half of RedisUtil the manager keeps its stream state in."""
+
+    def __init__(self):
+        self.values = {}
+
+    def store_event(self, key, value):
+        self.values[key] = value
+
+    def get_event(self, key):
+        return self.values.get(key)
+
+
+def make_sinks(sent: dict, latencies: list):
+    """MySQL, InfluxDB and Redis sinks that encode and buffer as usual but keep nothing they write."""
+    from app.sinks.influx import InfluxLineProtocolSink
+    from app.sinks.mysql import MySQLEventSink
+    from app.sinks.redis import RedisCheckpointSink
+
+    class MemoryMySQLSink(MySQLEventSink):
+        def write_batch(self, rows) -> int:
+            now = time.perf_counter()
+            for row in rows:
+                # Only an event's first row carries its bare event id, so every event is measured once.
+                began = sent.pop(row["eventId"], None)
+                if began is not None:
+                    latencies.append(now - began)
+            return len(rows)
+
+    class MemoryInfluxSink(InfluxLineProtocolSink):
+        def write_batch(self, rows) -> int:
+            return len(rows)
+
+    class MemoryRedisSink(RedisCheckpointSink):
+        def write_checkpoint(self, latest: dict, event_id) -> int:
+            return len(latest)
+
+    return MemoryMySQLSink(db_session=None), MemoryInfluxSink(), MemoryRedisSink(redis_util=MemoryRedis())
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def build(engine: str, server: FakeMetasysServer, pipeline: bool, latencies: list):
+    from app.core.config import config
+    from app.services.latest_values import LatestValueStore
+    from app.services.token_manager import TokenManager
+
+    config.METASYS_SERVER = server.url
+    config.SUBSCRIBE_URL = f"{server.url}/api/v4/objects/{{}}/attributes/presentValue"
+    mysql_sink, influx_sink, redis_sink = make_sinks(server.sent, latencies)
+    sinks = [mysql_sink, influx_sink, redis_sink]
+    kwargs = dict(token_manager=TokenManager(), db_session=None, redis_util=MemoryRedis(), mqtt_utils=None,
+                  mysql_sink=mysql_sink, influx_sink=influx_sink, redis_sink=redis_sink,
+                  latest_values=LatestValueStore(snapshot_path=""))
+    if engine == "async":
+        import httpx
+        from app.services.async_streaming_manager import AsyncStreamingManager
+        from app.services.stream_runner import AsyncStreamRunner
+        client = httpx.AsyncClient(base_url=server.url, timeout=config.HTTP_TIMEOUT)
+        manager = AsyncStreamingManager(metasys_client=client, **kwargs)
+        runner = AsyncStreamRunner(manager, components=[kwargs["latest_values"]] + sinks)
+        return manager, runner, sinks, client
+    from app.services.pipeline import EventPipeline
+    from app.services.stream_runner import StreamRunner
+    from app.services.streaming_manager import StreamingManager
+    manager = StreamingManager(**kwargs)
+    components = [kwargs["latest_values"]] + sinks
+    if pipeline:
+        manager.attach_pipeline(event_pipeline := EventPipeline(spill_dir=tempfile.mkdtemp()))
+        components.append(event_pipeline)
+    return manager, StreamRunner(manager, components=components), sinks, None
+
+
+async def drive(engine: str, server: FakeMetasysServer, pipeline: bool, timeout: float) -> dict:
+    latencies = []
+    manager, runner, sinks, client = build(engine, server, pipeline, latencies)
+    manager.assign(server.guids)
+    total = server.total_events()
+    began = time.perf_counter()
+    deadline = began + timeout
+    await runner.start_async()
+    # The manager marks the stream subscribed once every GUID was subscribed on it.
+    while time.perf_counter() < deadline and not (manager.stream_id and manager.subscribed_stream_id
+                                                  == manager.stream_id):
+        await asyncio.sleep(0.01)
+    subscribed = time.perf_counter()
+    server.release.set()
+    # Done once every event was sent and the sinks' age threshold had time to write out the last batch.
+    while time.perf_counter() < deadline and not (server.done.is_set() and not server.sent):
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - subscribed
+    await runner.stop_async()
+    if client is not None:
+        await client.aclose()
+    return {"elapsed": elapsed, "events": total - len(server.sent), "total": total, "latencies": latencies,
+            "rows": sinks[0].metrics.rows_written, "subscribed": len(server.subscribed),
+            "subscribe_seconds": subscribed - began}
+
+
+def run(args, items: int):
+    server = FakeMetasysServer(events=args.events, rate=args.rate, items=items, guids=args.guids,
+                               heartbeat_interval=args.heartbeat, replay=args.replay, hold=True).start()
+    try:
+        return asyncio.run(drive(args.engine, server, args.pipeline, args.timeout))
+    finally:
+        server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engine", choices=("sync", "async"), default="sync")
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--items", type=int, nargs="+", default=[1, 20], help="items per update event")
+    parser.add_argument("--rate", type=float, default=0, help="events per second sent, 0 for unthrottled")
+    parser.add_argument("--guids", type=int, default=100, help="GUIDs subscribed before the events are sent")
+    parser.add_argument("--heartbeat", type=float, default=5.0, help="seconds between heartbeats")
+    parser.add_argument("--replay", help="recorded SSE stream to send instead of synthetic events")
+    parser.add_argument("--pipeline", action="store_true", help="hand sink writes to pipeline workers (sync only)")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for all events")
+    parser.add_argument("--tracemalloc", action="store_true", help="also report peak traced Python allocations")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    print(f"{args.engine} engine, {args.events if not args.replay else args.replay} events, "
+          f"rate {args.rate or 'unthrottled'}{', pipeline' if args.pipeline else ''}")
+    for items in ([1] if args.replay else args.items):
+        if args.tracemalloc:
+            tracemalloc.start()
+        result = run(args, items)
+        latencies = result["latencies"]
+        line = (f"  {items:>3} items/event: {result['events']}/{result['total']} events in {result['elapsed']:.2f}s"
+                f" = {result['events'] / result['elapsed']:>9,.0f} events/s"
+                f" {result['rows'] / result['elapsed']:>10,.0f} rows/s,"
+                f" latency p50 {percentile(latencies, 0.5) * 1e3:.1f} ms"
+                f" p99 {percentile(latencies, 0.99) * 1e3:.1f} ms,"
+                f" {result['subscribed']} GUIDs subscribed in {result['subscribe_seconds']:.1f}s,"
+                f" max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+        if args.tracemalloc:
+            line += f", traced peak {tracemalloc.get_traced_memory()[1] / 2 ** 20:.1f} MiB"
+            tracemalloc.stop()
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""Local stand-in for the Metasys REST and stream API, for benchmarks and development.
+
+Serves login, token refresh, the SSE stream, keepalive, the presentValue subscribe endpoint and trend samples (one
+every --trend-interval seconds for any GUID, for exercising the backfill). The first stream
+opened after start() gets the configured events, synthetic or replayed from a recorded stream, at a fixed rate;
+later streams get a hello and heartbeats only. Run it on its own and point BASE_URL at it:
+
+    python -m benchmarks.fake_metasys --port 8081 --events 100000 --rate 2000 --items 20
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode
+
+SUBSCRIBE_PREFIX = "/api/v4/objects/"
+SUBSCRIBE_SUFFIX = "/attributes/presentValue"
+SAMPLES_SUFFIX = "/trendedAttributes/presentValue/samples"
+
+
+def make_guids(count: int) -> list:
+    return [str(uuid.UUID(int=random.getrandbits(128))) for _ in range(count)]
+
+
+def make_update(guids: list, items: int) -> str:
+    """An object.values.update payload with items values for randomly chosen GUIDs."""
+    return json.dumps([{
+        "item": {
+            "presentValue": round(random.uniform(50, 90), 2),
+            "id": guid,
+            "itemReference": f"fake-metasys:NAE-1/Field Bus.VAV-{guid[:8]}.ZN-T",
+        },
+        "condition": {
+            "presentValue": {
+                "reliability": "reliabilityEnumSet.reliable",
+                "priority": "writePriorityEnumSet.priorityNone",
+            }
+        },
+    } for guid in random.choices(guids, k=items)], separators=(",", ":"))
+
+
+def read_recording(path: str) -> list:
+    """Parse a recorded SSE stream (e.g. captured with curl) into (event, id, data) tuples, hellos left out."""
+    events, event, event_id, data = [], "message", None, []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\r\n")
+            if not line:
+                if data and event != "hello":
+                    events.append((event, event_id, "\n".join(data)))
+                event, event_id, data = "message", None, []
+                continue
+            field, _, value = line.partition(":")
+            value = value[1:] if value.startswith(" ") else value
+            if field == "event":
+                event = value
+            elif field == "id":
+                event_id = value
+            elif field == "data":
+                data.append(value)
+    return events
+
+
+def format_event(event: str, data: str, event_id: str = None) -> bytes:
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+
+class FakeMetasysServer:
+    """Threaded HTTP server speaking enough of the Metasys v4 API for StreamingManager.
+
+    sent maps every update's event id to the time.perf_counter() at which it was written to the stream, so a
+    harness in the same process can measure latency up to its sinks.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, events: int = 10000, rate: float = 0.0,
+                 items: int = 1, guids: int = 1000, heartbeat_interval: float = 5.0, replay: str = None,
+                 token_lifetime: float = 3600.0, hold: bool = False, trend_interval: float = 300.0):
+        """
+        :param port: Port to listen on; 0 picks a free one.
+        :param events: Number of synthetic update events to send. Ignored when replaying.
+        :param rate: Events per second; 0 sends as fast as the client reads.
+        :param items: Items per synthetic update event.
+        :param guids: Number of distinct synthetic GUIDs.
+        :param heartbeat_interval: Seconds between heartbeats once the events are sent.
+        :param replay: Recorded SSE stream to send instead of synthetic events.
+        :param token_lifetime: Seconds until an issued token expires.
+        :param hold: Send heartbeats instead of events until release is set, e.g. until the client subscribed.
+        :param trend_interval: Seconds between the trend samples of a GUID.
+        """
+        self.events = events
+        self.rate = rate
+        self.items = items
+        self.guids = make_guids(guids)
+        self.heartbeat_interval = heartbeat_interval
+        self.recording = read_recording(replay) if replay else None
+        self.token_lifetime = token_lifetime
+        self.trend_interval = trend_interval
+        self.sample_requests = 0
+        self.sent = {}
+        self.subscribed = set()
+        self.logins = 0
+        self.refreshes = 0
+        self.keepalives = 0
+        self.streams = 0
+        self.release = threading.Event()
+        self.done = threading.Event()
+        if not hold:
+            self.release.set()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeMetasysServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-metasys", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def total_events(self) -> int:
+        return len(self.recording) if self.recording is not None else self.events
+
+    def token(self) -> dict:
+        expires = datetime.now(timezone.utc) + timedelta(seconds=self.token_lifetime)
+        return {"accessToken": uuid.uuid4().hex, "expires": expires.strftime("%Y-%m-%dT%H:%M:%SZ")}
+
+    def samples(self, guid: str, query: dict) -> dict:
+        """One page of trend samples between startTime and endTime, a sample every trend_interval seconds."""
+        start = datetime.fromisoformat(query["startTime"][0].replace("Z", "+00:00")).timestamp()
+        end = datetime.fromisoformat(query["endTime"][0].replace("Z", "+00:00")).timestamp()
+        page, page_size = int(query.get("page", ["1"])[0]), int(query.get("pageSize", ["100"])[0])
+        first = int(start // self.trend_interval) + 1
+        times = [n * self.trend_interval for n in range(first, int(end // self.trend_interval) + 1)]
+        items = [{
+            "value": {"value": round(70 + 5 * random.Random(f"{guid}{moment}").random(), 2), "units": "degF"},
+            "timestamp": datetime.fromtimestamp(moment, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "isReliable": True,
+        } for moment in times[(page - 1) * page_size:page * page_size]]
+        more = page * page_size < len(times)
+        next_page = f"{SUBSCRIBE_PREFIX}{guid}{SAMPLES_SUFFIX}?" + urlencode(
+            {"startTime": query["startTime"][0], "endTime": query["endTime"][0], "page": page + 1,
+             "pageSize": page_size})
+        return {"total": len(times), "items": items, "next": self.url + next_page if more else None}
+
+    def event_source(self):
+        """Yield the (event, id, data) tuples of the first stream."""
+        if self.recording is not None:
+            yield from self.recording
+            return
+        # Pre-build a pool of payloads so generating JSON does not limit the send rate.
+        payloads = [make_update(self.guids, self.items) for _ in range(min(self.events, 1000))]
+        for i in range(self.events):
+            yield "object.values.update", str(i + 1), payloads[i % len(payloads)]
+
+    def write_stream(self, write):
+        self.streams += 1
+        first = self.streams == 1
+        write(format_event("hello", json.dumps(uuid.uuid4().hex)))
+        beat = 0
+        if first:
+            while not self.release.wait(self.heartbeat_interval):
+                beat += 1
+                write(format_event("object.values.heartbeat", json.dumps(f"heartbeat {beat}"), f"hb-{beat}"))
+            began = time.perf_counter()
+            for count, (event, event_id, data) in enumerate(self.event_source()):
+                if self.rate:
+                    delay = began + count / self.rate - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                self.sent[event_id] = time.perf_counter()
+                write(format_event(event, data, event_id))
+            self.done.set()
+        while True:
+            time.sleep(self.heartbeat_interval)
+            beat += 1
+            write(format_event("object.values.heartbeat", json.dumps(f"heartbeat {beat}"), f"hb-{beat}"))
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; without this each response waits on a delayed ACK.
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if self.path == "/api/v4/login":
+                    server.logins += 1
+                    self.send_json(server.token())
+                elif self.path == "/api/v4/stream":
+                    self.send_stream()
+                else:
+                    self.send_error(404)
+
+            def do_GET(self):
+                path, _, query = self.path.partition("?")
+                if path == "/api/v4/refreshToken":
+                    server.refreshes += 1
+                    self.send_json(server.token())
+                elif path == "/api/v4/stream/keepalive":
+                    server.keepalives += 1
+                    self.send_json({"status": "ok"})
+                elif path.startswith(SUBSCRIBE_PREFIX) and path.endswith(SUBSCRIBE_SUFFIX):
+                    server.subscribed.add(path[len(SUBSCRIBE_PREFIX):-len(SUBSCRIBE_SUFFIX)])
+                    self.send_response(202)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                elif path.startswith(SUBSCRIBE_PREFIX) and path.endswith(SAMPLES_SUFFIX):
+                    server.sample_requests += 1
+                    self.send_json(server.samples(path[len(SUBSCRIBE_PREFIX):-len(SAMPLES_SUFFIX)], parse_qs(query)))
+                else:
+                    self.send_error(404)
+
+            def send_json(self, body: dict):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def send_stream(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                def write(chunk: bytes):
+                    self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                    self.wfile.flush()
+
+                try:
+                    server.write_stream(write)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                self.close_connection = True
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--rate", type=float, default=1000, help="events per second, 0 for unthrottled")
+    parser.add_argument("--items", type=int, default=1, help="items per update event")
+    parser.add_argument("--guids", type=int, default=1000)
+    parser.add_argument("--heartbeat", type=float, default=5.0, help="seconds between heartbeats")
+    parser.add_argument("--replay", help="recorded SSE stream to send instead of synthetic events")
+    parser.add_argument("--trend-interval", type=float, default=300, help="seconds between trend samples")
+    args = parser.parse_args()
+
+    server = FakeMetasysServer(args.host, args.port, args.events, args.rate, args.items, args.guids,
+                               args.heartbeat, args.replay, trend_interval=args.trend_interval).start()
+    print(f"Fake Metasys server on {server.url}; Ctrl+C to stop")
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
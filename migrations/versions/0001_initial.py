@@ -0,0 +1,42 @@
+"""Initial schema, as created by Base.metadata.create_all before migrations.
+
+Databases created that way are brought under migrations with `alembic stamp 0001`.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "events",
+        sa.Column("id", mysql.INTEGER(), primary_key=True, autoincrement=True),
+        sa.Column("eventId", sa.String(255), unique=True),
+        sa.Column("guid", sa.String(255)),
+        sa.Column("presentValue", mysql.FLOAT()),
+        sa.Column("event_metadata", sa.String(255)),
+        sa.Column("stream_id", sa.String(255)),
+        sa.Column("timestamp", sa.TIMESTAMP()),
+    )
+    op.create_index("ix_events_id", "events", ["id"])
+    op.create_table(
+        "subscriptions",
+        sa.Column("id", mysql.INTEGER(), primary_key=True, autoincrement=True),
+        sa.Column("guid", sa.String(255)),
+        sa.Column("active", sa.BOOLEAN()),
+    )
+    op.create_index("ix_subscriptions_id", "subscriptions", ["id"])
+
+
+def downgrade():
+    op.drop_table("subscriptions")
+    op.drop_table("events")
@@ -0,0 +1,66 @@
+"""Index events by (guid, timestamp), store reliability and priority as columns, optionally partition by day.
+
+With EVENTS_PARTITIONING=true on MySQL, events is range partitioned on the day of timestamp. MySQL requires the
+partitioning column in every unique key, so the primary key becomes (id, timestamp) and eventId is unique
+together with timestamp. That no longer catches an event delivered again, so duplicates are caught on the event_ids
+table of migration 0004 instead.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from datetime import date, timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.core.config import config
+from app.db.partitions import partition_clause
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    with op.batch_alter_table("events") as batch:
+        batch.add_column(sa.Column("reliability", sa.String(64)))
+        batch.add_column(sa.Column("priority", sa.String(64)))
+    if bind.dialect.name == "mysql":
+        # event_metadata holds "Condition(presentValue=PresentValue(reliability='...', priority='...'))".
+        for column in ("reliability", "priority"):
+            op.execute(f"UPDATE events SET {column} = "
+                       f"SUBSTRING_INDEX(SUBSTRING_INDEX(event_metadata, '{column}=''', -1), '''', 1) "
+                       f"WHERE LOCATE('{column}=''', event_metadata) > 0")
+    with op.batch_alter_table("events") as batch:
+        batch.drop_column("event_metadata")
+        batch.create_index("ix_events_guid_timestamp", ["guid", "timestamp"])
+
+    if bind.dialect.name == "mysql" and config.EVENTS_PARTITIONING:
+        op.execute("UPDATE events SET timestamp = CURRENT_TIMESTAMP WHERE timestamp IS NULL")
+        op.execute("ALTER TABLE events MODIFY timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, "
+                   "DROP PRIMARY KEY, ADD PRIMARY KEY (id, timestamp), "
+                   "DROP INDEX eventId, ADD UNIQUE KEY uq_events_event_id_timestamp (eventId, timestamp)")
+        # The first partition also holds every existing row, the others are days ahead of today.
+        days = [date.today() + timedelta(days=offset) for offset in range(config.EVENTS_PARTITIONS_AHEAD + 1)]
+        op.execute(f"ALTER TABLE events PARTITION BY RANGE (UNIX_TIMESTAMP(timestamp)) ({partition_clause(days)})")
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == "mysql" and config.EVENTS_PARTITIONING:
+        op.execute("ALTER TABLE events REMOVE PARTITIONING")
+        op.execute("ALTER TABLE events DROP PRIMARY KEY, ADD PRIMARY KEY (id), "
+                   "DROP INDEX uq_events_event_id_timestamp, ADD UNIQUE KEY eventId (eventId), "
+                   "MODIFY timestamp TIMESTAMP NULL")
+    with op.batch_alter_table("events") as batch:
+        batch.drop_index("ix_events_guid_timestamp")
+        batch.add_column(sa.Column("event_metadata", sa.String(255)))
+    if bind.dialect.name == "mysql":
+        op.execute("UPDATE events SET event_metadata = CONCAT('Condition(presentValue=PresentValue(reliability=', "
+                   "IFNULL(QUOTE(reliability), 'None'), ', priority=', IFNULL(QUOTE(priority), 'None'), '))')")
+    with op.batch_alter_table("events") as batch:
+        batch.drop_column("reliability")
+        batch.drop_column("priority")
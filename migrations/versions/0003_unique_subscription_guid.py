@@ -0,0 +1,33 @@
+"""Keep one subscriptions row per GUID, enforced by a unique constraint, and store the GUID's itemReference.
+
+Duplicate rows left by repeated subscribe calls are merged into the oldest one, which stays active if any of them
+was. Unsubscribing now marks the row inactive instead of leaving it behind, and subscribing again reactivates it.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The derived tables keep MySQL from rejecting a subquery on the table being changed.
+    op.execute("UPDATE subscriptions SET active = 1 WHERE id IN (SELECT keep FROM ("
+               "SELECT MIN(id) AS keep FROM subscriptions GROUP BY guid HAVING MAX(active) = 1) AS kept)")
+    op.execute("DELETE FROM subscriptions WHERE id NOT IN (SELECT keep FROM ("
+               "SELECT MIN(id) AS keep FROM subscriptions GROUP BY guid) AS kept)")
+    with op.batch_alter_table("subscriptions") as batch:
+        batch.add_column(sa.Column("item_reference", sa.String(255)))
+        batch.create_unique_constraint("uq_subscriptions_guid", ["guid"])
+
+
+def downgrade():
+    with op.batch_alter_table("subscriptions") as batch:
+        batch.drop_constraint("uq_subscriptions_guid", type_="unique")
+        batch.drop_column("item_reference")
@@ -0,0 +1,36 @@
+"""Keep the eventId of every stored event in event_ids, a table that is never partitioned.
+
+With EVENTS_PARTITIONING=true, migration 0002 could only keep eventId unique together with timestamp, the receive
+time, so an event delivered again after a resume was stored twice. The MySQL sink now deduplicates on event_ids
+when events is partitioned, and the eventIds already stored are copied into it here.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.core.config import config
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "event_ids",
+        sa.Column("eventId", sa.String(255), primary_key=True),
+        sa.Column("timestamp", sa.TIMESTAMP()),
+    )
+    op.create_index("ix_event_ids_timestamp", "event_ids", ["timestamp"])
+    if op.get_bind().dialect.name == "mysql" and config.EVENTS_PARTITIONING:
+        op.execute("INSERT IGNORE INTO event_ids (eventId, timestamp) "
+                   "SELECT eventId, MIN(timestamp) FROM events WHERE eventId IS NOT NULL GROUP BY eventId")
+
+
+def downgrade():
+    op.drop_index("ix_event_ids_timestamp", table_name="event_ids")
+    op.drop_table("event_ids")
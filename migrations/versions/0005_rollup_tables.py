@@ -0,0 +1,37 @@
+"""Add the 1-minute, 15-minute and 1-hour rollup tables written by RollupEngine.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+ROLLUP_TABLES = ("events_rollup_1m", "events_rollup_15m", "events_rollup_1h")
+
+
+def upgrade():
+    for table in ROLLUP_TABLES:
+        op.create_table(
+            table,
+            sa.Column("guid", sa.String(255), primary_key=True),
+            sa.Column("bucket", sa.TIMESTAMP(), primary_key=True),
+            sa.Column("count", mysql.INTEGER()),
+            sa.Column("min_value", mysql.DOUBLE()),
+            sa.Column("max_value", mysql.DOUBLE()),
+            sa.Column("sum_value", mysql.DOUBLE()),
+            sa.Column("avg_value", mysql.DOUBLE()),
+            sa.Column("last_value", mysql.DOUBLE()),
+            sa.Column("last_timestamp", sa.TIMESTAMP()),
+        )
+
+
+def downgrade():
+    for table in ROLLUP_TABLES:
+        op.drop_table(table)
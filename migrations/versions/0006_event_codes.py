@@ -0,0 +1,52 @@
+"""Store reliability and priority of events as small integer codes of the names kept once in event_codes.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+CODE = mysql.SMALLINT(unsigned=True)
+COLUMNS = ("reliability", "priority")
+
+
+def upgrade():
+    op.create_table(
+        "event_codes",
+        sa.Column("id", CODE.with_variant(mysql.INTEGER(), "sqlite"), primary_key=True, autoincrement=True),
+        sa.Column("name", sa.String(255), nullable=False, unique=True),
+    )
+    op.execute("INSERT INTO event_codes (name) "
+               "SELECT reliability FROM events WHERE reliability IS NOT NULL "
+               "UNION SELECT priority FROM events WHERE priority IS NOT NULL")
+    with op.batch_alter_table("events") as batch:
+        for column in COLUMNS:
+            batch.add_column(sa.Column(f"{column}_code", CODE))
+    op.execute("UPDATE events SET "
+               + ", ".join(f"{column}_code = (SELECT id FROM event_codes WHERE name = events.{column})"
+                           for column in COLUMNS))
+    with op.batch_alter_table("events") as batch:
+        for column in COLUMNS:
+            batch.drop_column(column)
+            batch.alter_column(f"{column}_code", new_column_name=column, existing_type=CODE)
+
+
+def downgrade():
+    with op.batch_alter_table("events") as batch:
+        for column in COLUMNS:
+            batch.add_column(sa.Column(f"{column}_name", sa.String(64)))
+    op.execute("UPDATE events SET "
+               + ", ".join(f"{column}_name = (SELECT name FROM event_codes WHERE id = events.{column})"
+                           for column in COLUMNS))
+    with op.batch_alter_table("events") as batch:
+        for column in COLUMNS:
+            batch.drop_column(column)
+            batch.alter_column(f"{column}_name", new_column_name=column, existing_type=sa.String(64))
+    op.drop_table("event_codes")
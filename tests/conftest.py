@@ -0,0 +1,38 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base
+
+
+class SQLiteSession:
+    """Stand-in for DBSession backed by a throwaway SQLite database."""
+
+    def __init__(self, url: str):
+        self.engine = create_engine(url)
+        Base.metadata.create_all(self.engine)
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self.fail = False
+
+    @contextmanager
+    def session_context(self):
+        if self.fail:
+            raise ConnectionError("database is down")
+        db = self.SessionLocal()
+        try:
+            yield db
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+@pytest.fixture
+def db_session(tmp_path):
+    session = SQLiteSession(f"sqlite:///{tmp_path / 'metasys.db'}")
+    yield session
+    session.engine.dispose()
@@ -0,0 +1,27 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.services.bulk_subscriber import BulkSubscriber
+
+
+def subscribe(guid: str):
+    if guid == "broken":
+        raise ValueError("bad response")
+    return SimpleNamespace(status_code=404 if guid == "missing" else 202, headers={})
+
+
+def test_every_guid_is_reported():
+    report = BulkSubscriber(subscribe, concurrency=2, rate=1000, burst=10).run(["a", "broken", "missing", "b"])
+    assert sorted(report.succeeded) == ["a", "b"]
+    assert report.failed == {"broken": "error: bad response", "missing": "404"}
+    assert report.done == report.total
+
+
+def test_every_guid_is_reported_async():
+    async def subscribe_async(guid: str):
+        return subscribe(guid)
+
+    subscriber = BulkSubscriber(subscribe_async, concurrency=2, rate=1000, burst=10)
+    report = asyncio.run(subscriber.run_async(["a", "broken", "missing", "b"]))
+    assert sorted(report.succeeded) == ["a", "b"]
+    assert report.failed == {"broken": "error: bad response", "missing": "404"}
@@ -0,0 +1,73 @@
+import json
+
+from app.core.config import config
+from app.models.EventBatch import EventBatch
+from app.services.deadband import DeadbandFilter, DeadbandRule
+
+
+def batch(*items) -> EventBatch:
+    result = EventBatch()
+    for guid, value, *rest in items:
+        reliability = rest[0] if rest else "reliable"
+        result.append(guid, value, reliability, None, f"site:{guid}")
+    return result
+
+
+def test_first_update_is_forwarded_and_small_moves_suppressed():
+    deadband = DeadbandFilter(default=DeadbandRule(absolute=0.5))
+    assert len(deadband.apply(batch(("a", 20.0)), now=0)) == 1
+    assert len(deadband.apply(batch(("a", 20.4)), now=1)) == 0
+    # Measured against the last forwarded value, so slow drift is still caught.
+    assert deadband.apply(batch(("a", 20.6)), now=2).values.tolist() == [20.6]
+    assert deadband.stats()["suppressed"] == 1
+
+
+def test_percent_deadband_uses_the_last_forwarded_value():
+    deadband = DeadbandFilter(default=DeadbandRule(percent=10))
+    deadband.apply(batch(("a", 100.0)), now=0)
+    assert len(deadband.apply(batch(("a", 109.0)), now=1)) == 0
+    assert len(deadband.apply(batch(("a", 111.0)), now=2)) == 1
+
+
+def test_reliability_change_is_always_forwarded():
+    deadband = DeadbandFilter(default=DeadbandRule(absolute=100))
+    deadband.apply(batch(("a", 1.0)), now=0)
+    assert len(deadband.apply(batch(("a", 1.0, "unreliable")), now=1)) == 1
+
+
+def test_min_interval_and_max_silence():
+    deadband = DeadbandFilter(default=DeadbandRule(absolute=100, min_interval=5, max_silence=60))
+    deadband.apply(batch(("a", 1.0)), now=0)
+    assert len(deadband.apply(batch(("a", 1.0, "unreliable")), now=1)) == 0
+    assert len(deadband.apply(batch(("a", 1.0)), now=30)) == 0
+    assert len(deadband.apply(batch(("a", 1.0)), now=60)) == 1
+    assert deadband.forced == 1
+
+
+def test_first_matching_rule_wins_by_guid_or_item_reference():
+    rules = [DeadbandRule(pattern="site:temp*", absolute=1), DeadbandRule(pattern="valve-*", absolute=10)]
+    deadband = DeadbandFilter(rules, DeadbandRule())
+    assert deadband.match("temp-1", "site:temp-1") == 0
+    assert deadband.match("valve-1", "site:valve-1") == 1
+    assert deadband.match("other", "site:other") == 2
+
+    deadband.apply(batch(("temp-1", 0.0), ("valve-1", 0.0), ("other", 0.0)), now=0)
+    kept = deadband.apply(batch(("temp-1", 5.0), ("valve-1", 5.0), ("other", 5.0)), now=1)
+    assert kept.guids == ["temp-1", "other"]
+
+
+def test_positions_point_into_the_original_batch():
+    deadband = DeadbandFilter(default=DeadbandRule(absolute=1))
+    deadband.apply(batch(("a", 0.0), ("b", 0.0), ("c", 0.0)), now=0)
+    kept = deadband.apply(batch(("a", 0.5), ("b", 5.0), ("c", 5.0)), now=1)
+    assert kept.positions.tolist() == [1, 2]
+    assert deadband.apply(kept, now=2).positions.tolist() == []
+
+
+def test_rules_are_loaded_from_the_configured_file(tmp_path, monkeypatch):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps([{"pattern": "AHU*", "absolute": 0.2}]))
+    monkeypatch.setattr(config, "DEADBAND_RULES", str(path))
+    deadband = DeadbandFilter.from_config()
+    assert deadband.rules[0] == DeadbandRule(pattern="AHU*", absolute=0.2)
+    assert len(deadband.rules) == 2
@@ -0,0 +1,146 @@
+import asyncio
+from collections import deque
+from datetime import datetime
+
+import pytest
+
+from app.models.EventBatch import EventBatch
+from app.models.EventUpdateObject import StreamRecord
+from app.services.fanout import ClientLimitReached, FanoutHub
+from app.util import codec
+
+
+class LatestValues:
+    def __init__(self, values: dict):
+        self.values = values
+
+    def get_all(self) -> list:
+        return list(self.values.values())
+
+    def get_many(self, guids) -> dict:
+        return {guid: self.values[guid] for guid in guids if guid in self.values}
+
+
+def record(event_id: str, *guids) -> StreamRecord:
+    batch = EventBatch()
+    for i, guid in enumerate(guids):
+        batch.append(guid, float(i), "reliable", None, f"site:{guid}")
+    return StreamRecord(event_id=event_id, event_type="object.values.update", stream_id="stream",
+                        received_at=datetime(2024, 1, 1), batch=batch)
+
+
+def event_ids(messages: list) -> list:
+    return [codec.loads(message)["eventId"] for message in messages]
+
+
+def test_clients_receive_only_their_guids():
+    async def scenario():
+        hub = FanoutHub(LatestValues({}), capacity=10, policy="drop_oldest")
+        filtered = hub.connect(["a"])
+        everything = hub.connect()
+        hub.publish(record("1", "a", "b"))
+        hub.publish(record("2", "b"))
+        return await filtered.next_messages(0), await everything.next_messages(0)
+
+    filtered, everything = asyncio.run(scenario())
+    assert len(filtered) == 1
+    assert [value["guid"] for value in codec.loads(filtered[0])["values"]] == ["a"]
+    assert event_ids(everything) == ["1", "2"]
+
+
+def test_waiting_client_is_woken_from_another_thread():
+    async def scenario():
+        hub = FanoutHub(LatestValues({}))
+        client = hub.connect(["a"])
+        waiter = asyncio.create_task(client.next_messages(5))
+        await asyncio.sleep(0)
+        await asyncio.to_thread(hub.publish, record("1", "a"))
+        return await asyncio.wait_for(waiter, 1)
+
+    assert event_ids(asyncio.run(scenario())) == ["1"]
+
+
+@pytest.mark.parametrize("policy, expected", [("drop_oldest", ["2", "3"]), ("drop_newest", ["1", "2"])])
+def test_slow_client_drop_policies(policy, expected):
+    async def scenario():
+        hub = FanoutHub(LatestValues({}), capacity=2, policy=policy)
+        client = hub.connect()
+        for event_id in ("1", "2", "3"):
+            hub.publish(record(event_id, "a"))
+        return hub, client, await client.next_messages(0)
+
+    hub, client, messages = asyncio.run(scenario())
+    assert event_ids(messages) == expected
+    assert client.dropped == hub.dropped == 1
+    assert not client.closed
+
+
+def test_drop_oldest_survives_a_drain_after_the_full_check():
+    class DrainedOnCheck(deque):
+        """Emptied right after its length is read, as when the event loop drains it at that moment."""
+
+        def __len__(self):
+            length = super().__len__()
+            self.clear()
+            return length
+
+    async def scenario():
+        hub = FanoutHub(LatestValues({}), capacity=2, policy="drop_oldest")
+        client = hub.connect()
+        hub.publish(record("1", "a"))
+        hub.publish(record("2", "a"))
+        client.buffer = DrainedOnCheck(client.buffer, maxlen=client.buffer.maxlen)
+        hub.publish(record("3", "a"))
+        return [client.buffer.popleft() for _ in range(deque.__len__(client.buffer))]
+
+    assert event_ids(asyncio.run(scenario())) == ["3"]
+
+
+def test_slow_client_is_disconnected():
+    async def scenario():
+        hub = FanoutHub(LatestValues({}), capacity=2)
+        slow = hub.connect(policy="disconnect")
+        other = hub.connect(policy="disconnect", capacity=10)
+        for event_id in ("1", "2", "3", "4"):
+            hub.publish(record(event_id, "a"))
+        return hub, slow, other
+
+    hub, slow, other = asyncio.run(scenario())
+    assert slow.closed
+    assert slow.reason == "fell 2 messages behind"
+    assert len(slow.buffer) == 2
+    assert hub.disconnects == 1
+    assert not other.closed and len(other.buffer) == 4
+
+
+def test_update_and_disconnect_maintain_the_index():
+    async def scenario():
+        hub = FanoutHub(LatestValues({}))
+        client = hub.connect(["a"])
+        assert hub.update(client, add=["a", "b"], remove=[]) == ["b"]
+        hub.update(client, remove=["a"])
+        assert set(hub.index) == {"b"}
+        hub.disconnect(client)
+        return hub, client
+
+    hub, client = asyncio.run(scenario())
+    assert hub.index == {} and len(hub) == 0
+    assert client.closed
+
+
+def test_client_limit_and_unknown_policy():
+    async def scenario():
+        hub = FanoutHub(LatestValues({}), max_clients=1)
+        with pytest.raises(ValueError):
+            hub.connect(policy="ignore")
+        hub.connect()
+        with pytest.raises(ClientLimitReached):
+            hub.connect()
+
+    asyncio.run(scenario())
+
+
+def test_snapshot_of_some_or_all_guids():
+    hub = FanoutHub(LatestValues({"a": {"guid": "a", "value": 1}, "b": {"guid": "b", "value": 2}}))
+    assert codec.loads(hub.snapshot(["b", "c"])) == {"type": "snapshot", "values": [{"guid": "b", "value": 2}]}
+    assert len(codec.loads(hub.snapshot())["values"]) == 2
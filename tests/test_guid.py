@@ -0,0 +1,66 @@
+from array import array
+
+import pytest
+
+from app.models.EventBatch import EventBatch
+from app.models.EventUpdateObject import StreamRecord
+from app.util import codec
+
+ITEMS = [
+    {"item": {"id": "guid-1", "presentValue": 21.5, "itemReference": "site:ahu-1"},
+     "condition": {"presentValue": {"reliability": "reliabilityEnumSet.reliable",
+                                    "priority": "writePriorityEnumSet.8"}}},
+    {"item": {"id": "guid-2", "presentValue": {"units": "degF"}}},
+    {"item": {"id": "guid-3", "presentValue": "on"}},
+    {"item": {"id": "guid-4", "presentValue": True}},
+    {"item": {"id": "guid-5", "presentValue": 3}, "condition": None},
+]
+
+
+def test_update_keeps_numeric_items_and_counts_the_rest():
+    batch = EventBatch.from_items(ITEMS)
+    assert batch.guids == ["guid-1", "guid-5"]
+    assert batch.values.tolist() == [21.5, 3.0]
+    assert batch.reliability == ["reliabilityEnumSet.reliable", None]
+    assert batch.priority == ["writePriorityEnumSet.8", None]
+    assert batch.item_references == ["site:ahu-1", None]
+    assert batch.skipped == 3
+
+
+UPDATE = b"""[
+ {"item": {"id": "guid-1", "presentValue": 21.5, "itemReference": "site:ahu-1"},
+  "condition": {"presentValue": {"reliability": "reliabilityEnumSet.reliable", "priority": "writePriorityEnumSet.8"}}},
+ {"item": {"id": "guid-3", "presentValue": "on"}},
+ {"item": {"id": "guid-5", "presentValue": 3}, "condition": null}
+]"""
+
+
+def test_codec_and_dict_decoding_agree():
+    batch = codec.decode_update(UPDATE)
+    assert batch.guids == ["guid-1", "guid-5"]
+    assert batch.skipped == 1
+    assert batch == EventBatch.from_items(codec.loads(UPDATE))
+
+
+def test_update_without_item_id_is_rejected():
+    with pytest.raises(Exception):
+        codec.decode_update(b'[{"item": {"presentValue": 1}}]')
+
+
+def test_object_value_skips_only_its_item():
+    batch = codec.decode_update(b'[{"item": {"id": "a", "presentValue": {"units": "degF"}}}, '
+                                b'{"item": {"id": "b", "presentValue": 1}}]')
+    assert batch.guids == ["b"]
+    assert batch.skipped == 1
+
+
+def test_item_event_ids_follow_original_positions():
+    batch = EventBatch()
+    batch.append("guid-1", 1.0, None, None, None)
+    batch.append("guid-2", 2.0, None, None, None)
+    record = StreamRecord(event_id="42", event_type="object.values.update", stream_id="stream", received_at=None,
+                          batch=batch)
+    assert [record.item_event_id(i) for i in range(2)] == ["42", "42-1"]
+
+    record.batch.positions = array("I", [1, 3])
+    assert [record.item_event_id(i) for i in range(2)] == ["42-1", "42-3"]
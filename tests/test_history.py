@@ -0,0 +1,128 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.db.models import Event, EventRollup1h
+from app.services.history import HistoryQuery, decode_cursor, encode_cursor, parse_interval
+from app.sinks.rollup import RollupEngine
+
+START = datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def history_db(db_session):
+    with db_session.session_context() as db:
+        for guid in ("a", "b"):
+            for minute in range(5):
+                db.add(Event(eventId=f"{guid}-{minute}", guid=guid, presentValue=minute, stream_id="stream",
+                             timestamp=START + timedelta(minutes=minute)))
+        # Same timestamp as a-1: the id breaks the tie.
+        db.add(Event(eventId="a-1b", guid="a", presentValue=10, stream_id="stream",
+                     timestamp=START + timedelta(minutes=1)))
+    return db_session
+
+
+@pytest.fixture
+def half_hour_zone():
+    """A local zone half an hour off UTC, so local and UTC hours differ."""
+    previous = os.environ.get("TZ")
+    os.environ["TZ"] = "IST-5:30"
+    time.tzset()
+    yield
+    if previous is None:
+        del os.environ["TZ"]
+    else:
+        os.environ["TZ"] = previous
+    time.tzset()
+
+
+def read(query: HistoryQuery) -> list:
+    return [row for page in query.pages() for row in page]
+
+
+@pytest.mark.parametrize("value, seconds", [("90", 90), ("30s", 30), ("15m", 900), ("1h", 3600), (" 2d ", 172800)])
+def test_parse_interval(value, seconds):
+    assert parse_interval(value) == seconds
+
+
+@pytest.mark.parametrize("value", ["0", "1w", "m", "-5", "1.5h"])
+def test_parse_interval_rejects(value):
+    with pytest.raises(ValueError):
+        parse_interval(value)
+
+
+def test_cursor_round_trips():
+    moment = datetime(2024, 1, 1, 12, 30, 15, 250000)
+    assert decode_cursor(encode_cursor("guid", moment, 42)) == ("guid", moment, 42)
+    assert decode_cursor(encode_cursor("guid", moment)) == ("guid", moment, None)
+
+
+def test_invalid_cursor_is_rejected():
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor")
+
+
+def test_raw_events_are_paged_in_guid_time_id_order(history_db):
+    query = HistoryQuery(history_db, ["b", "a"], START, START + timedelta(hours=1), page_size=2)
+    rows = read(query)
+    assert [row["guid"] for row in rows] == ["a"] * 6 + ["b"] * 5
+    assert [row["value"] for row in rows[:3]] == [0, 1, 10]
+    assert query.next_cursor is None
+
+
+def test_limit_sets_a_cursor_that_continues_without_gaps_or_repeats(history_db):
+    end = START + timedelta(hours=1)
+    everything = [row["id"] for row in read(HistoryQuery(history_db, ["a", "b"], START, end))]
+
+    seen, after = [], None
+    while True:
+        query = HistoryQuery(history_db, ["a", "b"], START, end, limit=3, after=after, page_size=2)
+        seen += [row["id"] for row in read(query)]
+        after = query.next_cursor
+        if after is None:
+            break
+    assert seen == everything
+
+
+def test_buckets_from_events(history_db):
+    query = HistoryQuery(history_db, ["a"], START, START + timedelta(hours=1), interval=120,
+                         aggregates=("count", "min", "max", "last"))
+    assert read(query) == [
+        {"guid": "a", "bucket": START, "count": 3, "min": 0, "max": 10, "last": 10},
+        {"guid": "a", "bucket": START + timedelta(minutes=2), "count": 2, "min": 2, "max": 3, "last": 3},
+        {"guid": "a", "bucket": START + timedelta(minutes=4), "count": 1, "min": 4, "max": 4, "last": 4},
+    ]
+
+
+def test_bucket_cursor_continues_after_the_last_bucket(history_db):
+    end = START + timedelta(hours=1)
+    first = HistoryQuery(history_db, ["a", "b"], START, end, interval=120, aggregates=("count",), limit=4)
+    rows = read(first)
+    rest = read(HistoryQuery(history_db, ["a", "b"], START, end, interval=120, aggregates=("count",),
+                             after=first.next_cursor))
+    assert [(row["guid"], row["bucket"]) for row in rows + rest] == \
+        [(guid, START + timedelta(minutes=minute)) for guid in ("a", "b") for minute in (0, 2, 4)]
+
+
+def test_invalid_arguments_are_rejected(db_session):
+    with pytest.raises(ValueError):
+        HistoryQuery(db_session, ["a"], START, aggregates=("median",))
+    with pytest.raises(ValueError):
+        HistoryQuery(db_session, ["a"], START, source="rollup")
+    with pytest.raises(ValueError):
+        HistoryQuery(db_session, ["a"], START, interval=7, source="rollup")
+
+
+def test_rollups_are_stored_in_utc_and_read_in_local_time(half_hour_zone, history_db):
+    rollup = RollupEngine(history_db, batch_size=100)
+    rollup.add_samples("b", [(START + timedelta(minutes=minute), float(minute)) for minute in range(5)])
+    rollup.flush()
+    with history_db.session_context() as db:
+        assert [row.bucket for row in db.query(EventRollup1h).all()] == [datetime(2023, 12, 31, 18)]
+
+    start, end = START - timedelta(hours=1), START + timedelta(hours=1)
+    rows = read(HistoryQuery(history_db, ["b"], start, end, interval=3600, source="rollup"))
+    assert rows == read(HistoryQuery(history_db, ["b"], start, end, interval=3600))
+    assert [(row["bucket"], row["count"]) for row in rows] == [(datetime(2023, 12, 31, 23, 30), 5)]
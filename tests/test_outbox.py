@@ -0,0 +1,106 @@
+import os
+
+from app.util.outbox import SEGMENT_SUFFIX, Outbox
+
+
+def segments(directory) -> list:
+    return sorted(name for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+
+
+def test_read_does_not_consume_until_commit(tmp_path):
+    outbox = Outbox(str(tmp_path), segment_size=4096)
+    for i in range(5):
+        outbox.append([{"eventId": str(i)}])
+
+    entries, position = outbox.read(3)
+    assert entries == [[{"eventId": "0"}], [{"eventId": "1"}], [{"eventId": "2"}]]
+    assert outbox.pending == 5
+    assert outbox.read(3)[0] == entries
+
+    outbox.commit(position)
+    assert outbox.pending == 2
+    assert outbox.read(10)[0] == [[{"eventId": "3"}], [{"eventId": "4"}]]
+
+
+def test_cursor_survives_reopen(tmp_path):
+    outbox = Outbox(str(tmp_path), segment_size=4096)
+    for i in range(4):
+        outbox.append(i)
+    outbox.commit(outbox.read(2)[1])
+    # Read but not committed when the process stopped: these are handed out again.
+    outbox.read(1)
+    outbox.close()
+
+    reopened = Outbox(str(tmp_path), segment_size=4096)
+    assert reopened.pending == 2
+    entries, position = reopened.read(10)
+    assert entries == [2, 3]
+    reopened.commit(position)
+    reopened.append(4)
+    reopened.close()
+
+    assert Outbox(str(tmp_path), segment_size=4096).read(10)[0] == [4]
+
+
+def test_entries_span_segments_and_consumed_segments_are_removed(tmp_path):
+    outbox = Outbox(str(tmp_path), segment_size=64)
+    for i in range(10):
+        outbox.append("x" * 20 + str(i))
+    assert len(segments(tmp_path)) > 1
+
+    entries, position = outbox.read(100)
+    assert entries == ["x" * 20 + str(i) for i in range(10)]
+    outbox.commit(position)
+    assert outbox.pending == 0
+    assert len(segments(tmp_path)) == 1
+
+
+def test_entry_larger_than_a_segment_gets_its_own(tmp_path):
+    outbox = Outbox(str(tmp_path), segment_size=64)
+    outbox.append("small")
+    outbox.append("y" * 500)
+    assert outbox.read(10)[0] == ["small", "y" * 500]
+
+
+def test_oldest_segment_is_dropped_when_full(tmp_path):
+    outbox = Outbox(str(tmp_path), segment_size=64, max_segments=2)
+    for i in range(12):
+        outbox.append("x" * 20 + str(i))
+
+    assert len(segments(tmp_path)) == 2
+    assert outbox.dropped > 0
+    entries, _ = outbox.read(100)
+    assert len(entries) == outbox.pending == 12 - outbox.dropped
+    assert entries[-1] == "x" * 20 + "11"
+
+
+def test_commit_after_a_read_segment_was_dropped(tmp_path):
+    # One entry per segment.
+    outbox = Outbox(str(tmp_path), segment_size=64, max_segments=4)
+    for i in range(3):
+        outbox.append("x" * 20 + str(i))
+    entries, position = outbox.read(3)
+    assert len(entries) == 3
+
+    # The writer rolls past max_segments while the entries are being handled, dropping the first one they came from.
+    for i in range(3, 5):
+        outbox.append("x" * 20 + str(i))
+    assert outbox.dropped == 1
+
+    outbox.commit(position)
+    assert outbox.pending == 2
+    assert outbox.dropped == 0
+    assert outbox.read(10)[0] == ["x" * 20 + "3", "x" * 20 + "4"]
+
+
+def test_commit_after_every_read_segment_was_dropped(tmp_path):
+    outbox = Outbox(str(tmp_path), segment_size=64, max_segments=2)
+    outbox.append("x" * 20 + "0")
+    entries, position = outbox.read(1)
+    for i in range(1, 4):
+        outbox.append("x" * 20 + str(i))
+
+    outbox.commit(position)
+    assert outbox.pending == len(outbox.read(10)[0]) == 2
+    # Entry 1 was lost unread; entry 0 was delivered.
+    assert outbox.dropped == 1
@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pytest
+
+from app.services.pipeline import BLOCK, DROP_OLDEST, SPILL, BoundedQueue, SinkWorkerPool
+
+
+def drain(queue: BoundedQueue) -> list:
+    items = []
+    while True:
+        item = queue.get(timeout=0)
+        if item is None:
+            return items
+        items.append(item)
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        BoundedQueue(2, "drop_newest")
+
+
+def test_get_times_out_on_an_empty_queue():
+    assert BoundedQueue(2).get(timeout=0.01) is None
+
+
+def test_drop_oldest_keeps_the_newest_items():
+    queue = BoundedQueue(3, DROP_OLDEST)
+    for i in range(5):
+        queue.put(i)
+    assert queue.dropped == 2
+    assert drain(queue) == [2, 3, 4]
+
+
+def test_block_waits_for_room():
+    queue = BoundedQueue(1, BLOCK)
+    queue.put(1)
+    putter = threading.Thread(target=queue.put, args=(2,))
+    putter.start()
+    time.sleep(0.05)
+    assert putter.is_alive()
+    assert queue.get(timeout=1) == 1
+    putter.join(1)
+    assert not putter.is_alive()
+    assert queue.get(timeout=1) == 2
+    assert queue.dropped == 0
+
+
+def test_spill_keeps_fifo_order_through_disk(tmp_path):
+    queue = BoundedQueue(2, SPILL, spill_dir=str(tmp_path))
+    for i in range(6):
+        queue.put(i)
+    assert queue.depth() == 2
+    assert queue.spill_depth() == 4
+    assert queue.spilled == 4
+
+    assert queue.get(timeout=0) == 0
+    # Spilled items are ahead of anything put later, even once there is room in memory.
+    queue.put(6)
+    assert drain(queue) == [1, 2, 3, 4, 5, 6]
+    assert queue.spill_depth() == 0
+
+
+def test_worker_pool_drains_the_queue_before_stopping(tmp_path):
+    handled = []
+    pool = SinkWorkerPool("test", handled.append, 1, BoundedQueue(2, SPILL, spill_dir=str(tmp_path)))
+    for i in range(10):
+        pool.submit(i)
+    pool.start()
+    pool.stop()
+    assert handled == list(range(10))
+    assert pool.stats()["processed"] == 10
+
+
+def test_worker_pool_counts_handler_errors():
+    def handler(record):
+        if record == 1:
+            raise ValueError("bad record")
+
+    pool = SinkWorkerPool("test", handler, 1, BoundedQueue(10))
+    pool.start()
+    for i in range(3):
+        pool.submit(i)
+    pool.stop()
+    assert pool.errors == 1
+    assert pool.processed == 3
+
+
+def test_spilled_items_stay_on_disk_until_taken(tmp_path):
+    queue = BoundedQueue(2, SPILL, spill_dir=str(tmp_path))
+    for i in range(5):
+        queue.put(i)
+    assert queue.get(timeout=0) == 0
+    assert queue.get(timeout=0) == 1
+    # 2 and 3 are read back into memory; one of them is taken before the process stops.
+    assert queue.get(timeout=0) == 2
+    assert queue.depth() == 1 and queue.spill_depth() == 1
+    queue.spill.close()
+
+    restarted = BoundedQueue(2, SPILL, spill_dir=str(tmp_path))
+    assert drain(restarted) == [2, 3, 4]
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+from app.db.models import EventRollup1h, EventRollup1m
+from app.models.EventBatch import EventBatch
+from app.models.EventUpdateObject import StreamRecord
+from app.services.backfill import BackfillEngine
+from app.sinks.rollup import RollupEngine
+
+START = datetime(2024, 1, 1, 12)
+
+
+class Sink:
+    def __init__(self):
+        self.rows = []
+        self.samples = []
+
+    def extend(self, rows, received_at: float = None):
+        self.rows.extend(rows)
+
+    def add_samples(self, guid: str, samples: list, stream_id: str):
+        self.samples.extend(samples)
+
+
+def record(received_at: datetime, value: float, guid: str = "a") -> StreamRecord:
+    batch = EventBatch()
+    batch.append(guid, value, "reliable", None, f"site:{guid}")
+    return StreamRecord(event_id=str(value), event_type="object.values.update", stream_id="stream",
+                        received_at=received_at, batch=batch)
+
+
+def stored(db_session, model) -> dict:
+    with db_session.session_context() as db:
+        return {row.bucket: (row.count, row.sum_value, row.last_value) for row in db.query(model).all()}
+
+
+def test_live_events_behind_the_watermark_are_dropped(db_session):
+    rollup = RollupEngine(db_session, batch_size=100, allowed_lateness=60)
+    rollup.add_record(record(START + timedelta(minutes=10), 1.0))
+    rollup.add_record(record(START + timedelta(minutes=9, seconds=30), 2.0))
+    rollup.add_record(record(START, 3.0))
+    rollup.flush()
+    assert rollup.late_dropped == 1
+    assert sorted(count for count, _, _ in stored(db_session, EventRollup1m).values()) == [1, 1]
+
+
+def test_backfilled_samples_are_counted_however_late(db_session):
+    rollup = RollupEngine(db_session, batch_size=100, allowed_lateness=60)
+    rollup.add_record(record(START + timedelta(minutes=30), 1.0))
+    rollup.add_samples("a", [(START + timedelta(minutes=5), 2.0), (START + timedelta(minutes=5, seconds=10), 4.0)])
+    rollup.flush()
+    assert rollup.late_dropped == 0
+    assert stored(db_session, EventRollup1h).popitem()[1] == (3, 7.0, 1.0)
+    minutes = stored(db_session, EventRollup1m)
+    assert (2, 6.0, 4.0) in minutes.values()
+
+
+def test_backfill_writes_samples_to_the_rollups(db_session):
+    rollup = RollupEngine(db_session, batch_size=100)
+    mysql_sink, influx_sink = Sink(), Sink()
+    backfill = BackfillEngine(None, db_session, mysql_sink, influx_sink, rollup=rollup)
+    backfill.write("a", [(START, 1.0, True), (START + timedelta(seconds=30), 2.0, False)])
+    rollup.flush()
+    assert len(mysql_sink.rows) == 2
+    assert list(stored(db_session, EventRollup1m).values()) == [(2, 3.0, 2.0)]
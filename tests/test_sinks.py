@@ -0,0 +1,306 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.db.CRUDHandle import EventCrudHandler
+from app.db.models import Event, EventCode
+from app.sinks.base import BufferedSink, PermanentWriteError
+from app.sinks.mysql import MySQLEventSink
+from app.util.outbox import Outbox
+
+
+class RecordingSink(BufferedSink):
+    name = "recording"
+
+    def __init__(self, batch_size: int = 3, flush_interval: float = 60):
+        super().__init__(batch_size, flush_interval)
+        self.batches = []
+        self.error = None
+
+    def write_batch(self, rows) -> int:
+        if self.error is not None:
+            raise self.error
+        self.batches.append(list(rows))
+        return len(rows)
+
+
+class SlowSink(RecordingSink):
+    """Holds every write until release is set."""
+
+    def __init__(self, batch_size: int = 2):
+        super().__init__(batch_size)
+        self.writing = threading.Event()
+        self.release = threading.Event()
+
+    def write_batch(self, rows) -> int:
+        self.writing.set()
+        self.release.wait(5)
+        return super().write_batch(rows)
+
+
+def wait_for(condition, timeout: float = 2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def event_row(event_id: str, guid: str = "guid-1", value: float = 1.0) -> dict:
+    return {"eventId": event_id, "guid": guid, "presentValue": value, "reliability": None, "priority": None,
+            "stream_id": "stream", "timestamp": None}
+
+
+def test_full_buffer_flushes_on_the_caller():
+    sink = RecordingSink(batch_size=3)
+    sink.extend([1, 2])
+    assert sink.batches == []
+    sink.add(3)
+    assert sink.batches == [[1, 2, 3]]
+    assert sink.pending() == 0
+    assert sink.metrics.rows_written == 3
+
+
+def test_flush_writes_in_batch_size_chunks():
+    sink = RecordingSink(batch_size=10)
+    sink.extend(range(25))
+    assert [len(batch) for batch in sink.batches] == [10, 10, 5]
+    assert sink.metrics.flushes == 3
+
+
+def test_flusher_thread_enforces_the_age_threshold():
+    sink = RecordingSink(batch_size=100, flush_interval=0.05)
+    sink.start()
+    try:
+        sink.add(1)
+        deadline = time.monotonic() + 2
+        while not sink.batches and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert sink.batches == [[1]]
+    finally:
+        sink.stop()
+
+
+def test_background_flush_leaves_the_caller_alone():
+    sink = RecordingSink(batch_size=2, flush_interval=60)
+    sink.flush_in_background = True
+    sink.start()
+    try:
+        sink.extend([1, 2])
+        deadline = time.monotonic() + 2
+        while not sink.batches and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert sink.batches == [[1, 2]]
+    finally:
+        sink.stop()
+
+
+def test_slow_write_does_not_hold_the_caller(tmp_path):
+    sink = SlowSink(batch_size=2)
+    sink.outbox = Outbox(str(tmp_path))
+    sink.overflow_batches = 2
+    sink.start()
+    try:
+        sink.extend([1, 2])
+        assert sink.writing.wait(2)
+        began = time.monotonic()
+        for row in range(3, 9):
+            sink.add(row)
+        assert time.monotonic() - began < 0.5
+        # Four rows behind the busy flusher were moved to the outbox; the rest wait in memory.
+        assert sink.metrics.rows_spilled == 4
+        assert sink.pending() == 2
+        sink.release.set()
+        assert wait_for(lambda: sink.outbox.pending == 0 and sink.pending() == 0)
+    finally:
+        sink.release.set()
+        sink.stop()
+    assert [row for batch in sink.batches for row in batch] == list(range(1, 9))
+
+
+def test_stop_flushes_pending_rows():
+    sink = RecordingSink(batch_size=100)
+    sink.start()
+    sink.extend([1, 2])
+    sink.stop()
+    assert sink.batches == [[1, 2]]
+
+
+def test_failed_write_without_outbox_is_counted_and_dropped():
+    sink = RecordingSink(batch_size=2)
+    sink.error = ConnectionError("down")
+    sink.extend([1, 2])
+    assert sink.metrics.failures == 1
+    assert sink.metrics.rows_failed == 2
+    assert sink.pending() == 0
+
+
+def test_failed_write_goes_to_the_outbox_and_is_replayed_in_order(tmp_path):
+    sink = RecordingSink(batch_size=2)
+    sink.outbox = Outbox(str(tmp_path))
+    sink.error = ConnectionError("down")
+    sink.extend([1, 2])
+    sink.error = None
+    # Later rows queue behind the spilled ones even though the store is back.
+    sink.extend([3, 4])
+    assert sink.batches == []
+    assert sink.outbox.pending == 2
+    assert sink.metrics.rows_spilled == 4
+
+    assert sink.replay()
+    assert sink.batches == [[1, 2, 3, 4]]
+    assert sink.outbox.pending == 0
+    assert sink.metrics.rows_replayed == 4
+
+    sink.extend([5, 6])
+    assert sink.batches[-1] == [5, 6]
+
+
+def test_replay_keeps_the_outbox_while_the_store_is_down(tmp_path):
+    sink = RecordingSink(batch_size=2)
+    sink.outbox = Outbox(str(tmp_path))
+    sink.error = ConnectionError("down")
+    sink.extend([1, 2])
+    assert not sink.replay()
+    assert sink.outbox.pending == 1
+    assert not sink.replay_due()
+
+
+def test_permanent_error_is_not_kept(tmp_path):
+    sink = RecordingSink(batch_size=2)
+    sink.outbox = Outbox(str(tmp_path))
+    sink.error = PermanentWriteError("rejected")
+    sink.extend([1, 2])
+    assert sink.outbox.pending == 0
+    assert sink.metrics.rows_failed == 2
+
+
+def test_replay_drops_only_the_rejected_batches(tmp_path):
+    class PickySink(RecordingSink):
+        def write_batch(self, rows) -> int:
+            if self.error is not None:
+                raise self.error
+            if "bad" in rows:
+                raise PermanentWriteError("rejected")
+            return super().write_batch(rows)
+
+    sink = PickySink(batch_size=2)
+    sink.outbox = Outbox(str(tmp_path))
+    sink.error = ConnectionError("down")
+    sink.extend([1, 2])
+    sink.extend(["bad", 3])
+    sink.extend([4, 5])
+    sink.error = None
+
+    assert sink.replay()
+    assert sink.batches == [[1, 2], [4, 5]]
+    assert sink.metrics.rows_failed == 2
+
+
+def test_mysql_sink_skips_stored_event_ids(db_session):
+    sink = MySQLEventSink(db_session, batch_size=10)
+    sink.extend([event_row("1"), event_row("2")])
+    sink.flush()
+    sink.extend([event_row("2"), event_row("3")])
+    sink.flush()
+
+    with db_session.session_context() as db:
+        assert sorted(event_id for event_id, in db.query(Event.eventId).all()) == ["1", "2", "3"]
+    assert sink.metrics.rows_written == 3
+    assert sink.metrics.rows_ignored == 1
+
+
+@pytest.mark.parametrize("dedupe_ids", [False, True])
+def test_mysql_sink_dedupes_replayed_events(db_session, dedupe_ids):
+    sink = MySQLEventSink(db_session, batch_size=10, dedupe_ids=dedupe_ids)
+    sink.extend([event_row("1"), event_row("1"), event_row("2")])
+    sink.flush()
+    with db_session.session_context() as db:
+        assert db.query(Event).count() == 2
+
+
+def test_mysql_sink_stores_reliability_and_priority_as_codes(db_session):
+    start = datetime(2024, 1, 1)
+    rows = [dict(event_row(str(i)), timestamp=start + timedelta(seconds=i)) for i in range(3)]
+    rows[0]["reliability"] = rows[1]["reliability"] = "reliabilityEnumSet.reliable"
+    rows[1]["priority"] = "writePriorityEnumSet.priorityDefault"
+    sink = MySQLEventSink(db_session, batch_size=10)
+    sink.extend(rows)
+    sink.flush()
+
+    with db_session.session_context() as db:
+        assert db.query(EventCode).count() == 2
+        assert isinstance(db.query(Event.reliability).filter(Event.eventId == "0").scalar(), int)
+        page = EventCrudHandler(db).get_events_page("guid-1", start, start + timedelta(minutes=1))
+    assert [row[3:] for row in page] == [("reliabilityEnumSet.reliable", None),
+                                        ("reliabilityEnumSet.reliable", "writePriorityEnumSet.priorityDefault"),
+                                        (None, None)]
+
+
+def test_checkpoint_advances_only_past_stored_events(db_session):
+    committed = []
+    sink = MySQLEventSink(db_session, batch_size=10, dedupe_ids=False)
+    sink.on_commit = committed.append
+
+    first = sink.track("e1", True)
+    sink.extend([event_row("e1")], sequence=first)
+    sink.track("e2", False)
+    # An event without rows is stored at once, but may not pass e1, which is still buffered.
+    assert committed == []
+
+    sink.flush()
+    assert committed == ["e2"]
+    assert sink.committed_event_id == "e2"
+
+
+def test_checkpoint_waits_for_the_outbox(db_session, tmp_path):
+    committed = []
+    sink = MySQLEventSink(db_session, batch_size=10, dedupe_ids=False)
+    sink.outbox = Outbox(str(tmp_path))
+    sink.on_commit = committed.append
+
+    db_session.fail = True
+    sequence = sink.track("e1", True)
+    sink.extend([event_row("e1")], sequence=sequence)
+    sink.flush()
+    assert committed == []
+    assert sink.outbox.pending == 1
+
+    db_session.fail = False
+    assert sink.replay()
+    assert committed == ["e1"]
+    with db_session.session_context() as db:
+        assert db.query(Event).count() == 1
+
+
+def test_checkpoint_passes_rows_lost_for_good(db_session):
+    committed = []
+    sink = MySQLEventSink(db_session, batch_size=10, dedupe_ids=False)
+    sink.on_commit = committed.append
+
+    db_session.fail = True
+    sequence = sink.track("e1", True)
+    sink.extend([event_row("e1")], sequence=sequence)
+    sink.flush()
+    assert committed == ["e1"]
+    assert sink.metrics.rows_failed == 1
+
+
+def test_checkpoint_waits_for_rows_moved_to_the_outbox(db_session, tmp_path):
+    committed = []
+    sink = MySQLEventSink(db_session, batch_size=10, dedupe_ids=False)
+    sink.outbox = Outbox(str(tmp_path))
+    sink.on_commit = committed.append
+
+    sequence = sink.track("e1", True)
+    sink.extend([event_row("e1")], sequence=sequence)
+    sink._overflow()
+    sink.track("e2", False)
+    sink.flush()
+    assert committed == []
+
+    assert sink.replay()
+    assert committed == ["e2"]
+    with db_session.session_context() as db:
+        assert db.query(Event).count() == 1
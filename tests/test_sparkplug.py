@@ -0,0 +1,81 @@
+import sys
+import threading
+
+import pytest
+
+from app.sinks.mqtt import SparkplugMQTTSink
+from app.util.mqtt_utils import LoopbackMQTTClient
+from app.util.sparkplug import (BOOLEAN, DOUBLE, INT64, STRING, decode_payload, encode_double_metric, encode_metric,
+                                encode_payload)
+
+
+def test_birth_metric_round_trips():
+    metric = encode_metric(name="AHU-1/SAT", alias=7, timestamp=1700000000000, datatype=DOUBLE, value=21.5)
+    payload = decode_payload(encode_payload(1700000000001, [metric], seq=0))
+    assert payload == {"timestamp": 1700000000001, "seq": 0, "metrics": [
+        {"name": "AHU-1/SAT", "alias": 7, "timestamp": 1700000000000, "datatype": DOUBLE, "value": 21.5}]}
+
+
+@pytest.mark.parametrize("value, datatype", [(True, BOOLEAN), (False, BOOLEAN), (42, INT64), (2 ** 40, INT64),
+                                             ("on", STRING), ("ÄÖ", STRING), (None, DOUBLE)])
+def test_value_types_round_trip(value, datatype):
+    metric = encode_metric(alias=1, datatype=datatype, value=value)
+    assert decode_payload(encode_payload(0, [metric]))["metrics"][0]["value"] == value
+
+
+def test_double_fast_path_matches_the_general_encoder():
+    assert encode_double_metric(300, 1700000000000, -3.25) == \
+        encode_metric(alias=300, timestamp=1700000000000, value=-3.25)
+
+
+def test_payload_without_seq_or_metrics():
+    assert decode_payload(encode_payload(5, [])) == {"timestamp": 5, "metrics": []}
+
+
+def test_known_wire_bytes():
+    # Payload{timestamp: 1, metrics: [Metric{alias: 2, long_value: 3}], seq: 4}
+    assert encode_payload(1, [encode_metric(alias=2, value=3)], seq=4) == bytes(
+        [0x08, 0x01, 0x12, 0x04, 0x10, 0x02, 0x58, 0x03, 0x18, 0x04])
+
+
+class LoopbackUtil:
+    def __init__(self):
+        self.client = LoopbackMQTTClient()
+        self.connect_callbacks = []
+        self.disconnect_callbacks = []
+
+    def reconnect(self):
+        pass
+
+
+@pytest.fixture
+def frequent_thread_switches():
+    # Unguarded updates from several threads then interleave often enough to show.
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+def test_concurrent_writes_keep_aliases_and_sequence_numbers_consistent(frequent_thread_switches):
+    util = LoopbackUtil()
+    sink = SparkplugMQTTSink(util, metrics_per_message=5, qos=0)
+    threads = [threading.Thread(target=sink.write_batch,
+                                args=([(f"guid-{writer}-{i}", float(i), 1) for i in range(200)],))
+               for writer in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(sink.aliases.values()) == list(range(800))
+    births = [decode_payload(payload) for topic, payload, _, _ in util.client.messages if "/DBIRTH/" in topic]
+    assert {metric["alias"] for metric in births[-1]["metrics"]} == set(range(800))
+    # Every NBIRTH restarts the sequence; from there it counts up by one per message, wrapping at 256.
+    expected = None
+    for topic, payload, _, _ in util.client.messages:
+        seq = decode_payload(payload)["seq"]
+        if "/NBIRTH/" in topic:
+            expected = 0
+        assert seq == expected
+        expected = (expected + 1) % 256
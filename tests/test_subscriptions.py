@@ -0,0 +1,139 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.db.models import Subscriptions
+from app.models.EventBatch import EventBatch
+from app.services.streaming_manager import StreamingManager
+from app.services.subscription_registry import SubscriptionRegistry
+
+
+def stored(db_session) -> dict:
+    with db_session.session_context() as db:
+        return {row.guid: (row.active, row.item_reference) for row in db.query(Subscriptions).all()}
+
+
+def registry(db_session, **kwargs) -> SubscriptionRegistry:
+    subscriptions = SubscriptionRegistry(db_session, **kwargs)
+    subscriptions.load()
+    return subscriptions
+
+
+def test_add_and_remove_change_memory_only_until_flushed(db_session):
+    subscriptions = registry(db_session)
+    assert subscriptions.add(["a", "b", "a"]) == ["a", "b"]
+    assert subscriptions.add(["a"]) == []
+    assert "a" in subscriptions and len(subscriptions) == 2
+    assert stored(db_session) == {}
+
+    assert subscriptions.flush()
+    assert stored(db_session) == {"a": (True, None), "b": (True, None)}
+
+    assert subscriptions.remove(["b", "c"]) == ["b"]
+    assert subscriptions.flush()
+    assert stored(db_session) == {"a": (True, None), "b": (False, None)}
+
+
+def test_flush_hands_the_batch_to_the_callbacks(db_session):
+    subscriptions = registry(db_session)
+    added, removed = [], []
+    subscriptions.on_added = added.append
+    subscriptions.on_removed = removed.append
+    subscriptions.add(["a", "b"])
+    subscriptions.remove(["b"])
+    subscriptions.flush()
+    # b was removed before it was ever stored, so neither the table nor the stream hear of it.
+    assert added == [["a"]] and removed == []
+    assert "b" not in stored(db_session)
+
+    subscriptions.remove(["a"])
+    subscriptions.add(["a"])
+    subscriptions.flush()
+    assert added == [["a"]] and removed == []
+    assert subscriptions.flushes == 1
+
+
+def test_failed_flush_keeps_the_changes(db_session):
+    subscriptions = registry(db_session)
+    subscriptions.add(["a", "b"])
+    db_session.fail = True
+    assert not subscriptions.flush()
+    assert subscriptions.failures == 1
+    # Undone while the write was failing: dropped rather than written later.
+    subscriptions.remove(["b"])
+
+    db_session.fail = False
+    assert subscriptions.flush()
+    assert stored(db_session) == {"a": (True, None)}
+
+
+def test_restore_from_the_table(db_session):
+    first = registry(db_session)
+    first.add(["a", "b"])
+    first.note_references(EventBatch(guids=["a"], item_references=["site:ahu-1"]))
+    first.flush()
+    first.remove(["b"])
+    first.flush()
+
+    restored = registry(db_session)
+    assert restored.active() == ["a"]
+    assert restored.guid_for("site:ahu-1") == "a"
+    # A row left inactive by an unsubscribe is reactivated.
+    restored.add(["b"])
+    restored.flush()
+    assert stored(db_session)["b"] == (True, None)
+
+
+def test_find_by_guid_or_item_reference_prefix(db_session):
+    subscriptions = registry(db_session)
+    subscriptions.add(["x-1", "x-2", "y-1"])
+    subscriptions.note_references(EventBatch(guids=["x-1", "y-1"], item_references=["site:ahu", "site:vav"]))
+    assert [match["guid"] for match in subscriptions.find("x-")] == ["x-1", "x-2"]
+    assert subscriptions.find("x-", limit=1) == [{"guid": "x-1", "itemReference": "site:ahu"}]
+    assert subscriptions.find(reference="site:v") == [{"guid": "y-1", "itemReference": "site:vav"}]
+    assert subscriptions.find(prefix="x", reference="site:v") == []
+
+
+def test_reconcile_takes_in_changes_made_elsewhere(db_session):
+    subscriptions = registry(db_session)
+    subscriptions.add(["a", "b"])
+    subscriptions.flush()
+    with db_session.session_context() as db:
+        db.add(Subscriptions(guid="c", active=True, item_reference="site:c"))
+        db.query(Subscriptions).filter_by(guid="a").update({"active": False})
+
+    assert subscriptions.reconcile() == (["c"], ["a"])
+    assert sorted(subscriptions.active()) == ["b", "c"]
+    assert subscriptions.guid_for("site:c") == "c"
+    assert subscriptions.drift == 2
+
+
+def test_flusher_thread_debounces_a_burst(db_session):
+    subscriptions = SubscriptionRegistry(db_session, debounce=0.05, max_delay=1)
+    batches = []
+    subscriptions.on_added = batches.append
+    subscriptions.start()
+    try:
+        for guid in ("a", "b", "c"):
+            subscriptions.add([guid])
+        deadline = time.monotonic() + 2
+        while not batches and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert batches == [["a", "b", "c"]]
+    finally:
+        subscriptions.stop()
+
+
+@pytest.mark.parametrize("response", [None, SimpleNamespace(status_code=404)])
+def test_subscribe_without_a_registry_stores_only_what_metasys_took(db_session, response):
+    mysql_sink = SimpleNamespace(on_commit=None)
+    manager = StreamingManager(None, db_session, None, None, mysql_sink, None, SimpleNamespace(set_checkpoint=None),
+                               None)
+    manager.subscribe_to_guid = lambda guid: response
+    assert not manager.subscribe("a")
+    assert stored(db_session) == {}
+
+    manager.subscribe_to_guid = lambda guid: SimpleNamespace(status_code=202)
+    assert manager.subscribe("a")
+    assert stored(db_session) == {"a": (True, None)}